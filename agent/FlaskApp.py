@@ -18,6 +18,8 @@ from lc_pipeline import (
 )
 import shutil
 from hf_test_generator import generate_tests
+import llm_cache
+import rate_limiter
 import logging
 import threading
 import json
@@ -85,6 +87,8 @@ app = Flask(__name__)
 
 file_uploaded = False
 uploaded_cpp_files = []
+# Workspace of the most recent upload; /process patch commands run under it
+last_upload_workspace = None
 
 
 # --- Helper runner used by background worker and UI commands
@@ -116,10 +120,18 @@ def run_dynamic_cpp():
 
 
 def run_patch_cpp():
-    run_pipeline(REPORT_CPP, SNIPPETS_CPP, lang="cpp")
+    # Attribute the pipeline's LLM calls to the last upload, so its
+    # force_regenerate bypass and cache counters apply here too
+    with rate_limiter.workspace(last_upload_workspace):
+        run_pipeline(REPORT_CPP, SNIPPETS_CPP, lang="cpp")
     return "Patch pipeline executed."
 
 
+def run_auto_fix_cpp():
+    with rate_limiter.workspace(last_upload_workspace):
+        return run_iterative_fix_cpp(max_iters=5)
+
+
 def run_auto_fix_py():
     return run_iterative_fix_py(max_iters=5)
 
@@ -302,6 +314,7 @@ def upload_file_route():
     Returns immediately with {status: 'Accepted', workspace: <id>} so the client
     can poll /status for results.
     """
+    global last_upload_workspace
     if 'file' not in request.files:
         return jsonify({"status": "Error", "error": "No file part"})
     file = request.files['file']
@@ -319,9 +332,18 @@ def upload_file_route():
     ws_id = workspace_info['workspace']
     lang = workspace_info['language']
     target = workspace_info['target']
+    # Re-uploads of the same project reuse cached LLM responses unless forced
+    force_regenerate = request.form.get('force_regenerate', '0') in ('1', 'true', 'True', 'on')
+    last_upload_workspace = ws_id
 
     def bg():
         logger.info("[BG] Start processing workspace %s (cpp)", ws_id)
+        cache_before = llm_cache.stats(ws_id)
+        # LLM calls from this upload queue fairly against other workspaces
+        rate_limiter.set_workspace(ws_id)
+        # A forced upload skips cached answers for every LLM call made under
+        # its workspace: test generation here, and later patch/auto_fix runs
+        llm_cache.set_bypass(force_regenerate, workspace=ws_id)
         try:
             # For uploaded C++ Qt projects we attempt to build/run tests where
             # possible. Set CPP_QT_BEHAVIOR='force' for this run so the
@@ -633,7 +655,7 @@ def upload_file_route():
             # Generate HF-powered suggested test cases (if HF configured)
             try:
                 write_status(ws_path, status='Processing', progress=35, message='Generating test cases')
-                gen_tests = generate_tests(str(ws_path), str(target))
+                gen_tests = generate_tests(str(ws_path), str(target), use_cache=not force_regenerate)
                 # attach to result later by writing file now; generate_tests writes generated_tests.json
                 write_status(ws_path, status='Processing', progress=40, message='Test cases generated')
             except Exception as _e:
@@ -756,6 +778,8 @@ def upload_file_route():
                 "suggested_patches": [],
                 "archived_agent_patches": archived_list,
                 "unit_tests": unit_test_summary,
+                # LLM response cache hit/miss counters of this workspace's run only
+                "llm_cache": llm_cache.stats_since(cache_before, ws_id),
             }
             # Attach generated HF tests if present
             try:
@@ -1276,7 +1300,7 @@ def interpret_command(user_input: str):
         elif "patch" in user_input_lower and "cpp" in user_input_lower:
             return run_patch_cpp()
         elif "auto_fix" in user_input_lower and "cpp" in user_input_lower:
-            return run_iterative_fix_cpp(max_iters=5)
+            return run_auto_fix_cpp()
         elif "compare" in user_input_lower and "patch" in user_input_lower:
             return compare_patch()
         else:
@@ -1312,7 +1336,7 @@ def process_command():
     # If it's an auto-fix command
     if "auto_fix cpp" in user_input.lower():
         # Run the auto-fix process and show progress
-        auto_fix_result = run_iterative_fix_cpp(max_iters=5)
+        auto_fix_result = run_auto_fix_cpp()
         return jsonify({"status": "Success", "result": auto_fix_result})
 
     return jsonify({"status": "Success", "result": result})
@@ -0,0 +1,277 @@
+"""Typed unified-diff model built in one pass over an LLM response.
+
+Each response used to go through clean_patch_output, validate_patch,
+sanitize_patch, a header-repair block and aggressive_sanitize, every stage
+re-splitting and re-regexing the whole text, and validate_patch only accepted
+`@@ -a,b +c,d @@` hunks. `parse()` now reads the text once into
+Patch / FileDiff / Hunk objects, skipping markdown fences, prose and
+<<<PATCH>>> markers, and accepting hunk headers without counts (`@@ -5 +5 @@`).
+Repairs (a/ b/ prefixes, missing headers, wrong hunk counts, no-op hunks) are
+passes over that model (see REPAIRS); `render()` always writes explicit
+counts. `extract()` is the parse -> repair -> validate -> render shortcut.
+"""
+import re
+
+HUNK_RE = re.compile(r"^@@+\s*-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s*@@+ ?(.*)$")
+# "@@" / "@@ @@": a hunk the model did not place
+BARE_HUNK_RE = re.compile(r"^@@+(?:\s*@@+)?\s*$")
+GIT_HEADER_RE = re.compile(r"^diff --git\s+(\S+)\s+(\S+)")
+EXTENDED_HEADERS = ("index ", "new file mode", "deleted file mode", "old mode", "new mode",
+                    "similarity index", "rename from", "rename to", "copy from", "copy to")
+STOP_PREFIXES = ("Explanation:", "Note:")
+DEV_NULL = "/dev/null"
+
+
+def _strip_path(raw: str, prefix: str):
+    path = raw.split("\t", 1)[0].strip().strip('"').replace("\\", "/")
+    if not path:
+        return None
+    if path == DEV_NULL:
+        return path
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+    return path or None
+
+
+class Hunk:
+    """One @@ block; lines keep their ' ', '-', '+' or '\\' prefix."""
+
+    def __init__(self, old_start=None, old_len=None, new_start=None, new_len=None, section=""):
+        self.old_start, self.old_len = old_start, old_len
+        self.new_start, self.new_len = new_start, new_len
+        self.section = section
+        self.lines = []
+        # body counts, set by _recount() once the body is read so repairs and validation never rescan
+        self._old = self._new = self._changed = 0
+
+    def _recount(self):
+        """Recompute the body counts; call after changing self.lines."""
+        tags = "".join([line[:1] for line in self.lines])
+        context, removed, added = tags.count(" "), tags.count("-"), tags.count("+")
+        self._old, self._new, self._changed = context + removed, context + added, removed + added
+
+    @property
+    def located(self) -> bool:
+        return self.old_start is not None and self.new_start is not None
+
+    def counts(self):
+        """(old, new) line counts of the body."""
+        return self._old, self._new
+
+    def changes(self) -> bool:
+        return self._changed > 0
+
+    def consistent(self) -> bool:
+        return self.located and (self.old_len, self.new_len) == self.counts()
+
+    def header(self) -> str:
+        old_len, new_len = (self.old_len, self.new_len) if self.old_len is not None else self.counts()
+        section = f" {self.section}" if self.section else ""
+        return f"@@ -{self.old_start},{old_len} +{self.new_start},{new_len} @@{section}"
+
+    def render_lines(self) -> list:
+        return [self.header()] + self.lines
+
+
+class FileDiff:
+    """Headers and hunks for one file; paths are kept without the a/ b/ prefix."""
+
+    def __init__(self, old_path=None, new_path=None):
+        self.old_path, self.new_path = old_path, new_path
+        self.git_header = False
+        self.has_old_header = self.has_new_header = False
+        self.headers = []
+        self.hunks = []
+
+    @property
+    def path(self):
+        return self.new_path if self.new_path not in (None, DEV_NULL) else self.old_path
+
+    def header_lines(self) -> list:
+        old = self.old_path if self.old_path == DEV_NULL else f"a/{self.old_path}"
+        new = self.new_path if self.new_path == DEV_NULL else f"b/{self.new_path}"
+        git_old = self.old_path if self.old_path != DEV_NULL else self.new_path
+        git_new = self.new_path if self.new_path != DEV_NULL else self.old_path
+        return [f"diff --git a/{git_old} b/{git_new}"] + self.headers + [f"--- {old}", f"+++ {new}"]
+
+    def render_lines(self) -> list:
+        out = self.header_lines()
+        for hunk in self.hunks:
+            out += hunk.render_lines()
+        return out
+
+
+class Patch:
+    """Files parsed from one response plus what was skipped and repaired."""
+
+    def __init__(self):
+        self.files = []
+        self.skipped = 0      # prose / fence / marker lines that were not part of the diff
+        self.repairs = []     # names of repair passes that changed something
+
+    def hunks(self):
+        return [h for f in self.files for h in f.hunks]
+
+    def is_valid(self) -> bool:
+        """At least one file, all with both paths and located, consistent, non-empty hunks."""
+        if not self.files:
+            return False
+        for f in self.files:
+            if not (f.old_path and f.new_path and f.hunks):
+                return False
+            if not all(h.consistent() and h.changes() for h in f.hunks):
+                return False
+        return True
+
+    def render(self) -> str:
+        lines = [line for f in self.files for line in f.render_lines()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def repair(self, passes=None):
+        """Run repair passes (default REPAIRS) in order; returns self."""
+        for name, fn in (passes if passes is not None else REPAIRS):
+            if fn(self):
+                self.repairs.append(name)
+        return self
+
+
+def _read_body(hunk: Hunk, lines: list, i: int) -> int:
+    """Append the hunk body starting at lines[i]; returns the index of the first line after it."""
+    body, total, blank = hunk.lines, len(lines), 0
+    while i < total:
+        line = lines[i]
+        if not line:
+            # an empty line inside a hunk is a context line whose space was stripped, unless the hunk ends
+            blank += 1
+            i += 1
+            continue
+        tag = line[0]
+        if tag == " " or tag == "+" or tag == "\\" or (tag == "-" and not (
+                line.startswith("--- ") and i + 1 < total and lines[i + 1].startswith("+++ "))):
+            if blank:
+                body.extend([" "] * blank)
+                blank = 0
+            body.append(line)
+            i += 1
+            continue
+        break
+    hunk._recount()
+    return i
+
+
+def parse(text: str) -> Patch:
+    """Single pass over an LLM response into a Patch (nothing is repaired yet)."""
+    patch = Patch()
+    lines = (text or "").replace("\r\n", "\n").split("\n")
+    total = len(lines)
+    current = None
+    i = 0
+
+    def new_file():
+        f = FileDiff()
+        patch.files.append(f)
+        return f
+
+    while i < total:
+        line = lines[i]
+        i += 1
+        if line.startswith("@@"):
+            m = HUNK_RE.match(line)
+            if not m and not BARE_HUNK_RE.match(line):
+                patch.skipped += 1
+                continue
+            if current is None:
+                current = new_file()
+            if m:
+                hunk = Hunk(int(m.group(1)), int(m.group(2)) if m.group(2) is not None else 1,
+                            int(m.group(3)), int(m.group(4)) if m.group(4) is not None else 1, m.group(5).strip())
+            else:
+                hunk = Hunk()
+            current.hunks.append(hunk)
+            i = _read_body(hunk, lines, i)
+        elif line.startswith("diff --git"):
+            current = new_file()
+            current.git_header = True
+            m = GIT_HEADER_RE.match(line)
+            if m:
+                current.old_path, current.new_path = _strip_path(m.group(1), "a/"), _strip_path(m.group(2), "b/")
+        elif line.startswith("--- "):
+            if current is None or current.hunks or current.has_old_header:
+                current = new_file()
+            current.old_path = _strip_path(line[4:], "a/") or current.old_path
+            current.has_old_header = True
+        elif line.startswith("+++ "):
+            if current is None or current.hunks or current.has_new_header:
+                current = new_file()
+            current.new_path = _strip_path(line[4:], "b/") or current.new_path
+            current.has_new_header = True
+        elif current is not None and not current.hunks and line.startswith(EXTENDED_HEADERS):
+            current.headers.append(line)
+        else:
+            stripped = line.strip()
+            if patch.files and stripped.startswith(STOP_PREFIXES):
+                # commentary after the patch ends it (as sanitize_patch did)
+                patch.skipped += total - i + 1
+                break
+            if stripped:
+                patch.skipped += 1  # prose, markdown fences, <<<PATCH>>> markers
+    return patch
+
+
+# === Repair passes: fn(patch) -> True when something changed ===
+
+def fill_paths(patch: Patch) -> bool:
+    """Take missing ---/+++ paths from the diff --git line and vice versa."""
+    changed = False
+    for f in patch.files:
+        if f.old_path is None and f.new_path is not None:
+            f.old_path, changed = f.new_path, True
+        elif f.new_path is None and f.old_path is not None:
+            f.new_path, changed = f.old_path, True
+        if not (f.git_header and f.has_old_header and f.has_new_header):
+            changed = changed or f.old_path is not None
+    return changed
+
+
+def drop_unlocated(patch: Patch) -> bool:
+    """Hunks without line numbers cannot be applied."""
+    changed = False
+    for f in patch.files:
+        kept = [h for h in f.hunks if h.located]
+        changed = changed or len(kept) != len(f.hunks)
+        f.hunks = kept
+    return changed
+
+
+def recount(patch: Patch) -> bool:
+    """Set every hunk's line counts from its body."""
+    changed = False
+    for h in patch.hunks():
+        counts = h.counts()
+        if (h.old_len, h.new_len) != counts:
+            h.old_len, h.new_len = counts
+            changed = True
+    return changed
+
+
+def drop_noops(patch: Patch) -> bool:
+    """Drop hunks that change nothing and files left without hunks or paths."""
+    before = (len(patch.files), len(patch.hunks()))
+    for f in patch.files:
+        f.hunks = [h for h in f.hunks if h.changes()]
+    patch.files = [f for f in patch.files if f.hunks and f.old_path and f.new_path]
+    return before != (len(patch.files), len(patch.hunks()))
+
+
+REPAIRS = [
+    ("fill_paths", fill_paths),
+    ("drop_unlocated", drop_unlocated),
+    ("recount", recount),
+    ("drop_noops", drop_noops),
+]
+
+
+def extract(text: str, passes=None):
+    """Valid, rendered unified diff from an LLM response, or None."""
+    patch = parse(text).repair(passes)
+    return patch.render() if patch.is_valid() else None
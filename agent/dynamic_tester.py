@@ -39,6 +39,7 @@ def parse_args():
     p.add_argument("--qt-includes", type=str, help="Optional Qt include root(s). Semicolon-separated on Windows.")
     p.add_argument("--qt-libs", type=str, help="Optional Qt lib root(s). Semicolon-separated on Windows.")
     p.add_argument("--use-sanitizers", action="store_true", help="Build C/C++ projects with sanitizers (AddressSanitizer/UBSan) when supported.")
+    p.add_argument("--patch-dry-run", action="store_true", help="Check the generated patches against the repo in-process (nothing is applied) and add the per-hunk results to the JSON report.")
     return p.parse_args()
 
 # NOTE: don't insert the puzzle-challenge into sys.path here because PUZZLE_CHALLENGE
@@ -808,13 +809,28 @@ def run_cpp_unit_tests(search_dirs):
         return [{'test': 'cpp_unit_discovery', 'status': 'FAIL', 'detail': str(e)}]
 
 # === PATCH HANDLER ===
-def apply_patches_from_dir(target_repo, patch_dir):
-    """Placeholder:
-    In Experiment 2 we intentionally do NOT apply patches. This function
-    returns an empty list to make the intent explicit. If later needed,
-    re-enable application logic.
+def apply_patches_from_dir(target_repo, patch_dir, dry_run=True):
+    """Check every *.diff in patch_dir against target_repo with patch_apply.
+
+    In Experiment 2 we intentionally do NOT apply patches, so by default this
+    is an in-process dry run: nothing is written and each patch's result
+    (status applied/offset/fuzz/conflict/error plus per-hunk details) is
+    returned. dry_run=False writes the patches that apply, in name order.
     """
-    return []
+    import patch_apply
+    paths = sorted(Path(patch_dir).glob("*.diff")) if patch_dir and Path(patch_dir).exists() else []
+    if dry_run:
+        return patch_apply.dry_run(target_repo, paths)["patches"]
+    snapshot = patch_apply.Snapshot(target_repo)
+    results = []
+    for path in paths:
+        result = patch_apply.apply_patch(snapshot, path.read_text(encoding="utf-8", errors="ignore"))
+        contents = result.pop("contents", {})
+        if result["status"] not in ("conflict", "error"):
+            patch_apply.write_contents(target_repo, contents)
+            snapshot.update(contents)
+        results.append({"patch": path.name, **result})
+    return results
 
 # === C++ TESTER ===
 def run_cpp_tests():
@@ -1478,12 +1494,12 @@ def main():
         # In Experiment 2 we do not apply patches or attempt bug-fixing.
         # Keep patch_results empty and run post-tests only to collect additional
         # environment and runtime checks (but not to infer patches effects).
-        patch_results = []
+        patch_results = apply_patches_from_dir(CPP_REPO, patches_cpp) if args.patch_dry_run else []
         post_tests = run_cpp_tests()
     elif args.py:
         pre_tests = run_py_bug_tests()
         # For Python mode in this experiment we also skip patch application
-        patch_results = []
+        patch_results = apply_patches_from_dir(PY_REPO, patches_py) if args.patch_dry_run else []
         post_tests = run_py_bug_tests()
 
     # Run additional checks once (post-patch)
@@ -1751,6 +1767,8 @@ def main():
         "tests": test_results,
         "pre_tests": pre_tests
     }
+    if patch_results:
+        structured["patch_dry_run"] = patch_results
 
     # --- UI-friendly summary generation ---
     def _make_ui_summary(struct):
@@ -0,0 +1,145 @@
+"""Structured edit operations as an alternative LLM output format.
+
+Most of the patch-stage overhead went into repairing malformed unified diffs
+(clean_patch_output, sanitize_patch, aggressive_sanitize, header-repair
+regexes). With LLM_RESPONSE_FORMAT=edits the model is shown numbered source
+lines and answers with JSON
+
+    {"edits": [{"file": "src/a.cpp", "start_line": 12, "end_line": 13,
+                "replacement": "new text for lines 12-13"}]}
+
+(end_line = start_line - 1 inserts before start_line, an empty replacement
+deletes). `to_diff` applies the edits to the lines the snippet carries and
+renders the unified diff locally, so every accepted answer is a valid diff
+with correct hunk counts. Edits outside the snippet's lines are rejected.
+"""
+import difflib
+import json
+import re
+
+from snippet_dedup import span
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*$", re.MULTILINE)
+
+
+def parse_edits(text: str):
+    """List of edit dicts from an LLM reply, [] for NO_PATCH / no edits, None if unparsable."""
+    text = (text or "").strip()
+    if not text or text.upper().startswith("NO_PATCH"):
+        return []
+    text = _FENCE_RE.sub("", text).strip()
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    try:
+        data, _ = json.JSONDecoder(strict=False).raw_decode(text[start:])
+    except ValueError:
+        return None
+    edits = data.get("edits") if isinstance(data, dict) else data
+    if not isinstance(edits, list):
+        return None
+    out = []
+    for e in edits:
+        if not isinstance(e, dict):
+            return None
+        try:
+            s = int(e.get("start_line", e.get("start")))
+            end = int(e.get("end_line", e.get("end", s)))
+        except (TypeError, ValueError):
+            return None
+        replacement = e.get("replacement", e.get("text", ""))
+        if isinstance(replacement, list):
+            replacement = "\n".join(str(x) for x in replacement)
+        out.append({"file": e.get("file"), "start_line": s, "end_line": end, "replacement": str(replacement or "")})
+    return out
+
+
+def looks_like_edits(text: str) -> bool:
+    """True when the reply parses to at least one edit (used to accept router answers)."""
+    edits = parse_edits(text)
+    return bool(edits)
+
+
+def snippet_lines(snippet: str) -> dict:
+    """{line number: text} for the source lines a (possibly merged) snippet carries."""
+    bounds = span(snippet)
+    if bounds is None:
+        return {}
+    body = snippet.splitlines()[1:][:bounds[1] - bounds[0] + 1]
+    while body and not body[-1].strip():
+        body.pop()
+    return {bounds[0] + n: text for n, text in enumerate(body)}
+
+
+def numbered(snippet: str) -> str:
+    return "\n".join(f"{n:>5} | {t}" for n, t in sorted(snippet_lines(snippet).items()))
+
+
+def _range(start: int, count: int) -> str:
+    # always explicit counts: validate_patch expects "@@ -a,b +c,d @@"
+    return f"{start if count else start - 1},{count}"
+
+
+def render_diff(path: str, first: int, old: list, new: list, context: int = 3) -> str:
+    """Unified diff between two versions of the lines starting at file line `first`."""
+    path = path.replace("\\", "/")
+    out = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for group in matcher.get_grouped_opcodes(context):
+        i1, i2, j1, j2 = group[0][1], group[-1][2], group[0][3], group[-1][4]
+        out.append(f"@@ -{_range(first + i1, i2 - i1)} +{_range(first + j1, j2 - j1)} @@")
+        for tag, a1, a2, b1, b2 in group:
+            if tag == "equal":
+                out += [" " + l for l in old[a1:a2]]
+                continue
+            out += ["-" + l for l in old[a1:a2]]
+            out += ["+" + l for l in new[b1:b2]]
+    return "\n".join(out) + "\n" if len(out) > 3 else ""
+
+
+def apply_edits(lines: dict, edits: list):
+    """New line list for the contiguous `lines`, or None if an edit falls outside / overlaps."""
+    if not lines:
+        return None
+    lo, hi = min(lines), max(lines)
+    old = [lines.get(n, "") for n in range(lo, hi + 1)]
+    new, cursor = [], lo
+    for e in sorted(edits, key=lambda e: (e["start_line"], e["end_line"])):
+        s, end = e["start_line"], e["end_line"]
+        if s < lo or end > hi or end < s - 1 or s < cursor:
+            return None
+        new += old[cursor - lo:s - lo]
+        new += e["replacement"].splitlines()
+        cursor = end + 1
+    new += old[cursor - lo:]
+    return old, new
+
+
+def _same_file(edit_file, path: str) -> bool:
+    if not edit_file:
+        return True
+    base = lambda p: str(p).replace("\\", "/").rsplit("/", 1)[-1].lower()
+    return base(edit_file) == base(path)
+
+
+def diff_from_edits(edits: list, snippet: str, path: str):
+    """Unified diff for edits against the snippet's lines, or None if unusable."""
+    edits = [e for e in edits or [] if _same_file(e["file"], path)]
+    lines = snippet_lines(snippet)
+    applied = apply_edits(lines, edits) if edits else None
+    if applied is None:
+        return None
+    old, new = applied
+    if old == new:
+        return None
+    return render_diff(path, min(lines), old, new) or None
+
+
+def to_diff(reply: str, snippet: str, path: str):
+    """Unified diff for an edit-ops reply against the snippet's lines, or None if unusable."""
+    return diff_from_edits(parse_edits(reply), snippet, path)
+
+
+def edits_for_span(reply: str, lo: int, hi: int) -> list:
+    """Edits of a (batched) reply that fall inside lines lo..hi."""
+    return [e for e in (parse_edits(reply) or []) if e["start_line"] >= lo and e["end_line"] <= hi]
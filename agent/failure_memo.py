@@ -0,0 +1,126 @@
+"""Persistent memo of snippets the LLMs repeatedly fail to patch.
+
+`run_iterative_fix_py` / `run_iterative_fix_cpp` re-sent every unfixed
+snippet each round, so a snippet the models cannot patch burned provider
+time on every iteration and its raw output was only kept as raw_resp_{i}.txt.
+The memo is keyed by the snippet's normalized content (file path + body,
+not line numbers, which shift as other patches land) and prompts.PROMPT_VERSION.
+After a NO_PATCH / invalid answer the snippet is retried with back-off
+(skipping 1, 3, ... rounds after the 2nd, 3rd failure); once it has failed
+FAILURE_MEMO_MAX_FAILURES times it is reported as "deferred" and not sent
+again until the entry expires (FAILURE_MEMO_TTL_DAYS), the snippet text or
+the prompt version changes, or a patch for it succeeds.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from prompts import PROMPT_VERSION
+from report_index import SNIPPET_HEADER_RE
+from snippet_dedup import normalized_hash
+
+MEMO_PATH = Path(os.getenv("FAILURE_MEMO_PATH", str(Path(__file__).resolve().parent / "patches" / "failure_memo.json")))
+ENABLED = os.getenv("FAILURE_MEMO", "1") not in ("0", "false", "False")
+MAX_FAILURES = int(os.getenv("FAILURE_MEMO_MAX_FAILURES", "3"))
+TTL_S = float(os.getenv("FAILURE_MEMO_TTL_DAYS", "7")) * 86400
+RAW_EXCERPT_CHARS = 500
+
+_lock = threading.Lock()
+_memo = None
+
+
+def _load():
+    global _memo
+    if _memo is None:
+        try:
+            _memo = json.loads(MEMO_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            _memo = {}
+    return _memo
+
+
+def _save():
+    try:
+        MEMO_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = MEMO_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps(_memo, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, MEMO_PATH)
+    except Exception as e:
+        print(f"[Debug] Failed to persist failure memo: {e}")
+
+
+def snippet_key(snippet: str, lang: str = "") -> str:
+    """Content key of a snippet: file path + normalized body + prompt version."""
+    lines = snippet.splitlines()
+    m = SNIPPET_HEADER_RE.match(lines[0].strip()) if lines else None
+    path = os.path.normcase(m.group("path").strip().replace("\\", "/")) if m else ""
+    raw = f"{lang}|{path}|{normalized_hash(lines[1:])}|{PROMPT_VERSION}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _backoff(failures: int) -> int:
+    """Rounds to skip before the next attempt after `failures` failures."""
+    return 0 if failures <= 1 else 2 ** (failures - 1) - 1
+
+
+def check(key: str) -> str:
+    """'send', 'backoff' (skip this round) or 'deferred' (gave up) for a snippet key."""
+    if not ENABLED:
+        return "send"
+    with _lock:
+        entry = _load().get(key)
+        if not entry:
+            return "send"
+        if time.time() - entry.get("last_failure", 0) > TTL_S:
+            del _memo[key]
+            _save()
+            return "send"
+        if entry["failures"] >= MAX_FAILURES:
+            entry["deferred"] = entry.get("deferred", 0) + 1
+            _save()
+            return "deferred"
+        if entry.get("skipped", 0) < _backoff(entry["failures"]):
+            entry["skipped"] = entry.get("skipped", 0) + 1
+            _save()
+            return "backoff"
+        return "send"
+
+
+def record_failure(key: str, reason: str, header: str = "", raw: str = ""):
+    if not ENABLED:
+        return
+    with _lock:
+        entry = _load().setdefault(key, {"failures": 0, "first_failure": time.time()})
+        entry["failures"] += 1
+        entry["skipped"] = 0
+        entry["last_failure"] = time.time()
+        entry["last_reason"] = reason
+        entry["header"] = header
+        entry["prompt_version"] = PROMPT_VERSION
+        entry["raw_excerpt"] = (raw or "")[:RAW_EXCERPT_CHARS]
+        _save()
+        if entry["failures"] >= MAX_FAILURES:
+            print(f"[*] Failure memo: {header or key[:12]} failed {entry['failures']} times; deferring it")
+
+
+def record_success(key: str):
+    if not ENABLED:
+        return
+    with _lock:
+        if _load().pop(key, None) is not None:
+            _save()
+
+
+def get(key: str) -> dict:
+    with _lock:
+        return dict(_load().get(key) or {})
+
+
+def reset():
+    """Forget the in-memory copy (tests / after MEMO_PATH changes)."""
+    global _memo
+    with _lock:
+        _memo = None
@@ -1,8 +1,13 @@
 import os
 import json
-import requests
 from pathlib import Path
 
+import llm_cache
+import llm_providers
+import http_pool
+import prompt_builder
+import rate_limiter
+
 
 def _load_env_file(env_path: Path):
     """Load simple KEY=VALUE pairs from an env file into os.environ if not already set."""
@@ -73,7 +78,7 @@ def _summarize_repo(repo_path: Path, max_files=30):
     return summary
 
 
-def _build_prompt(summary: dict, language: str = 'cpp'):
+def _build_prompt(summary: dict, language: str = 'cpp', provider: str = 'HuggingFace_Router'):
     """Construct the prompt asking the HF model to generate test cases in JSON.
     Output format: JSON array of objects: {"name","short","commands","expected"}
     """
@@ -92,21 +97,31 @@ def _build_prompt(summary: dict, language: str = 'cpp'):
         ']'
     )
 
-    prompt = (
+    def _esc(text: str) -> str:
+        # literal text inside the format template below
+        return text.replace("{", "{{").replace("}", "}}")
+
+    template = (
         "You are a concise QA assistant that generates small, runnable test-case descriptions for C/C++ projects (Qt allowed).\n"
         "Return ONLY valid JSON: an array of objects. Each object must contain the fields: name, title, description, commands (array), expected.\n"
         "Produce 3-8 focused test cases tailored to the project. Prefer non-GUI checks but include at least one runtime start test and one resource check if resources exist.\n\n"
-        "EXAMPLE OUTPUT (JSON only):\n" + example + "\n\n"
-        "Project README (truncated):\n" + (readme[:2000] if readme else "<no readme>") + "\n\n"
-        "Top files in project:\n" + ("\n".join(files[:40]) if files else "<no files>") + "\n\n"
+        "EXAMPLE OUTPUT (JSON only):\n" + _esc(example) + "\n\n"
+        "Project README (truncated):\n{readme}\n\n"
+        "Top files in project:\n{files}\n\n"
         "Project signals:\n"
-        f"- qrc_files: {', '.join(qrc) if qrc else '<none>'}\n"
-        f"- ui_files: {', '.join(ui) if ui else '<none>'}\n"
-        f"- pro_files: {', '.join(pro) if pro else '<none>'}\n"
-        f"- headers_with_Q_OBJECT: {', '.join(qobj[:10]) if qobj else '<none>'}\n"
-        f"- likely_exec_names: {', '.join(exes)}\n\n"
+        + _esc(f"- qrc_files: {', '.join(qrc) if qrc else '<none>'}\n"
+               f"- ui_files: {', '.join(ui) if ui else '<none>'}\n"
+               f"- pro_files: {', '.join(pro) if pro else '<none>'}\n"
+               f"- headers_with_Q_OBJECT: {', '.join(qobj[:10]) if qobj else '<none>'}\n"
+               f"- likely_exec_names: {', '.join(exes)}\n\n") +
         "Return JSON only. If unsure, prefer safe tests (README/build checks) rather than speculative runtime tests."
     )
+    # README is trimmed before the file list when the prompt exceeds the provider budget
+    prompt, _ = prompt_builder.fit_prompt(
+        template,
+        {"readme": readme[:2000] if readme else "<no readme>",
+         "files": "\n".join(files[:40]) if files else "<no files>"},
+        provider=provider, shrink_order=["readme", "files"])
     return prompt
 
 
@@ -117,7 +132,7 @@ def _call_hf_api(prompt: str, model: str, token: str, timeout=60, temperature=0.
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
 
     # First, try the OpenAI-compatible chat completions endpoint on the router
-    chat_url = "https://router.huggingface.co/v1/chat/completions"
+    chat_url = llm_providers.router_base_url() + "/chat/completions"
     chat_payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
@@ -125,7 +140,7 @@ def _call_hf_api(prompt: str, model: str, token: str, timeout=60, temperature=0.
         "max_tokens": 512,
     }
     try:
-        resp = requests.post(chat_url, headers=headers, json=chat_payload, timeout=timeout)
+        resp = http_pool.post(chat_url, headers=headers, json=chat_payload, timeout=timeout)
         # prefer structured chat completion response
         try:
             j = resp.json()
@@ -154,7 +169,7 @@ def _call_hf_api(prompt: str, model: str, token: str, timeout=60, temperature=0.
             resp = None
             for url in urls_to_try:
                 try:
-                    resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+                    resp = http_pool.post(url, headers=headers, json=payload, timeout=timeout)
                 except Exception:
                     resp = None
                 if resp is None:
@@ -193,7 +208,7 @@ def _call_ollama(host: str, model: str, prompt: str, timeout: int = 60, temperat
             'max_tokens': 512,
             'temperature': temperature,
         }
-        resp = requests.post(url, json=payload, timeout=timeout)
+        resp = http_pool.post(url, json=payload, timeout=timeout)
         try:
             j = resp.json()
             # Ollama returns {'generated': '...', ' ...'} or sometimes {'responses':[...]} depending on version
@@ -213,10 +228,14 @@ def _call_ollama(host: str, model: str, prompt: str, timeout: int = 60, temperat
         return traceback.format_exc()
 
 
-def generate_tests(workspace_path: str, repo_path: str = None, model: str = None, token: str = None):
+def generate_tests(workspace_path: str, repo_path: str = None, model: str = None, token: str = None,
+                   use_cache: bool = None):
     """Generate test cases for repo_path, write generated_tests.json into workspace_path and return list.
 
     If HF API token or model missing, return a small heuristic set.
+    Responses that parse as JSON are stored in the shared LLM cache; pass
+    use_cache=False to force regeneration for a re-uploaded project (None
+    follows the cache's global/workspace bypass).
     """
     ws = Path(workspace_path)
     repo = Path(repo_path) if repo_path else ws
@@ -254,8 +273,12 @@ def generate_tests(workspace_path: str, repo_path: str = None, model: str = None
     if hf_model and hf_token:
         # Try a couple of temperatures to favor valid JSON output
         for temp in (0.2, 0.0):
-            # call HF inference
-            raw = _call_hf_api(prompt, hf_model, hf_token)
+            # call HF inference (or reuse an earlier response for the same prompt)
+            raw = llm_cache.get('HuggingFace_Router', hf_model, temp, prompt, bypass=None if use_cache is None else not use_cache)
+            from_cache = raw is not None
+            if not from_cache:
+                rate_limiter.acquire('HuggingFace_Router', prompt_builder.count_tokens(prompt, 'HuggingFace_Router'))
+                raw = _call_hf_api(prompt, hf_model, hf_token, temperature=temp)
             raw_hf = raw or raw_hf
             if not raw:
                 continue
@@ -265,15 +288,17 @@ def generate_tests(workspace_path: str, repo_path: str = None, model: str = None
             if m:
                 try:
                     generated = json.loads(m.group(1))
-                    break
                 except Exception:
                     generated = None
             else:
                 try:
                     generated = json.loads(raw)
-                    break
                 except Exception:
                     generated = None
+            if generated:
+                if not from_cache:
+                    llm_cache.put('HuggingFace_Router', hf_model, temp, prompt, raw)
+                break
 
     # Log raw HF output to workspace for debugging
     try:
@@ -288,7 +313,11 @@ def generate_tests(workspace_path: str, repo_path: str = None, model: str = None
         ollama_model = os.environ.get('LOCAL_MODEL') or os.environ.get('OLLAMA_MODEL')
         if ollama_host and ollama_model:
             try:
-                ollama_out = _call_ollama(ollama_host, ollama_model, prompt, timeout=int(os.environ.get('OLLAMA_TIMEOUT', 60)))
+                ollama_out = llm_cache.get('Ollama', ollama_model, 0.0, prompt, bypass=None if use_cache is None else not use_cache)
+                ollama_cached = ollama_out is not None
+                if not ollama_cached:
+                    rate_limiter.acquire('Ollama', prompt_builder.count_tokens(prompt, 'Ollama'))
+                    ollama_out = _call_ollama(ollama_host, ollama_model, prompt, timeout=int(os.environ.get('OLLAMA_TIMEOUT', 60)))
                 if ollama_out:
                     # try to extract a JSON array
                     import re
@@ -303,6 +332,8 @@ def generate_tests(workspace_path: str, repo_path: str = None, model: str = None
                             generated = json.loads(ollama_out)
                         except Exception:
                             generated = None
+                    if generated and not ollama_cached:
+                        llm_cache.put('Ollama', ollama_model, 0.0, prompt, ollama_out)
                     # save raw Ollama output for debugging
                     try:
                         (ws / 'generated_tests_ollama_debug.txt').write_text(str(ollama_out), encoding='utf-8')
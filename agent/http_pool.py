@@ -0,0 +1,123 @@
+"""Shared keep-alive HTTP sessions for the LLM provider adapters.
+
+`hf_test_generator` and the HuggingFace clients in `lc_pipeline` used to call
+`requests.post` directly, paying a fresh TCP+TLS handshake per request. This
+module keeps one `requests.Session` per scheme://host with a urllib3
+connection pool that keeps up to HTTP_POOL_MAXSIZE idle connections per host
+(more concurrent requests open extra connections instead of waiting for a
+free one) and a retry policy with exponential backoff (HTTP_RETRIES,
+HTTP_RETRY_BACKOFF). Connection errors are retried for every method, 429/5xx
+responses only for idempotent ones: a POST that reached the server may
+already have been generated (and billed). `stats()` reports, per host, how many
+requests went out and how many TCP connections were opened, so connection
+reuse can be checked against a local stand-in server.
+"""
+import os
+import threading
+from urllib.parse import urlsplit
+
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "8"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_sessions = {}
+_requests_sent = {}
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _retry_policy():
+    from urllib3.util.retry import Retry
+    # urllib3's default allowed methods exclude POST from status retries; connect
+    # errors (the request never reached the server) are retried for any method
+    return Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=0, status=HTTP_RETRIES,
+                 backoff_factor=HTTP_RETRY_BACKOFF, status_forcelist=RETRY_STATUSES,
+                 respect_retry_after_header=True, raise_on_status=False)
+
+
+def _adapter():
+    """HTTPAdapter whose pool manager remembers the connection pools it hands out (for stats())."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.poolmanager import PoolManager
+
+    class TrackingPoolManager(PoolManager):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.seen_pools = []
+
+        def connection_from_pool_key(self, pool_key, request_context=None):
+            pool = super().connection_from_pool_key(pool_key, request_context=request_context)
+            if pool not in self.seen_pools:
+                self.seen_pools.append(pool)
+            return pool
+
+    class TrackingAdapter(HTTPAdapter):
+        def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+            super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+            self.poolmanager = TrackingPoolManager(num_pools=connections, maxsize=maxsize, block=block,
+                                                   **pool_kwargs)
+
+    # pool_block=False: a thread beyond HTTP_POOL_MAXSIZE opens an extra connection
+    # instead of blocking (without a timeout) until another request finishes
+    return TrackingAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=False,
+                           max_retries=_retry_policy())
+
+
+def get_session(url: str):
+    """Return the shared session for url's scheme://host, creating it on first use."""
+    # imported here so that importing this module stays cheap at startup
+    import requests
+    key = _host_key(url)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.mount(key + "/", _adapter())
+            _sessions[key] = session
+        return session
+
+
+def post(url: str, **kwargs):
+    """`requests.post` replacement that goes through the pooled session for url's host."""
+    key = _host_key(url)
+    with _lock:
+        _requests_sent[key] = _requests_sent.get(key, 0) + 1
+    return get_session(url).post(url, **kwargs)
+
+
+def stats() -> dict:
+    """Per-host request count and connections opened (connection reuse = 1 - opened/requests)."""
+    out = {}
+    with _lock:
+        items = list(_sessions.items())
+        sent = dict(_requests_sent)
+    for key, session in items:
+        opened = 0
+        adapter = session.get_adapter(key + "/")
+        for pool in list(getattr(adapter.poolmanager, "seen_pools", [])):
+            opened += getattr(pool, "num_connections", 0)
+        n = sent.get(key, 0)
+        out[key] = {
+            "requests": n,
+            "connections_opened": opened,
+            "reuse_rate": round(1 - opened / n, 3) if n else None,
+        }
+    return out
+
+
+def close_all():
+    """Close every pooled session (mainly for tests and shutdown)."""
+    with _lock:
+        items = list(_sessions.values())
+        _sessions.clear()
+        _requests_sent.clear()
+    for session in items:
+        try:
+            session.close()
+        except Exception:
+            pass
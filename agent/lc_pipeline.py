@@ -3,45 +3,34 @@ import re
 import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
-# langchain clients are optional in developer environments; import defensively
-try:
-    from langchain_core.messages import HumanMessage
-except Exception:
-    # minimal fallback so code that constructs HumanMessage doesn't crash at import time
-    class HumanMessage:
-        def __init__(self, content: str):
-            self.content = content
 import concurrent.futures
 import multiprocessing
+import threading
 import time
 import traceback
 import argparse
-import json
-
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except Exception:
-    ChatGoogleGenerativeAI = None
-
-try:
-    from langchain_openai import ChatOpenAI
-except Exception:
-    ChatOpenAI = None
-
-try:
-    from langchain_ollama import ChatOllama
-except Exception:
-    ChatOllama = None
-try:
-    import requests
-except Exception:
-    requests = None
-try:
-    # optional: local/open-source HF transformers pipeline
-    from transformers import pipeline as hf_transformers_pipeline
-except Exception:
-    hf_transformers_pipeline = None
-from prompts import BUG_FIX_PROMPT
+
+from prompts import BUG_FIX_PROMPT, BATCH_FIX_PROMPT, EDIT_FIX_PROMPT
+import llm_cache
+import llm_health
+import llm_dispatch
+import llm_capability
+import http_pool
+import llm_providers
+import llm_stream
+import prompt_builder
+import rate_limiter
+import response_journal
+import failure_memo
+import snippet_dedup
+import edit_ops
+import diff_model
+import patch_apply
+import patch_compose
+import patch_store
+import patch_verify
+from llm_providers import get_llm
+from report_index import IssueIndex, SNIPPET_HEADER_RE, estimate_tokens
 
 
 def _invoke_child_process(name, prompt, q):
@@ -120,11 +109,6 @@ def _invoke_child_process(name, prompt, q):
                 class HM:
                     def __init__(self, content: str):
                         self.content = content
-            try:
-                import requests as _req
-            except Exception:
-                q.put(("err", "requests not available for HuggingFace client"))
-                return
             key = os.getenv("HUGGINGFACE_API_TOKEN")
             if not key:
                 q.put(("err", "HUGGINGFACE_API_TOKEN not set"))
@@ -133,7 +117,7 @@ def _invoke_child_process(name, prompt, q):
             headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
             try:
                 payload = {"inputs": prompt, "options": {"wait_for_model": True}}
-                resp = _req.post(model_url, headers=headers, json=payload, timeout=30)
+                resp = http_pool.post(model_url, headers=headers, json=payload, timeout=30)
                 resp.raise_for_status()
                 data = resp.json()
                 # try to extract generated_text
@@ -193,171 +177,58 @@ SKIP_LLM = False
 LLM_TIMEOUT_GEMINI = int(os.getenv("LLM_TIMEOUT_GEMINI", "90"))
 LLM_TIMEOUT_QWEN = int(os.getenv("LLM_TIMEOUT_QWEN", "90"))
 LLM_TIMEOUT_OLLAMA = int(os.getenv("LLM_TIMEOUT_OLLAMA", "30"))
+LLM_TIMEOUT_HF = int(os.getenv("LLM_TIMEOUT_HF", "45"))
+# Hedged router requests: start HuggingFace_Router_2 after LLM_HEDGE_DELAY seconds
+# (or the primary's learned p95 latency) instead of waiting for a full timeout
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") in ("1", "true", "True")
+# Stream router / Ollama replies and stop early on non-diff output or a complete diff
+LLM_STREAM = os.getenv("LLM_STREAM", "0") in ("1", "true", "True")
+STREAMING_PROVIDERS = ("HuggingFace_Router", "HuggingFace_Router_2", "Ollama")
+# Read plain (non-diff-watched) requests to those providers as a stream too, so an
+# abandoned request stops reading and closes its connection instead of holding a
+# dispatch worker until the transport timeout
+LLM_ABORTABLE_INVOKE = os.getenv("LLM_ABORTABLE_INVOKE", "1") not in ("0", "false", "False")
+# Providers that receive run_pipeline's patch prompts (prompts are fitted to the smallest budget)
+PATCH_PROVIDERS = ("HuggingFace_Router", "HuggingFace_Router_2")
+# Send only the report findings relevant to each snippet (plus a global summary)
+REPORT_SLICING = os.getenv("REPORT_SLICING", "1") not in ("0", "false", "False")
+# Number of snippets sent to the LLMs in parallel by run_pipeline (1 = sequential)
+LLM_CONCURRENCY = max(1, int(os.getenv("LLM_CONCURRENCY", "1")))
+# Ask for one multi-hunk diff per source file instead of one request per snippet
+LLM_BATCH_BY_FILE = os.getenv("LLM_BATCH_BY_FILE", "0") in ("1", "true", "True")
+# Estimated prompt-token cap for a single batched request
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "3000"))
+# Drop duplicate snippets and merge overlapping windows of one file before dispatch
+SNIPPET_DEDUP = os.getenv("SNIPPET_DEDUP", "1") not in ("0", "false", "False")
+# Also write raw_resp_{i}.txt files next to the patches (the response journal always gets them)
+RAW_RESP_FILES = os.getenv("RAW_RESP_FILES", "0") in ("1", "true", "True")
+# "diff" asks the model for a unified diff; "edits" for JSON edit operations rendered locally (edit_ops)
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "diff").strip().lower()
+RESPONSE_FORMATS = ("diff", "edits")
 # Control whether pipeline may stop early when all dynamic tests pass even if
 # static issues remain. Default: False (do NOT stop on dynamic-only success).
 STOP_ON_DYNAMIC_ONLY = os.getenv("STOP_ON_DYNAMIC", "0") == "1"
 
 # === LangChain Clients ===
-gemini_llm = None
-qwen_llm = None
-ollama_llm = None
-hf_llm = None
-hf_router_llm = None
-transformers_llm = None
-hf_router_llm_2 = None
-hf_router_llm_2 = None
-
-# Instantiate LLM clients only if their classes are available and keys/config present
-if ChatGoogleGenerativeAI and GEMINI_KEY:
-    try:
-        gemini_llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=GEMINI_KEY,
-            temperature=0.1,
-        )
-    except Exception as e:
-        print(f"[!] Failed to init Gemini client: {e}")
-
-if (not DISABLE_QWEN) and ChatOpenAI and QWEN_KEY:
-    try:
-        qwen_llm = ChatOpenAI(
-            api_key=QWEN_KEY,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            model="qwen1.5-7b-chat",
-        )
-    except Exception as e:
-        print(f"[!] Failed to init Qwen client: {e}")
-else:
-    if DISABLE_QWEN:
-        print("[Debug] Qwen disabled via DISABLE_QWEN env var; skipping initialization.")
-
-if ChatOllama:
-    try:
-        ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-        try:
-            ollama_llm = ChatOllama(model=LOCAL_MODEL, temperature=0.3, host=ollama_host)
-        except TypeError:
-            ollama_llm = ChatOllama(model=LOCAL_MODEL, temperature=0.3, base_url=ollama_host)
-    except Exception as e:
-        print(f"[!] Failed to init Ollama client: {e}")
-    # Ollama client initialized (local fallback)
+# Clients are imported and constructed on first use by llm_providers.get_llm();
+# the old module attributes (gemini_llm, hf_router_llm, ...) resolve lazily
+# through __getattr__ below for callers outside this module.
+_LEGACY_CLIENTS = {
+    "gemini_llm": "Gemini",
+    "qwen_llm": "Qwen",
+    "ollama_llm": "Ollama",
+    "hf_llm": "HuggingFace",
+    "hf_router_llm": "HuggingFace_Router",
+    "hf_router_llm_2": "HuggingFace_Router_2",
+    "transformers_llm": "Transformers",
+}
+
+
+def __getattr__(name):
+    if name in _LEGACY_CLIENTS:
+        return get_llm(_LEGACY_CLIENTS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Transformers local / HF open-source pipeline client
-if hf_transformers_pipeline and TRANSFORMERS_MODEL:
-    try:
-        class _TransformersClient:
-            def __init__(self, model, trust_remote=False, device="-1"):
-                # device: '-1' for CPU, '0' for first GPU
-                device_arg = -1 if str(device) == "-1" else int(device)
-                self.pipe = hf_transformers_pipeline("text-generation", model=model, trust_remote_code=trust_remote, device=device_arg)
-
-            def invoke(self, messages):
-                prompt = "\n".join(getattr(m, 'content', str(m)) for m in messages)
-                # Respect an env var for max tokens
-                max_new_tokens = int(os.getenv("TRANSFORMERS_MAX_TOKENS", "256"))
-                resp = self.pipe(prompt, max_new_tokens=max_new_tokens)
-                # return an object with .content to match other clients
-                try:
-                    text = resp[0].get('generated_text') if isinstance(resp, list) and isinstance(resp[0], dict) else str(resp)
-                except Exception:
-                    text = str(resp)
-                return type("R", (), {"content": text})()
-
-        transformers_llm = _TransformersClient(TRANSFORMERS_MODEL, trust_remote=TRANSFORMERS_TRUST_REMOTE, device=TRANSFORMERS_DEVICE)
-    except Exception as e:
-        print(f"[!] Failed to init Transformers pipeline client: {e}")
-
-# Minimal HuggingFace Inference API client (opt-in)
-if HUGGINGFACE_TOKEN and requests:
-    try:
-        # Represent hf_llm as a small callable object with an invoke method
-        class _HFClient:
-            def __init__(self, token):
-                self.token = token
-                # primary HF inference URL (model-specific)
-                self.url = os.getenv("HUGGINGFACE_MODEL_URL", "https://api-inference.huggingface.co/models/gpt2")
-                # alternate model URLs to try when the primary endpoint returns 410
-                self.alternates = [u.strip() for u in HUGGINGFACE_ALTERNATE_URLS if u.strip()]
-
-            def _call_url(self, url, prompt):
-                headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
-                payload = {"inputs": prompt, "options": {"wait_for_model": True}}
-                resp = requests.post(url, headers=headers, json=payload, timeout=30)
-                resp.raise_for_status()
-                return resp.json()
-
-            def invoke(self, messages):
-                # messages is list-like of HumanMessage; we concat content
-                prompt = "\n".join(getattr(m, 'content', str(m)) for m in messages)
-                urls_to_try = [self.url] + self.alternates
-                last_exc = None
-                for url in urls_to_try:
-                    try:
-                        data = self._call_url(url, prompt)
-                        # HF Inference API may return text or array with generated_text
-                        if isinstance(data, dict) and "generated_text" in data:
-                            return type("R", (), {"content": data["generated_text"]})()
-                        if isinstance(data, list) and data and isinstance(data[0], dict) and "generated_text" in data[0]:
-                            return type("R", (), {"content": data[0]["generated_text"]})()
-                        # fallback: stringify response
-                        return type("R", (), {"content": str(data)})()
-                    except Exception as e:
-                        last_exc = e
-                        # If 410 Gone, try next alternate URL
-                        try:
-                            code = None
-                            if hasattr(e, 'response') and e.response is not None:
-                                code = getattr(e.response, 'status_code', None)
-                        except Exception:
-                            code = None
-                        if code == 410:
-                            continue
-                        # otherwise, break and surface the error
-                        break
-                # All attempts failed
-                raise last_exc if last_exc is not None else RuntimeError("HF inference failed")
-
-        hf_llm = _HFClient(HUGGINGFACE_TOKEN)
-    except Exception as e:
-        print(f"[!] Failed to init HuggingFace client: {e}")
-
-# Hugging Face Router (OpenAI-compatible) via OpenAI-style client
-if ChatOpenAI and HF_TOKEN:
-    try:
-        hf_router_llm = ChatOpenAI(
-            api_key=HF_TOKEN,
-            base_url="https://router.huggingface.co/v1",
-            model=os.getenv("HUGGINGFACE_ROUTER_MODEL", "gpt2"),
-            temperature=0.2,
-        )
-    except Exception as e:
-        print(f"[!] Failed to init HuggingFace Router client: {e}")
-
-# Secondary HF Router (fallback router) using HF_TOKEN_2 / HUGGINGFACE_ROUTER_MODEL_2
-HF_TOKEN_2 = os.getenv("HF_TOKEN_2")
-HUGGINGFACE_ROUTER_MODEL_2 = os.getenv("HUGGINGFACE_ROUTER_MODEL_2")
-if ChatOpenAI and HF_TOKEN_2:
-    try:
-        hf_router_llm_2 = ChatOpenAI(
-            api_key=HF_TOKEN_2,
-            base_url="https://router.huggingface.co/v1",
-            model=HUGGINGFACE_ROUTER_MODEL_2 or os.getenv("HUGGINGFACE_ROUTER_MODEL", "gpt2"),
-            temperature=0.2,
-        )
-    except Exception as e:
-        print(f"[!] Failed to init secondary HuggingFace Router client: {e}")
-
-# Secondary HF Router (fallback router) using HF_TOKEN_2 / HUGGINGFACE_ROUTER_MODEL_2
-if ChatOpenAI and HF_TOKEN_2:
-    try:
-        hf_router_llm_2 = ChatOpenAI(
-            api_key=HF_TOKEN_2,
-            base_url="https://router.huggingface.co/v1",
-            model=HUGGINGFACE_ROUTER_MODEL_2 or os.getenv("HUGGINGFACE_ROUTER_MODEL", "gpt2"),
-            temperature=0.2,
-        )
-    except Exception as e:
-        print(f"[!] Failed to init Secondary HuggingFace Router client: {e}")
 
 # === Folder setup ===
 BASE_DIR = Path(__file__).resolve().parent
@@ -370,6 +241,12 @@ REPORT_PY = BASE_DIR / "analysis_report_py.txt"
 SNIPPETS_CPP = SNIPPETS_DIR / "bug_snippets_cpp.txt"
 SNIPPETS_PY = SNIPPETS_DIR / "bug_snippets_py.txt"
 PATCH_FILE = PATCHES_DIR / "all_patches.diff"
+# Workspaces dynamic_tester uses when no repo_dir is given
+DEFAULT_REPOS = {"py": BASE_DIR.parent / "python_repo", "cpp": BASE_DIR.parent / "cpp_project" / "puzzle-2"}
+# Merge each iteration's per-snippet patches into one combined patch per file (patch_compose)
+PATCH_COMPOSE = os.getenv("PATCH_COMPOSE", "1") == "1"
+# Build + test every candidate in its own workspace overlay before composing (patch_verify)
+PATCH_VERIFY = os.getenv("PATCH_VERIFY", "0") == "1"
 
 
 def run_command(cmd, cwd=None):
@@ -378,21 +255,57 @@ def run_command(cmd, cwd=None):
     print(result.stdout + result.stderr)
 
 
-def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str:
-    """Ask Gemini → Qwen → Ollama for a patch, apply the patch to the code."""
+def _llm_model_name(llm):
+    """Best-effort model identifier of a LangChain/custom client (used for cache keys)."""
+    for attr in ("model_name", "model", "url"):
+        val = getattr(llm, attr, None)
+        if isinstance(val, str) and val:
+            return val
+    return type(llm).__name__
+
+
+_last_ask = threading.local()
+
+
+def last_answered() -> int:
+    """Number of providers that answered the calling thread's last ask_llm (0 = all failed/skipped)."""
+    return len(getattr(_last_ask, "answered", ()))
+
+
+def last_cache_keys() -> list:
+    """llm_cache keys the calling thread's last ask_llm answer was served from or stored under."""
+    return list(getattr(_last_ask, "cache_keys", ()))
+
+
+def ask_llm(prompt: str, original_code_file: str, patched_code_file: str, expect: str = "diff") -> str:
+    """Ask Gemini → Qwen → Ollama for a patch, apply the patch to the code.
+
+    expect="edits" accepts JSON edit operations (edit_ops) instead of a diff:
+    the routers then skip the YES/NO pre-flight and streaming, and their
+    outcomes are learned under a separate "<model> [edits]" capability entry.
+    """
     global SKIP_LLM
     if SKIP_LLM:
         print("[Debug] SKIP_LLM is set; skipping LLM calls and returning empty patch")
         return ""
-
-    def invoke_with_timeout(llm, name, timeout=20):
-        """Invoke an LLM client in a thread with timeout."""
+    edits = expect == "edits"
+    accept = edit_ops.looks_like_edits if edits else (lambda content: bool(content) and "diff --git" in content)
+
+    def invoke_with_timeout(llm, name, timeout=20, status: dict = None):
+        """Invoke an LLM client on the shared dispatch pool with timeout.
+
+        Requests still running when the timeout fires are detached from the
+        pool rather than joined, so a hung router cannot stall the loop.
+        status, if given, receives {'error': 'timeout'|'exception'} when the
+        provider itself failed (as opposed to declining with NO / NO_PATCH).
+        """
+        status = status if status is not None else {}
         if not llm:
             print(f"[Debug] {name} client not initialized, skipping.")
             return None
-        print(f"[Debug] Invoking {name} (timeout={timeout}s) via thread")
+        print(f"[Debug] Invoking {name} (timeout={timeout}s) via dispatch pool")
         try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
+            with llm_dispatch.session() as ex:
                 # Gemini: skip the short YES/NO capability-check because Gemini has
                 # sometimes answered NO for longer instruction prompts; instead send
                 # the strict unified-diff instruction directly and accept its response.
@@ -401,13 +314,19 @@ def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str
                         # Lightweight capability check first: ask a very short question
                         # so Gemini doesn't reject long instruction prompts in stage1.
                         try:
-                            cap_prompt = "Can you produce a unified-diff patch (git apply-compatible) for a small Python snippet? Reply YES or NO."
-                            fut_cap = ex.submit(lambda: llm.invoke([HumanMessage(content=cap_prompt)]))
-                            resp_cap = fut_cap.result(timeout=min(15, timeout))
-                            cap = getattr(resp_cap, 'content', '') or ''
-                            if not cap.strip().upper().startswith('YES'):
-                                print(f"[Debug] Gemini capability check negative/ambiguous: '{cap[:80]}'")
-                                return None
+                            model_id = _llm_model_name(llm)
+                            precheck = llm_capability.needs_precheck(name, model_id)
+                            if precheck:
+                                cap_prompt = "Can you produce a unified-diff patch (git apply-compatible) for a small Python snippet? Reply YES or NO."
+                                fut_cap = ex.submit(lambda: llm.invoke([llm_providers.human_message(cap_prompt)]))
+                                resp_cap = ex.result(fut_cap, min(15, timeout))
+                                cap = getattr(resp_cap, 'content', '') or ''
+                                llm_capability.record_precheck(name, model_id, cap.strip().upper().startswith('YES'))
+                                if not cap.strip().upper().startswith('YES'):
+                                    print(f"[Debug] Gemini capability check negative/ambiguous: '{cap[:80]}'")
+                                    return None
+                            else:
+                                print("[Debug] Gemini skipping capability check (learned from history)")
 
                             # Now send the strict unified-diff request and try a couple of variants
                             strict_suffix = (
@@ -425,25 +344,14 @@ def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str
 
                             for idx, ap in enumerate(variants, start=1):
                                 try:
-                                    fut = ex.submit(lambda: llm.invoke([HumanMessage(content=ap)]))
-                                    res = fut.result(timeout=timeout)
+                                    fut = ex.submit(lambda: llm.invoke([llm_providers.human_message(ap)]))
+                                    res = ex.result(fut, timeout)
                                     content = getattr(res, 'content', '') or ''
-                                    # Log full Gemini pipeline response for debugging
-                                    try:
-                                        out_dir = BASE_DIR / 'patches_py_fixed'
-                                        out_dir.mkdir(parents=True, exist_ok=True)
-                                        ts = int(time.time())
-                                        fname = out_dir / f'raw_gemini_pipeline_{ts}_{idx}.json'
-                                        saved = {
-                                            'repr': repr(res),
-                                            'content': content,
-                                            '__dict__': getattr(res, '__dict__', None)
-                                        }
-                                        with open(fname, 'w', encoding='utf-8') as fh:
-                                            json.dump(saved, fh, ensure_ascii=False, indent=2)
-                                        print(f"[Debug] Saved Gemini pipeline raw response to {fname}")
-                                    except Exception as _e:
-                                        print(f"[Debug] Failed to save Gemini response: {_e}")
+                                    llm_capability.record_outcome(name, model_id, _classify_patch_response(content),
+                                                                  prechecked=precheck)
+                                    # Journal the full Gemini response for debugging (background writer)
+                                    response_journal.record("gemini_variant", content, provider=name, variant=idx,
+                                                            repr=repr(res))
                                     if content.strip() == 'NO_PATCH':
                                         print(f"[Debug] Gemini returned NO_PATCH on variant {idx}")
                                         return None
@@ -465,49 +373,40 @@ def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str
                             # consisting of the strict instruction plus the tail of the original prompt.
                             # This helps when very long analysis blocks cause the model to return
                             # an empty output or to hit internal limits.
-                            try:
-                                print("[Debug] Gemini: attempting trimmed-prompt retry (shorter input)")
-                                tail_len = int(os.getenv("GEMINI_TRIM_TAIL", "3000"))
-                                trimmed_body = (prompt[-tail_len:]) if len(prompt) > tail_len else prompt
-                                trimmed_prompt = (
-                                    "\n\nIMPORTANT: Return ONLY a valid unified diff patch compatible with 'git apply'. "
-                                    "Do NOT include any explanations, markdown fences, or extra text. If you cannot produce a valid patch, return exactly the string: NO_PATCH\n\n"
-                                    + trimmed_body
-                                )
-                                fut_t = ex.submit(lambda: llm.invoke([HumanMessage(content=trimmed_prompt)]))
-                                res_t = fut_t.result(timeout=timeout)
-                                content_t = getattr(res_t, 'content', '') or ''
-                                # Save trimmed attempt for debugging
+                            # The trimmed retry only helps when the prompt exceeds Gemini's
+                            # input budget; prompts built by prompt_builder normally fit.
+                            if prompt_builder.fits(prompt, "Gemini"):
+                                print("[Debug] Gemini: prompt within budget; skipping trimmed-prompt retry")
+                            else:
                                 try:
-                                    out_dir = BASE_DIR / 'patches_py_fixed'
-                                    out_dir.mkdir(parents=True, exist_ok=True)
-                                    ts = int(time.time())
-                                    fname = out_dir / f'raw_gemini_pipeline_trimmed_{ts}.json'
-                                    saved = {
-                                        'repr': repr(res_t),
-                                        'content': content_t,
-                                        '__dict__': getattr(res_t, '__dict__', None)
-                                    }
-                                    with open(fname, 'w', encoding='utf-8') as fh:
-                                        json.dump(saved, fh, ensure_ascii=False, indent=2)
-                                    print(f"[Debug] Saved Gemini trimmed response to {fname}")
-                                except Exception as _e:
-                                    print(f"[Debug] Failed to save Gemini trimmed response: {_e}")
-
-                                if content_t.strip() == 'NO_PATCH':
-                                    print("[Debug] Gemini returned NO_PATCH on trimmed retry")
-                                    return None
-                                if 'diff --git' in content_t:
-                                    return res_t
-                                if '<<<PATCH>>>' in content_t and '<<<END>>>' in content_t:
-                                    m = re.search(r"<<<PATCH>>>([\s\S]*?)<<<END>>>", content_t)
-                                    if m:
-                                        patched_text = m.group(1).strip()
-                                        return type('R', (), {'content': patched_text})()
-                            except concurrent.futures.TimeoutError:
-                                print("[!] Gemini trimmed-prompt attempt timed out")
-                            except Exception as e:
-                                print(f"[!] Gemini trimmed-prompt attempt failed: {e}")
+                                    print("[Debug] Gemini: attempting trimmed-prompt retry (shorter input)")
+                                    tail_len = int(os.getenv("GEMINI_TRIM_TAIL", "3000"))
+                                    trimmed_body = (prompt[-tail_len:]) if len(prompt) > tail_len else prompt
+                                    trimmed_prompt = (
+                                        "\n\nIMPORTANT: Return ONLY a valid unified diff patch compatible with 'git apply'. "
+                                        "Do NOT include any explanations, markdown fences, or extra text. If you cannot produce a valid patch, return exactly the string: NO_PATCH\n\n"
+                                        + trimmed_body
+                                    )
+                                    fut_t = ex.submit(lambda: llm.invoke([llm_providers.human_message(trimmed_prompt)]))
+                                    res_t = ex.result(fut_t, timeout)
+                                    content_t = getattr(res_t, 'content', '') or ''
+                                    response_journal.record("gemini_trimmed", content_t, provider=name,
+                                                            repr=repr(res_t))
+
+                                    if content_t.strip() == 'NO_PATCH':
+                                        print("[Debug] Gemini returned NO_PATCH on trimmed retry")
+                                        return None
+                                    if 'diff --git' in content_t:
+                                        return res_t
+                                    if '<<<PATCH>>>' in content_t and '<<<END>>>' in content_t:
+                                        m = re.search(r"<<<PATCH>>>([\s\S]*?)<<<END>>>", content_t)
+                                        if m:
+                                            patched_text = m.group(1).strip()
+                                            return type('R', (), {'content': patched_text})()
+                                except concurrent.futures.TimeoutError:
+                                    print("[!] Gemini trimmed-prompt attempt timed out")
+                                except Exception as e:
+                                    print(f"[!] Gemini trimmed-prompt attempt failed: {e}")
 
                             # As a final attempt, try a minimal prompt containing ONLY the
                             # buggy code snippet (extracted from the BUG_FIX_PROMPT) plus the
@@ -531,26 +430,12 @@ def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str
                                     "Do NOT include any explanations, markdown fences, or extra text. If you cannot produce a valid patch, return exactly the string: NO_PATCH"
                                 )
 
-                                fut_min = ex.submit(lambda: llm.invoke([HumanMessage(content=minimal_prompt)]))
-                                res_min = fut_min.result(timeout=timeout)
+                                fut_min = ex.submit(lambda: llm.invoke([llm_providers.human_message(minimal_prompt)]))
+                                res_min = ex.result(fut_min, timeout)
                                 content_min = getattr(res_min, 'content', '') or ''
 
-                                # Save minimal attempt for debugging
-                                try:
-                                    out_dir = BASE_DIR / 'patches_py_fixed'
-                                    out_dir.mkdir(parents=True, exist_ok=True)
-                                    ts = int(time.time())
-                                    fname = out_dir / f'raw_gemini_pipeline_minimal_{ts}.json'
-                                    saved = {
-                                        'repr': repr(res_min),
-                                        'content': content_min,
-                                        '__dict__': getattr(res_min, '__dict__', None)
-                                    }
-                                    with open(fname, 'w', encoding='utf-8') as fh:
-                                        json.dump(saved, fh, ensure_ascii=False, indent=2)
-                                    print(f"[Debug] Saved Gemini minimal response to {fname}")
-                                except Exception as _e:
-                                    print(f"[Debug] Failed to save Gemini minimal response: {_e}")
+                                response_journal.record("gemini_minimal", content_min, provider=name,
+                                                        repr=repr(res_min))
 
                                 if content_min.strip() == 'NO_PATCH':
                                     print("[Debug] Gemini returned NO_PATCH on minimal retry")
@@ -587,60 +472,157 @@ def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str
                         prompt
                         + "\n\nBefore producing a patch, answer ONLY one word: YES if you can produce a valid unified-diff patch (git apply-compatible) for this snippet, or NO if you cannot. Reply exactly 'YES' or 'NO' with no extra text."
                     )
+                    # The YES/NO stage is only sent while the capability registry is
+                    # still learning this model or when a periodic re-check is due.
+                    model_id = _llm_model_name(llm) + (" [edits]" if edits else "")
+                    precheck = not edits and llm_capability.needs_precheck(name, model_id)
                     try:
-                        fut1 = ex.submit(lambda: llm.invoke([HumanMessage(content=stage1_prompt)]))
-                        # Shorter timeout for capability check
-                        resp1 = fut1.result(timeout=min(20, timeout))
-                        c1 = getattr(resp1, "content", "").strip().upper()
-                        if not c1.startswith("YES"):
-                            print(f"[Debug] {name} capability check answered NO/ambiguous: '{c1[:80]}'")
-                            return None
-                        strict_suffix = (
-                            "\n\nIMPORTANT: Return ONLY a valid unified diff patch compatible with 'git apply'. "
-                            "Do NOT include any explanations, markdown fences, or extra text. If you cannot produce a valid patch, return exactly the string: NO_PATCH"
-                        )
+                        if precheck:
+                            fut1 = _submit_llm_request(ex, llm, name, stage1_prompt, stream=False)
+                            # Shorter timeout for capability check
+                            resp1 = ex.result(fut1, min(20, timeout))
+                            c1 = getattr(resp1, "content", "").strip().upper()
+                            llm_capability.record_precheck(name, model_id, c1.startswith("YES"))
+                            if not c1.startswith("YES"):
+                                print(f"[Debug] {name} capability check answered NO/ambiguous: '{c1[:80]}'")
+                                return None
+                        elif not edits:
+                            print(f"[Debug] {name} skipping YES/NO capability check (learned from history)")
+                        if edits:
+                            strict_suffix = (
+                                "\n\nIMPORTANT: Return ONLY the JSON object with the \"edits\" list. "
+                                "Do NOT include any explanations, markdown fences, or extra text. If no change is needed, return exactly: {\"edits\": []}"
+                            )
+                        else:
+                            strict_suffix = (
+                                "\n\nIMPORTANT: Return ONLY a valid unified diff patch compatible with 'git apply'. "
+                                "Do NOT include any explanations, markdown fences, or extra text. If you cannot produce a valid patch, return exactly the string: NO_PATCH"
+                            )
                         local_prompt = prompt + strict_suffix
-                        fut2 = ex.submit(lambda: llm.invoke([HumanMessage(content=local_prompt)]))
-                        resp2 = fut2.result(timeout=timeout)
+                        # the diff stream monitor would cut JSON replies off, so edits are never streamed
+                        fut2 = _submit_llm_request(ex, llm, name, local_prompt, stream=not edits)
+                        resp2 = ex.result(fut2, timeout)
+                        llm_capability.record_outcome(name, model_id,
+                                                      _classify_patch_response(getattr(resp2, "content", ""), expect),
+                                                      prechecked=precheck)
                         return resp2
+                    except llm_dispatch.Cancelled:
+                        print(f"[Debug] {name} request cancelled (lost the hedge)")
+                        status["cancelled"] = True
+                        return None
                     except concurrent.futures.TimeoutError:
                         print(f"[!] {name} two-stage invoke timed out (stage1 or stage2)")
+                        status["error"] = "timeout"
                         return None
                     except Exception as e:
                         print(f"[!] {name} failed during two-stage invoke: {e}")
+                        status["error"] = "exception"
+                        llm_capability.record_outcome(name, model_id, "error", prechecked=precheck)
                         return None
 
                 # Default single-call flow for other LLMs
                 local_prompt = prompt
-                fut = ex.submit(lambda: llm.invoke([HumanMessage(content=local_prompt)]))
+                fut = _submit_llm_request(ex, llm, name, local_prompt, stream=not edits)
                 try:
-                    resp = fut.result(timeout=timeout)
+                    resp = ex.result(fut, timeout)
                     return resp
+                except llm_dispatch.Cancelled:
+                    status["cancelled"] = True
+                    return None
                 except concurrent.futures.TimeoutError:
                     print(f"[!] {name} invoke timed out after {timeout}s")
+                    status["error"] = "timeout"
                     return None
+        except llm_dispatch.Cancelled:
+            status["cancelled"] = True
+            return None
         except Exception as e:
             print(f"[!] {name} failed during invoke: {e}")
+            status["error"] = "exception"
             return None
 
     # Print which LLMs are available — we only use the Hugging Face Router(s) now
+    hf_router_llm = get_llm("HuggingFace_Router")
+    hf_router_llm_2 = get_llm("HuggingFace_Router_2")
     print(f"[Debug] LLM availability: HuggingFace_Router={'yes' if hf_router_llm else 'no'}, HuggingFace_Router_2={'yes' if hf_router_llm_2 else 'no'}")
 
     # Use only the hosted Hugging Face Router(s) for patch generation. This forces
     # the pipeline to rely exclusively on the HF hosted router models and avoids
     # using Gemini/Ollama/Qwen/local transformers in this deployment.
-    for llm, name, t in [
-        (hf_router_llm, "HuggingFace_Router", int(os.getenv("LLM_TIMEOUT_HF", "45"))),
-        (hf_router_llm_2, "HuggingFace_Router_2", int(os.getenv("LLM_TIMEOUT_HF", "45"))),
-    ]:
-        resp = invoke_with_timeout(llm, name, timeout=t)
+    # Timeouts adapt to each router's learned p99 latency (capped at LLM_TIMEOUT_HF)
+    routers = [
+        (hf_router_llm, "HuggingFace_Router", llm_health.adaptive_timeout("HuggingFace_Router", LLM_TIMEOUT_HF)),
+        (hf_router_llm_2, "HuggingFace_Router_2", llm_health.adaptive_timeout("HuggingFace_Router_2", LLM_TIMEOUT_HF)),
+    ]
+    # providers that actually answered this call (read by last_answered())
+    answered = []
+    _last_ask.answered = answered
+    _last_ask.cache_keys = cache_keys = []
+
+    def cache_key(llm, name):
+        return llm_cache.cache_key(name, _llm_model_name(llm), getattr(llm, "temperature", None), prompt)
+
+    for llm, name, _t in routers:
+        if llm:
+            cached = llm_cache.get(name, _llm_model_name(llm), getattr(llm, "temperature", None), prompt)
+            if cached and accept(cached):
+                print(f"[+] Patch from {name} (cache hit)")
+                cache_keys.append(cache_key(llm, name))
+                return cached
+
+    def timed_invoke(llm, name, timeout):
+        if not llm:
+            return invoke_with_timeout(llm, name, timeout=timeout)
+        if not llm_health.allow(name):
+            # circuit breaker open: skip instead of waiting out another timeout
+            print(f"[Debug] {name} skipped: circuit breaker {llm_health.state(name)}")
+            return None
+        # shared per-provider RPM/TPM budget, queued fairly across workspaces; a request
+        # that lost a hedge while queued gives its turn back instead of taking a slot
+        token = llm_dispatch.current_token()
+        rate_limiter.acquire(name, prompt_builder.count_tokens(prompt, name), cancel=token)
+        if token is not None and token.is_set():
+            return None
+        started = time.time()
+        status = {}
+        resp = invoke_with_timeout(llm, name, timeout=timeout, status=status)
+        if status.get("cancelled"):
+            # abandoned by the hedge winner: neither a health sample nor a journaled answer
+            return None
+        # a NO / NO_PATCH answer is a healthy response; only timeouts and errors count as failures.
+        # A timeout is a (censored) latency sample; a stream cut short by the monitor is none.
+        llm_health.record(name, time.time() - started, ok="error" not in status,
+                          timed_out=status.get("error") == "timeout",
+                          sample=getattr(resp, "stream_status", None) in (None, "exhausted"))
+        if resp is not None and "error" not in status:
+            answered.append(name)
+            response_journal.record("response", getattr(resp, "content", ""), provider=name,
+                                    model=_llm_model_name(llm), latency_s=round(time.time() - started, 3),
+                                    stream_status=getattr(resp, "stream_status", None))
+        return resp
+
+    if LLM_HEDGE and hf_router_llm and hf_router_llm_2:
+        winner = _hedged_router_call(routers, timed_invoke, accept=accept if edits else None)
+        if winner:
+            llm, name, content = winner
+            print(f"[+] Patch from {name} (hedged)")
+            llm_cache.put(name, _llm_model_name(llm), getattr(llm, "temperature", None), prompt, content)
+            cache_keys.append(cache_key(llm, name))
+            return content
+        print("[!] All LLMs failed to produce a patch for this snippet.")
+        return ""
+
+    for llm, name, t in routers:
+        resp = timed_invoke(llm, name, t)
         if resp is None:
             print(f"[Debug] {name} returned no response, moving to next LLM...")
             continue
         content = getattr(resp, "content", None)
         print(f"[Debug] {name} response length: {len(content) if content else 0}")
-        if content and "diff --git" in content:
+        if content and accept(content):
             print(f"[+] Patch from {name}")
+            llm_cache.put(name, _llm_model_name(llm), getattr(llm, "temperature", None), prompt, content)
+            cache_keys.append(cache_key(llm, name))
             # Return raw patch text to the caller; do not attempt to apply
             # directly here because we may be operating on an isolated
             # workspace and the original file paths are not known.
@@ -651,6 +633,143 @@ def ask_llm(prompt: str, original_code_file: str, patched_code_file: str) -> str
     print("[!] All LLMs failed to produce a patch for this snippet.")
     return ""
 
+
+def _submit_llm_request(ex, llm, name: str, text: str, stream: bool = True):
+    """Submit one patch request on a dispatch session.
+
+    With LLM_STREAM the router / Ollama clients are streamed so obviously
+    non-diff replies are cut off early (see llm_stream); abandoning the
+    future on timeout also stops reading the stream. stream=False reads the
+    whole reply (replies that are not diffs, e.g. edit operations or the
+    YES/NO pre-flight); with LLM_ABORTABLE_INVOKE it is still read as a
+    stream, so abandoning it closes the response. Other clients get a plain
+    invoke, which an abandon can only detach.
+    """
+    message = llm_providers.human_message(text)
+    watch = stream and LLM_STREAM
+    if (watch or LLM_ABORTABLE_INVOKE) and name in STREAMING_PROVIDERS and hasattr(llm, "stream"):
+        cancel = threading.Event()
+
+        def run():
+            resp = llm_stream.stream_invoke(llm, [message], cancel=cancel, watch=watch)
+            if resp.stream_status != "exhausted":
+                print(f"[Debug] {name} stream stopped early: {resp.stream_status} ({resp.stream_reason}) "
+                      f"after {len(resp.content)} chars")
+            if resp.partial and not diff_model.parse(resp.content).is_valid():
+                # cut off mid-reply: the recount repair would make a wrong patch out of it
+                resp.content = ""
+            return resp
+
+        return ex.submit(run, on_abandon=cancel.set)
+    return ex.submit(lambda: llm.invoke([message]))
+
+
+def _static_timeouts() -> dict:
+    """Configured (upper-bound) timeouts per provider name, for health reports."""
+    return {"Gemini": LLM_TIMEOUT_GEMINI, "Qwen": LLM_TIMEOUT_QWEN, "Ollama": LLM_TIMEOUT_OLLAMA,
+            "HuggingFace_Router": LLM_TIMEOUT_HF, "HuggingFace_Router_2": LLM_TIMEOUT_HF}
+
+
+def _hedge_delay() -> float:
+    """Seconds to wait on the primary router before starting the secondary one.
+
+    LLM_HEDGE_DELAY may be a number of seconds or 'auto' (default), which uses
+    the primary router's learned p95 latency and falls back to
+    LLM_HEDGE_DEFAULT_DELAY until enough history exists.
+    """
+    raw = os.getenv("LLM_HEDGE_DELAY", "auto").strip().lower()
+    if raw != "auto":
+        try:
+            return max(0.0, float(raw))
+        except ValueError:
+            print(f"[!] Invalid LLM_HEDGE_DELAY={raw!r}; using learned delay")
+    p95 = llm_health.percentile("HuggingFace_Router", 95)
+    if p95 is not None:
+        return p95
+    return float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10"))
+
+
+def _is_valid_patch_response(content) -> bool:
+    """True when an LLM response can be turned into a patch that passes validate_patch."""
+    if not content or "diff --git" not in content:
+        return False
+    return diff_model.extract(content) is not None
+
+
+def _classify_patch_response(content, expect: str = "diff") -> str:
+    """Map a raw LLM response to a capability-registry outcome."""
+    if expect == "edits":
+        ops = edit_ops.parse_edits(content)
+        return "no_patch" if ops == [] else "valid_diff" if ops else "invalid"
+    if (content or "").strip() == "NO_PATCH":
+        return "no_patch"
+    if _is_valid_patch_response(content):
+        return "valid_diff"
+    return "invalid"
+
+
+def _hedged_router_call(routers, invoke, accept=None):
+    """Race the primary and secondary routers, starting the secondary only after a delay.
+
+    routers: [(llm, name, timeout), ...] with the primary first.
+    invoke: callable(llm, name, timeout) -> response object or None.
+    The secondary is started early if the primary fails fast, and the first
+    response passing validate_patch (or accept(content), if given) wins. The
+    loser's CancelToken is then fired: its dispatch session abandons the
+    request right away (closing a streamed response), a rate-limiter wait is
+    given up, and no health sample or journal record is written for it.
+    Returns (llm, name, content) or None.
+    """
+    accept = accept or _is_valid_patch_response
+    (llm1, name1, t1), (llm2, name2, t2) = routers[0], routers[1]
+    delay = _hedge_delay()
+    print(f"[Debug] Hedging {name1} -> {name2} after {delay:.1f}s")
+    # The racers only orchestrate: each invoke() enforces its own deadline on the
+    # shared dispatch pool, so these threads never outlive the router timeout and
+    # must not occupy dispatch-pool workers themselves.
+    ex = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    try:
+        invoke = response_journal.bind(rate_limiter.bind(invoke))
+        tokens = {}
+
+        def start(llm, name, timeout):
+            token = llm_dispatch.CancelToken()
+            fut = ex.submit(llm_dispatch.cancelling(token, invoke), llm, name, timeout)
+            tokens[fut] = token
+            return fut
+
+        pending = {start(llm1, name1, t1): (llm1, name1)}
+        hedged = False
+        deadline = time.time() + delay
+        while pending:
+            wait_for = max(0.0, deadline - time.time()) if not hedged else None
+            done, _ = concurrent.futures.wait(list(pending), timeout=wait_for,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                llm, name = pending.pop(fut)
+                try:
+                    resp = fut.result()
+                except Exception as e:
+                    print(f"[!] {name} failed during hedged invoke: {e}")
+                    resp = None
+                content = getattr(resp, "content", None) if resp is not None else None
+                if accept(content):
+                    for other in pending:
+                        other.cancel()
+                        tokens[other].cancel()
+                    if pending:
+                        print(f"[Debug] {name} won the hedge; abandoning {', '.join(n for _, n in pending.values())}")
+                    return llm, name, content
+                print(f"[Debug] {name} returned no valid patch during hedge")
+            if not hedged and (not pending or time.time() >= deadline):
+                hedged = True
+                print(f"[Debug] Starting hedged request on {name2}")
+                pending[start(llm2, name2, t2)] = (llm2, name2)
+        return None
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
 def run_patch_py(report_file, snippet_file, lang="py"):
     """Wrapper function to run the patch pipeline for Python code."""
     print(f"[*] Running patch pipeline for {lang}...")
@@ -663,43 +782,15 @@ def run_patch_py(report_file, snippet_file, lang="py"):
 
 
 def clean_patch_output(patch: str) -> str:
-    """Clean LLM output to a valid unified diff patch."""
-    if not patch:
-        return ""
+    """Clean LLM output to a valid unified diff patch ("" when none can be recovered)."""
+    return diff_model.extract(patch) or ""
 
-    # Remove markdown
-    patch = re.sub(r"^```diff", "", patch, flags=re.MULTILINE)
-    patch = re.sub(r"^```", "", patch, flags=re.MULTILINE)
-
-    valid_lines = []
-    for line in patch.splitlines():
-        line = line.rstrip()
-        if line.startswith("diff --git"):
-            parts = line.split()
-            if len(parts) != 4:
-                continue
-        if line.startswith(("diff --git", "--- ", "+++ ", "@@ ", "+", "-", " ")):
-            # Skip empty + or - lines
-            if line in ("+", "-"):
-                continue
-            valid_lines.append(line)
-
-    patch = "\n".join(valid_lines)
-
-    if not patch.startswith("diff --git"):
-        return ""
-
-    return patch.strip()
 
 def validate_patch(patch_text: str) -> bool:
+    """True for a well-formed unified diff: a/ b/ headers and located hunks whose counts match their bodies."""
     if not patch_text:
         return False
-    if ("diff --git" in patch_text 
-        and re.search(r"@@ -\d+,\d+ \+\d+,\d+ @@", patch_text) 
-        and "--- a/" in patch_text 
-        and "+++ b/" in patch_text):
-        return True
-    return False
+    return diff_model.parse(patch_text).is_valid()
 import difflib
 
 def apply_patch(original_file, patch_text, output_file):
@@ -725,10 +816,337 @@ def compare_files(original_file, patched_file):
     print('\n'.join(diff))
 
 
-def run_pipeline(report_file, snippet_file, lang="py", iteration: int = None, allowed_files: set = None):
+def _extract_valid_patch(raw_patch: str, label: str):
+    """Parse an LLM response once (diff_model), repair it and return the rendered patch, or None."""
+    patch = diff_model.parse(raw_patch).repair()
+    if not patch.is_valid():
+        return None
+    if patch.repairs:
+        print(f"[+] Repaired patch for {label}: {', '.join(patch.repairs)}")
+    return patch.render()
+
+
+def _generate_patch_for_snippet(i: int, snippet: str, report: str, dest_folder: Path,
+                                issue_index: IssueIndex = None, response_format: str = "diff") -> dict:
+    """Ask the LLMs for a patch for a single snippet and clean/validate the result.
+
+    When issue_index is given, the prompt carries only the findings relevant
+    to this snippet plus a global summary instead of the whole report.
+    With response_format="edits" the model returns JSON edit operations on
+    the numbered snippet lines and the diff is rendered locally (edit_ops).
+    Returns a result dict ({'index', 'header', 'status', 'latency_s', 'patch_text', ...})
+    so that concurrent callers can write patches in snippet order afterwards.
+    """
+    header = (snippet.splitlines()[0] if snippet.splitlines() else "").strip().rstrip("-").strip()
+    started = time.time()
+    print(f"[*] Processing snippet {i}...")
+
+    path, _ = _snippet_location(snippet)
+    if response_format == "edits" and not (path and edit_ops.snippet_lines(snippet)):
+        print(f"[Debug] Snippet {i} has no parsable location; asking for a diff instead of edits")
+        response_format = "diff"
+    full_prompt = BUG_FIX_PROMPT.format(code_snippet=snippet.strip(), analysis=report)
+    if issue_index is not None:
+        analysis = issue_index.context_for_snippet(snippet, lines=snippet_dedup.reported_lines(snippet))
+    else:
+        analysis = report
+    # Fit report context and snippet into the smallest router budget up front
+    # (analysis is trimmed before the snippet) instead of retrying on overflow.
+    if response_format == "edits":
+        prompt, fit = prompt_builder.fit_prompt(
+            EDIT_FIX_PROMPT, {"file_path": path, "analysis": analysis, "code_regions": edit_ops.numbered(snippet)},
+            provider=PATCH_PROVIDERS[0], budget=prompt_builder.budget_for_any(PATCH_PROVIDERS),
+            shrink_order=["analysis", "code_regions"])
+    else:
+        prompt, fit = prompt_builder.fit_prompt(
+            BUG_FIX_PROMPT, {"analysis": analysis, "code_snippet": snippet.strip()},
+            provider=PATCH_PROVIDERS[0], budget=prompt_builder.budget_for_any(PATCH_PROVIDERS),
+            shrink_order=["analysis", "code_snippet"])
+    print(f"[Debug] Prompt for snippet {i}: {len(full_prompt)} chars (~{estimate_tokens(full_prompt)} tokens) "
+          f"-> {len(prompt)} chars (~{estimate_tokens(prompt)} tokens)")
+
+    # Call LLM for patch suggestion (raw unified diff text or edit operations)
+    _last_ask.answered = []
+    _last_ask.cache_keys = []
+    raw_patch = ask_llm(prompt, "original_code.py", "patched_code.py", response_format)
+    answered = last_answered()
+    cache_keys = last_cache_keys()
+
+    if response_format == "edits":
+        patch_text = edit_ops.to_diff(raw_patch, snippet, path)
+        patch_text = patch_text if patch_text and validate_patch(patch_text) else None
+    else:
+        patch_text = _extract_valid_patch(raw_patch, f"snippet {i}")
+    if not patch_text:
+        print(f"[!] No valid patch produced for snippet {i}; journaling raw response for inspection and skipping.")
+        response_journal.record("raw_resp", raw_patch, header=header)
+        if RAW_RESP_FILES:
+            try:
+                raw_path = dest_folder / f"raw_resp_{i}.txt"
+                raw_path.write_text(raw_patch or "", encoding="utf-8")
+                print(f"[+] Saved raw LLM response to {raw_path}")
+            except Exception as e:
+                print(f"[!] Failed to save raw response: {e}")
+        patch_text = None
+
+    return {
+        "index": i,
+        "header": header,
+        "status": "patched" if patch_text else "no_patch",
+        "latency_s": round(time.time() - started, 3),
+        "prompt_tokens_est": estimate_tokens(prompt),
+        "prompt_tokens_full_est": estimate_tokens(full_prompt),
+        "prompt_trimmed": fit["trimmed"],
+        "patch_text": patch_text,
+        "llm_answered": answered,
+        "cache_keys": cache_keys,
+        "raw_text": None if patch_text else raw_patch,
+        "format": response_format,
+    }
+
+
+def _snippet_location(snippet: str):
+    """Return (path, reported_line) from a snippet header, or (None, None)."""
+    first = (snippet.splitlines()[0] if snippet.splitlines() else "").strip()
+    m = SNIPPET_HEADER_RE.match(first)
+    if not m:
+        return None, None
+    return m.group("path").strip(), int(m.group("line"))
+
+
+def _plan_batches(jobs: list, report: str, issue_index: IssueIndex, budget: int,
+                  template: str = BATCH_FIX_PROMPT) -> list:
+    """Group (index, snippet) jobs by source file into batches under a prompt-token budget.
+
+    Returns a list of job lists in first-seen order; snippets without a
+    parsable header, and files with a single snippet, stay on their own.
+    """
+    groups, order = {}, []
+    for job in jobs:
+        path, _ = _snippet_location(job[1])
+        key = os.path.normcase(path.replace("\\", "/")) if path else f"#{job[0]}"
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(job)
+
+    batches = []
+    for key in order:
+        current = []
+        for job in groups[key]:
+            if current and estimate_tokens(_build_batch_prompt(current + [job], report, issue_index,
+                                                               template)) > budget:
+                batches.append(current)
+                current = []
+            current.append(job)
+        if current:
+            batches.append(current)
+    return batches
+
+
+def _build_batch_prompt(members: list, report: str, issue_index: IssueIndex,
+                        template: str = BATCH_FIX_PROMPT) -> str:
+    path, _ = _snippet_location(members[0][1])
+    regions = []
+    lines = []
+    for i, snippet in members:
+        _, line = _snippet_location(snippet)
+        lines.extend(snippet_dedup.reported_lines(snippet))
+        start, _ = snippet_dedup.span(snippet)
+        body = snippet.splitlines()[1:]
+        while body and not body[-1].strip():
+            body.pop()
+        numbered = "\n".join(f"{start + n:>5} | {text}" for n, text in enumerate(body))
+        regions.append(f"## Region {i} (reported line {line})\n{numbered}")
+    if issue_index is not None:
+        analysis = issue_index.context_for_snippet(members[0][1], lines=lines)
+    else:
+        analysis = report
+    prompt, _ = prompt_builder.fit_prompt(
+        template, {"file_path": path, "analysis": analysis, "code_regions": "\n\n".join(regions)},
+        provider=PATCH_PROVIDERS[0], budget=prompt_builder.budget_for_any(PATCH_PROVIDERS),
+        shrink_order=["analysis", "code_regions"])
+    return prompt
+
+
+def _split_diff_hunks(patch_text: str):
+    """Split the first file of a unified diff into (header_lines, hunks).
+
+    Each hunk is (old_start, old_len, lines) with the @@ line first.
+    """
+    patch = diff_model.parse(patch_text)
+    if not patch.files:
+        return [], []
+    first = patch.files[0]
+    return first.header_lines(), [(h.old_start, h.old_len, h.render_lines()) for h in first.hunks if h.located]
+
+
+def _demux_hunks(hunks: list, members: list) -> dict:
+    """Assign each hunk of a batched diff to the snippet it most likely fixes.
+
+    Scored by the hunk's context/removed lines found in the snippet text, then
+    by line overlap with the snippet window, then by distance to it.
+    """
+    assigned = {i: [] for i, _ in members}
+    for hunk in hunks:
+        old_start, old_len, lines = hunk
+        old_end = old_start + max(old_len, 1) - 1
+        touched = [l[1:].strip() for l in lines[1:] if l[:1] in (" ", "-") and l[1:].strip()]
+        best, best_score = None, None
+        for i, snippet in members:
+            lo, hi = snippet_dedup.span(snippet)
+            body = {l.strip() for l in snippet.splitlines()[1:] if l.strip()}
+            content = sum(1 for t in touched if t in body)
+            overlap = max(0, min(hi, old_end) - max(lo, old_start) + 1)
+            distance = 0 if overlap else min(abs(old_start - hi), abs(old_end - lo))
+            score = (content, overlap, -distance)
+            if best_score is None or score > best_score:
+                best, best_score = i, score
+        assigned[best].append(hunk)
+    return assigned
+
+
+def _generate_patches_for_batch(members: list, report: str, dest_folder: Path,
+                                issue_index: IssueIndex = None, response_format: str = "diff") -> list:
+    """Ask for one multi-hunk diff covering several snippets of the same file.
+
+    The response is demultiplexed into per-snippet patches. If it does not
+    pass validate_patch, every member falls back to its own request. With
+    response_format="edits" the edit operations are split by line range
+    instead and each member's diff is rendered locally.
+    """
+    first = members[0][0]
+    path, _ = _snippet_location(members[0][1])
+    started = time.time()
+    print(f"[*] Processing batch of {len(members)} snippets from {path} (snippets {[i for i, _ in members]})...")
+
+    edits = response_format == "edits"
+    prompt = _build_batch_prompt(members, report, issue_index, EDIT_FIX_PROMPT if edits else BATCH_FIX_PROMPT)
+    _last_ask.answered = []
+    _last_ask.cache_keys = []
+    raw_patch = ask_llm(prompt, "original_code.py", "patched_code.py", response_format)
+    answered = last_answered()
+    cache_keys = last_cache_keys()
+    if edits:
+        header_lines, hunks = [], edit_ops.parse_edits(raw_patch) or []
+    else:
+        patch_text = _extract_valid_patch(raw_patch, f"batch {first}")
+        header_lines, hunks = _split_diff_hunks(patch_text) if patch_text else ([], [])
+    if not hunks:
+        print(f"[!] Batched response for {path} failed validation; falling back to per-snippet requests")
+        response_journal.record("raw_resp_batch", raw_patch, members=[i for i, _ in members])
+        if RAW_RESP_FILES:
+            try:
+                (dest_folder / f"raw_resp_batch_{first}.txt").write_text(raw_patch or "", encoding="utf-8")
+            except Exception as e:
+                print(f"[!] Failed to save raw response: {e}")
+        results = [_generate_patch_for_snippet(i, snippet, report, dest_folder, issue_index, response_format)
+                   for i, snippet in members]
+        for res in results:
+            res["batch"] = first
+            res["batch_fallback"] = True
+        return results
+
+    latency = round(time.time() - started, 3)
+    share = estimate_tokens(prompt) // len(members)
+    if edits:
+        assigned = {i: edit_ops.edits_for_span(raw_patch, *snippet_dedup.span(snippet)) for i, snippet in members}
+    else:
+        assigned = _demux_hunks(hunks, members)
+    results = []
+    for i, snippet in members:
+        member_patch = None
+        if assigned[i] and edits:
+            candidate = edit_ops.diff_from_edits(assigned[i], snippet, path)
+            member_patch = candidate if candidate and validate_patch(candidate) else None
+        elif assigned[i]:
+            candidate = "\n".join(header_lines + [l for h in assigned[i] for l in h[2]])
+            member_patch = candidate if validate_patch(candidate) else None
+        results.append({
+            "index": i,
+            "header": (snippet.splitlines()[0] if snippet.splitlines() else "").strip().rstrip("-").strip(),
+            "status": "patched" if member_patch else "no_patch",
+            "latency_s": latency,
+            "prompt_tokens_est": share,
+            "prompt_tokens_full_est": estimate_tokens(BUG_FIX_PROMPT.format(code_snippet=snippet.strip(), analysis=report)),
+            "batch": first,
+            "hunks": len(assigned[i]),
+            "patch_text": member_patch,
+            "llm_answered": answered,
+            "cache_keys": cache_keys,
+            "format": response_format,
+        })
+    print(f"[+] Batch {first}: {len(hunks)} {'edits' if edits else 'hunks'} demuxed to "
+          f"{sum(1 for r in results if r['patch_text'])}/{len(members)} snippets")
+    return results
+
+
+def response_format_stats(snippet_results: list) -> dict:
+    """Valid-patch rate per response format over the snippets a provider answered.
+
+    {"diff": {"answered", "patched", "no_patch", "invalid", "valid_rate"}, "edits": {...}};
+    snippets skipped by the failure memo or lost to outages are not counted.
+    """
+    stats = {}
+    for res in snippet_results or []:
+        if not res.get("format") or not res.get("llm_answered"):
+            continue
+        entry = stats.setdefault(res["format"], {"answered": 0, "patched": 0, "no_patch": 0, "invalid": 0})
+        entry["answered"] += 1
+        if res.get("status") == "patched":
+            entry["patched"] += 1
+        else:
+            entry["no_patch" if res.get("reply") == "no_patch" else "invalid"] += 1
+    for entry in stats.values():
+        entry["valid_rate"] = round(entry["patched"] / entry["answered"], 3)
+    return stats
+
+
+def workspace_for(lang: str, repo_dir=None):
+    """The workspace patches of a language refer to (repo_dir, else dynamic_tester's default), if it exists."""
+    repo = Path(repo_dir) if repo_dir else DEFAULT_REPOS.get(lang)
+    return repo if repo is not None and repo.exists() else None
+
+
+def compose_patches(lang: str, repo_dir, dest_folder: Path, snippet_results: list, iteration: int = None):
+    """Combine this iteration's patches into one patch for the workspace (None when disabled/unavailable)."""
+    repo = workspace_for(lang, repo_dir)
+    names = [res["patch"] for res in snippet_results or [] if res.get("patch")]
+    if not PATCH_COMPOSE or repo is None:
+        return None
+    try:
+        verify_cmds = patch_verify.commands(lang) if PATCH_VERIFY else None
+        return patch_compose.compose_iteration(repo, dest_folder, names, iteration, verify_cmds=verify_cmds)
+    except Exception as e:
+        print(f"[!] Patch composition failed: {e}")
+        return None
+
+
+def run_pipeline(report_file, snippet_file, lang="py", iteration: int = None, allowed_files: set = None,
+                 concurrency: int = None, batch_by_file: bool = None, response_format: str = None,
+                 workspace=None):
     """
     Run patch pipeline for snippets, saving each patch separately.
     lang: "py" for Python, "cpp" for C++
+    concurrency: max number of snippets sent to the LLMs in parallel
+      (defaults to LLM_CONCURRENCY / --llm-concurrency). Patch files are
+      always written in snippet order, so naming stays deterministic.
+    batch_by_file: send snippets of the same source file as one multi-hunk
+      request (defaults to LLM_BATCH_BY_FILE / --llm-batch); batches are
+      capped at LLM_BATCH_TOKEN_BUDGET estimated prompt tokens.
+    Duplicate snippets and overlapping windows of one file are merged first
+    (SNIPPET_DEDUP=0 disables it), so one request is sent per unique region.
+    response_format: "diff" or "edits" (defaults to LLM_RESPONSE_FORMAT /
+      --llm-format); see response_format_stats() for the per-mode valid rate.
+    workspace: repo the patches refer to; patches already rejected there
+      (patch_store: same fingerprint, same content of the touched files) are
+      not written and get status "known_rejected", which counts as a failure
+      in failure_memo and drops the cached LLM answer. An identical patch from
+      a later snippet of the same run gets status "duplicate" (duplicate_of).
+
+    Returns a list of per-snippet result dicts (index, header, status,
+    latency_s, patch) that callers attach to their iteration report; merged
+    regions also carry fan_in, members and findings.
     """
     # Choose target directory based on language
     target_folder = PATCHES_DIR / f"patches_{lang}"
@@ -736,7 +1154,7 @@ def run_pipeline(report_file, snippet_file, lang="py", iteration: int = None, al
 
     if not report_file.exists() or not snippet_file.exists():
         print("[!] Report or snippet not found.")
-        return
+        return []
 
     report = report_file.read_text(encoding="utf-8")
     snippets = snippet_file.read_text(encoding="utf-8").split("--- ")
@@ -770,51 +1188,149 @@ def run_pipeline(report_file, snippet_file, lang="py", iteration: int = None, al
     else:
         snippets_to_iterate = snippets[1:]
 
-    for i, snippet in enumerate(snippets_to_iterate, start=1):
-        print(f"[*] Processing snippet {i}...")
-
-        prompt = BUG_FIX_PROMPT.format(code_snippet=snippet.strip(), analysis=report)
-
-        # Call LLM for patch suggestion (raw unified diff text)
-        raw_patch = ask_llm(prompt, "original_code.py", "patched_code.py")
-
-        # Clean and validate the returned patch
-        patch_text = clean_patch_output(raw_patch)
-
-        # If initial validation fails, try a more aggressive sanitizer
-        if not validate_patch(patch_text):
-            alt = sanitize_patch(raw_patch or "")
-            if alt and validate_patch(alt):
-                print(f"[+] Sanitizer produced a valid patch for snippet {i}")
-                patch_text = alt
-            else:
-                # As a last-ditch cleanup, try to repair header prefixes and remove stray markers
+    workers = max(1, int(concurrency if concurrency is not None else LLM_CONCURRENCY))
+    workers = min(workers, max(1, len(snippets_to_iterate)))
+    print(f"[*] Dispatching {len(snippets_to_iterate)} snippets with LLM concurrency={workers}")
+
+    # Index the report once per run so each prompt only carries the findings
+    # relevant to its snippet (disable with REPORT_SLICING=0).
+    issue_index = IssueIndex(report) if REPORT_SLICING else None
+    if issue_index is not None:
+        print(f"[*] Indexed {issue_index.total} report findings across {len(issue_index.by_file)} files")
+
+    response_format = (response_format or LLM_RESPONSE_FORMAT).strip().lower()
+    if response_format not in RESPONSE_FORMATS:
+        print(f"[!] Unknown response format {response_format!r}; using diff")
+        response_format = "diff"
+
+    # One timestamp per run keeps patch_{iteration}_{ts}_{i}.diff names stable
+    # regardless of the order in which concurrent requests complete.
+    ts = int(time.time())
+    jobs = list(enumerate(snippets_to_iterate, start=1))
+    fan_in = {}
+    if SNIPPET_DEDUP:
+        jobs, fan_in = snippet_dedup.dedupe(jobs)
+        if len(jobs) < len(snippets_to_iterate):
+            print(f"[*] Dedup: {len(snippets_to_iterate)} snippets -> {len(jobs)} unique regions "
+                  f"(max fan-in {max((len(f['members']) for f in fan_in.values()), default=1)})")
+    # Skip snippets that keep failing with unchanged inputs (failure_memo)
+    # (keyed per response format: a snippet the diff mode gives up on may still work as edits)
+    memo_lang = lang if response_format == "diff" else f"{lang}:{response_format}"
+    memo_keys = {i: failure_memo.snippet_key(snippet, memo_lang) for i, snippet in jobs}
+    held_back, active = [], []
+    for job in jobs:
+        decision = failure_memo.check(memo_keys[job[0]])
+        (active if decision == "send" else held_back).append((job, decision))
+    jobs = [job for job, _ in active]
+    if held_back:
+        print(f"[*] Failure memo: holding back {len(held_back)} snippets "
+              f"({sum(1 for _, d in held_back if d == 'deferred')} deferred, "
+              f"{sum(1 for _, d in held_back if d == 'backoff')} in back-off)")
+    if batch_by_file if batch_by_file is not None else LLM_BATCH_BY_FILE:
+        units = _plan_batches(jobs, report, issue_index, LLM_BATCH_TOKEN_BUDGET,
+                              EDIT_FIX_PROMPT if response_format == "edits" else BATCH_FIX_PROMPT)
+        print(f"[*] Batching by file: {len(jobs)} snippets -> {len(units)} LLM requests")
+    else:
+        units = [[job] for job in jobs]
+
+    def run_unit(unit):
+        # tag journaled responses with the snippet they were generated for
+        with response_journal.context(snippet=unit[0][0], iteration=iteration, lang=lang):
+            if len(unit) == 1:
+                return [_generate_patch_for_snippet(unit[0][0], unit[0][1], report, dest_folder, issue_index,
+                                                    response_format)]
+            return _generate_patches_for_batch(unit, report, dest_folder, issue_index, response_format)
+
+    results = []
+    if workers == 1:
+        for unit in units:
+            results.extend(run_unit(unit))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(rate_limiter.bind(run_unit), unit) for unit in units]
+            for unit, fut in zip(units, futures):
                 try:
-                    repaired = (raw_patch or "").replace('\r\n', '\n')
-                    # Ensure ---/+++ have a/ and b/ prefixes when missing
-                    repaired = re.sub(r"^---\s+(?!a/)(.+)$", r"--- a/\1", repaired, flags=re.MULTILINE)
-                    repaired = re.sub(r"^\+\+\+\s+(?!b/)(.+)$", r"+++ b/\1", repaired, flags=re.MULTILINE)
-                    repaired = re.sub(r"^```.*$", "", repaired, flags=re.MULTILINE)
-                except Exception:
-                    repaired = raw_patch or ""
-
-                alt2 = clean_patch_output(repaired)
-                if alt2 and validate_patch(alt2):
-                    print(f"[+] Repaired patch for snippet {i} using header fixes")
-                    patch_text = alt2
-                else:
-                    print(f"[!] No valid patch produced for snippet {i}; saving raw response for inspection and skipping.")
-                    # Save raw LLM output for debugging
-                    try:
-                        raw_path = dest_folder / f"raw_resp_{i}.txt"
-                        raw_path.write_text(raw_patch or "", encoding="utf-8")
-                        print(f"[+] Saved raw LLM response to {raw_path}")
-                    except Exception as e:
-                        print(f"[!] Failed to save raw response: {e}")
-                    continue
+                    results.extend(fut.result())
+                except Exception as e:
+                    print(f"[!] Snippets {[i for i, _ in unit]} failed: {e}")
+                    results.extend({"index": i, "header": "", "status": "error", "latency_s": None, "patch_text": None}
+                                   for i, _ in unit)
+    for (i, snippet), decision in held_back:
+        memo = failure_memo.get(memo_keys[i])
+        results.append({"index": i,
+                        "header": (snippet.splitlines()[0] if snippet.splitlines() else "").strip().rstrip("-").strip(),
+                        "status": decision, "latency_s": 0.0, "patch_text": None,
+                        "failures": memo.get("failures", 0), "last_reason": memo.get("last_reason")})
+    results.sort(key=lambda r: r["index"])
+    # A patch identical to one rejected before in the current content of its files, or to
+    # one an earlier snippet of this run produced, is not written and is no success
+    snapshot = patch_apply.Snapshot(workspace) if workspace and patch_store.ENABLED else None
+    # stored verify verdicts only count under the build/test commands in use now
+    verify_cmds = patch_verify.commands(lang) if PATCH_VERIFY else None
+    cmds = patch_store.commands_hash(verify_cmds["build"], verify_cmds["test"]) if verify_cmds else None
+    first_with = {}
+    for res in results:
+        if res["status"] != "patched" or not patch_store.ENABLED:
+            continue
+        i = res["index"]
+        fp, ctx = patch_store.key(snapshot, res["patch_text"]) if snapshot else (patch_store.fingerprint(res["patch_text"]), None)
+        if not fp:
+            continue
+        res["fingerprint"] = fp[:12]
+        res["seen_before"] = patch_store.seen(fp, res.get("header", ""))
+        known = patch_store.rejected(fp, ctx, cmds)
+        if known:
+            res["status"], res["known_rejected"] = "known_rejected", known
+            print(f"[*] Snippet {i}: identical patch was rejected before ({known}); not written")
+        elif fp in first_with:
+            res["status"], res["duplicate_of"] = "duplicate", first_with[fp]
+            print(f"[*] Snippet {i}: same patch as snippet {first_with[fp]}; not written again")
+        else:
+            first_with[fp] = i
+    patch_store.flush()
+
+    for res in results:
+        key = memo_keys.get(res["index"])
+        raw_text = res.pop("raw_text", None)
+        cache_keys = res.pop("cache_keys", None)
+        if key is None or res["status"] in ("deferred", "backoff"):
+            continue
+        if res["status"] == "patched":
+            failure_memo.record_success(key)
+        elif res["status"] == "known_rejected":
+            # the cache would hand back the same answer forever: ask the provider again next time
+            llm_cache.discard(cache_keys)
+            failure_memo.record_failure(key, "known_rejected", res.get("header", ""), res.get("patch_text") or "")
+        elif res["status"] == "no_patch" and res.get("llm_answered"):
+            # only real NO_PATCH / invalid answers count; outages and open breakers do not
+            if res.get("format") == "edits":
+                reason = "no_patch" if edit_ops.parse_edits(raw_text) == [] else "invalid"
+            else:
+                reason = "no_patch" if not (raw_text or "").strip() or raw_text.strip().startswith("NO_PATCH") else "invalid"
+            res["reply"] = reason
+            failure_memo.record_failure(key, reason, res.get("header", ""), raw_text or "")
+    for res in results:
+        merged = fan_in.get(res["index"])
+        if merged and len(merged["members"]) > 1:
+            res["fan_in"] = len(merged["members"])
+            res["members"] = merged["members"]
+            res["findings"] = merged["lines"]
+
+    sent = sum(r.get("prompt_tokens_est") or 0 for r in results)
+    full = sum(r.get("prompt_tokens_full_est") or 0 for r in results)
+    if results:
+        print(f"[*] Prompt tokens (est.) this run: {sent} sent vs {full} with the full report")
+
+    snippet_report = []
+    for res in results:
+        i = res["index"]
+        patch_text = res.pop("patch_text", None)
+        res["patch"] = None
+        snippet_report.append(res)
+        if res["status"] != "patched":
+            continue
 
         # Write the patch into the destination folder with a unique name (iteration + timestamp)
-        ts = int(time.time())
         if iteration is not None:
             patch_name = f"patch_{iteration}_{ts}_{i}.diff"
         else:
@@ -822,127 +1338,24 @@ def run_pipeline(report_file, snippet_file, lang="py", iteration: int = None, al
         patch_path = dest_folder / patch_name
         try:
             patch_path.write_text(patch_text, encoding="utf-8")
+            res["patch"] = patch_name
             print(f"[+] Saved patch to {patch_path}")
         except Exception as e:
             print(f"[!] Failed to write patch file {patch_path}: {e}")
 
+    return snippet_report
 
 
 def sanitize_patch(raw_patch: str) -> str:
     """
-    Remove markdown code blocks, explanations, and any text after the diff body.
-    Ensures only valid unified diff remains.
+    Extract the unified diff from an LLM response (markdown fences and prose
+    around it are dropped, see diff_model.extract); empty string if there is none.
     """
-    lines = raw_patch.strip().splitlines()
-    clean_lines = []
-    inside_patch = False
-
-    for line in lines:
-        # Start when we see the diff header
-        if line.startswith("diff --git"):
-            inside_patch = True
-            clean_lines = [line]
-            continue
-        if not inside_patch:
-            continue
-
-        # Stop when explanation or markdown starts
-        if line.strip().startswith("Explanation:") or line.strip().startswith("```"):
-            break
+    return diff_model.extract(raw_patch) or ""
 
-        # Accept only valid diff lines
-        if line.startswith(("index ", "--- ", "+++ ", "@@", "+", "-", " ")):
-            clean_lines.append(line)
 
-    return "\n".join(clean_lines).strip()
-
-
-def aggressive_sanitize(raw_patch: str) -> str:
-    """
-    Try several heuristics to extract a unified diff from noisy LLM output.
-    Returns a cleaned unified-diff string or empty string when unable.
-    """
-    if not raw_patch:
-        return ""
-    text = raw_patch.replace('\r\n', '\n')
-
-    # 1) If it already looks valid, return early
-    if validate_patch(text):
-        return text
-
-    # 2) Try to extract the first block that contains @@@ or ---/+++ lines
-    lines = text.splitlines()
-    start = None
-    end = None
-    for idx, line in enumerate(lines):
-        if line.startswith("diff --git") or line.startswith("--- "):
-            start = idx
-            break
-    if start is None:
-        # Try to locate a hunk header
-        for idx, line in enumerate(lines):
-            if line.startswith("@@ "):
-                # try to find filenames above it
-                # look back for ---/+++ lines
-                j = idx - 1
-                while j >= 0 and not lines[j].startswith("--- ") and not lines[j].startswith("diff --git"):
-                    j -= 1
-                start = j if j >= 0 else idx
-                break
-
-    if start is None:
-        return ""
-
-    # find end as next blank line after hunks or end of file
-    for j in range(start, len(lines)):
-        # stop at a line that likely begins a commentary block after patch
-        if lines[j].strip().startswith("Explanation:") or lines[j].strip().startswith("Note:"):
-            end = j
-            break
-    if end is None:
-        end = len(lines)
-
-    candidate = "\n".join(lines[start:end])
-
-    # Ensure headers have a/ and b/ prefixes
-    candidate = re.sub(r"^---\s+(?!a/)(.+)$", r"--- a/\1", candidate, flags=re.MULTILINE)
-    candidate = re.sub(r"^\+\+\+\s+(?!b/)(.+)$", r"+++ b/\1", candidate, flags=re.MULTILINE)
-
-    # Remove markdown fences
-    candidate = re.sub(r"^```.*$", "", candidate, flags=re.MULTILINE)
-
-    if validate_patch(candidate):
-        return candidate
-
-    # Fallback: attempt to reconstruct simple unified diff from @@ hunks by adding fake headers
-    hunks = []
-    cur_hunk = []
-    saw_hunk = False
-    for line in candidate.splitlines():
-        if line.startswith("@@ "):
-            saw_hunk = True
-            cur_hunk = [line]
-            hunks.append(cur_hunk)
-        elif saw_hunk:
-            cur_hunk.append(line)
-
-    if not hunks:
-        return ""
-
-    # try to infer filenames from context
-    fname = None
-    m = re.search(r"\b([\w\-_/\\]+\.py)\b", raw_patch)
-    if m:
-        fname = m.group(1)
-    else:
-        fname = "unknown.py"
-
-    header = f"diff --git a/{fname} b/{fname}\n--- a/{fname}\n+++ b/{fname}\n"
-    rebuilt = header + "\n".join(["\n".join(h) for h in hunks])
-    if validate_patch(rebuilt):
-        return rebuilt
-
-    return ""
+# diff_model.extract already applies every heuristic the old fallback had
+aggressive_sanitize = sanitize_patch
 
 
 def apply_rule_based_fixes(repo_dir: str, report_path: Path):
@@ -1357,7 +1770,11 @@ def run_iterative_fix_py(max_iters: int = 5, repo_dir: str = None):
                 allowed_files.add(os.path.basename(fname))
 
         # This will produce sanitized patches into agent/patches_py_fixed
-        run_pipeline(REPORT_PY, SNIPPETS_PY, lang="py", iteration=iteration, allowed_files=allowed_files)
+        llm_started = time.time()
+        snippet_results = run_pipeline(REPORT_PY, SNIPPETS_PY, lang="py", iteration=iteration, allowed_files=allowed_files,
+                                       workspace=workspace_for("py", repo_dir))
+        llm_wall_s = round(time.time() - llm_started, 3)
+        composition = compose_patches("py", repo_dir, dest_folder, snippet_results, iteration)
 
         # 3) Run dynamic tester which will attempt to apply patches and run runtime tests
         print("[*] Running dynamic tester to apply patches and test runtime behavior")
@@ -1413,6 +1830,21 @@ def run_iterative_fix_py(max_iters: int = 5, repo_dir: str = None):
             # patches_applied is an integer number of successfully applied patches
             "patches_applied": patches_applied,
             "patches": sorted(list(new_patches)),
+            # per-snippet LLM outcome and latency for this iteration's patch stage
+            "snippet_results": snippet_results,
+            "response_format": response_format_stats(snippet_results),
+            # per-file merge of this iteration's patches: merged/duplicate/queued/dropped/stale
+            "composition": composition,
+            "llm_wall_s": llm_wall_s,
+            # shared LLM dispatch pool: queue depth / in-flight / detached requests
+            "llm_dispatch": llm_dispatch.stats(),
+            "http_pool": http_pool.stats(),
+            "llm_stream": llm_stream.stats(),
+            # breaker state, latency percentiles/histogram and adaptive timeout per provider
+            "provider_health": llm_health.snapshot(_static_timeouts()),
+            "rate_limits": rate_limiter.stats(),
+            "response_journal": response_journal.stats(),
+            "patch_store": patch_store.stats(),
             # keep raw text for logs/debug but provide a cleaned version for UI consumption
             "dynamic_report_text": dyn_report_text_clean,
             "dynamic_report_raw": dyn_report_text,
@@ -1569,7 +2001,11 @@ def run_iterative_fix_cpp(max_iters: int = 5, repo_dir: str = None):
 
         print(f"[*] Generating candidate patches for files: {sorted(allowed_files)}")
         # This will produce sanitized patches into agent/patches/patches_cpp_fixed
-        run_pipeline(REPORT_CPP, SNIPPETS_CPP, lang="cpp", iteration=iteration, allowed_files=allowed_files)
+        llm_started = time.time()
+        snippet_results = run_pipeline(REPORT_CPP, SNIPPETS_CPP, lang="cpp", iteration=iteration, allowed_files=allowed_files,
+                                       workspace=workspace_for("cpp", repo_dir))
+        llm_wall_s = round(time.time() - llm_started, 3)
+        composition = compose_patches("cpp", repo_dir, BASE_DIR / "patches" / "patches_cpp_fixed", snippet_results, iteration)
 
         # 3) Run dynamic tester to apply patches and test runtime behavior
         print("[*] Running dynamic tester to apply patches and test runtime behavior")
@@ -1599,6 +2035,20 @@ def run_iterative_fix_cpp(max_iters: int = 5, repo_dir: str = None):
             "dynamic_report_text": dyn_report_text,
             "patches_produced": len(list((BASE_DIR / 'patches' / 'patches_cpp_fixed').glob('patch_*.diff'))) if (BASE_DIR / 'patches' / 'patches_cpp_fixed').exists() else 0,
             "patches_applied": patches_applied,
+            "snippet_results": snippet_results,
+            "response_format": response_format_stats(snippet_results),
+            # per-file merge of this iteration's patches: merged/duplicate/queued/dropped/stale
+            "composition": composition,
+            "llm_wall_s": llm_wall_s,
+            # shared LLM dispatch pool: queue depth / in-flight / detached requests
+            "llm_dispatch": llm_dispatch.stats(),
+            "http_pool": http_pool.stats(),
+            "llm_stream": llm_stream.stats(),
+            # breaker state, latency percentiles/histogram and adaptive timeout per provider
+            "provider_health": llm_health.snapshot(_static_timeouts()),
+            "rate_limits": rate_limiter.stats(),
+            "response_journal": response_journal.stats(),
+            "patch_store": patch_store.stats(),
         }
         reports.append(report_entry)
 
@@ -1790,7 +2240,11 @@ def run_iterative_fix_cpp(max_iters: int = 5, repo_dir: str = None):
             print(f"[!] C++ rule-based fixer failed: {e}")
 
         # This will produce sanitized patches into agent/patches/patches_cpp_fixed
-        run_pipeline(REPORT_CPP, SNIPPETS_CPP, lang="cpp", iteration=iteration)
+        llm_started = time.time()
+        snippet_results = run_pipeline(REPORT_CPP, SNIPPETS_CPP, lang="cpp", iteration=iteration,
+                                       workspace=workspace_for("cpp", repo_dir))
+        llm_wall_s = round(time.time() - llm_started, 3)
+        composition = compose_patches("cpp", repo_dir, dest_folder, snippet_results, iteration)
 
         # 3) Run dynamic tester which will attempt to apply patches and run runtime tests
         print("[*] Running dynamic tester to apply patches and test runtime behavior")
@@ -1844,6 +2298,21 @@ def run_iterative_fix_cpp(max_iters: int = 5, repo_dir: str = None):
             # patches_applied stored as integer for UI
             "patches_applied": patches_applied,
             "patches": sorted(list(new_patches)),
+            # per-snippet LLM outcome and latency for this iteration's patch stage
+            "snippet_results": snippet_results,
+            "response_format": response_format_stats(snippet_results),
+            # per-file merge of this iteration's patches: merged/duplicate/queued/dropped/stale
+            "composition": composition,
+            "llm_wall_s": llm_wall_s,
+            # shared LLM dispatch pool: queue depth / in-flight / detached requests
+            "llm_dispatch": llm_dispatch.stats(),
+            "http_pool": http_pool.stats(),
+            "llm_stream": llm_stream.stats(),
+            # breaker state, latency percentiles/histogram and adaptive timeout per provider
+            "provider_health": llm_health.snapshot(_static_timeouts()),
+            "rate_limits": rate_limiter.stats(),
+            "response_journal": response_journal.stats(),
+            "patch_store": patch_store.stats(),
             # keep raw text for logs/debug but provide a cleaned version for UI consumption
             "dynamic_report_text": dyn_report_text_clean,
             "dynamic_report_raw": dyn_report_text,
@@ -1972,9 +2441,10 @@ def classify_intent(user_input: str) -> str:
         return 'exit'
     # If keywords couldn't decide, try the LLMs as a last resort
     try:
-        for llm, name in [(gemini_llm, "Gemini"), (qwen_llm, "Qwen"), (ollama_llm, "Ollama")]:
+        for name in ("Gemini", "Qwen", "Ollama"):
+            llm = get_llm(name)
             if llm:
-                resp = llm.invoke([HumanMessage(content=INTENT_PROMPT + f"\n\nUser: {user_input}")])
+                resp = llm.invoke([llm_providers.human_message(INTENT_PROMPT + f"\n\nUser: {user_input}")])
                 intent = getattr(resp, 'content', str(resp)).strip().lower()
                 if intent in ["static_cpp", "static_py", "patch_cpp", "patch_py", "dynamic_cpp", "dynamic_py", "exit"]:
                     print(f"[AI Intent] {intent} (via {name})")
@@ -2039,10 +2509,26 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="AI Agent runner")
     parser.add_argument("--cmd", type=str, help="Run single command and exit (e.g. --cmd \"patch cpp\")")
     parser.add_argument("--no-llm", action="store_true", help="Skip remote LLM calls (debug/offline)")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Bypass cached LLM responses and force regeneration (env: LLM_CACHE_BYPASS=1)")
+    parser.add_argument("--llm-concurrency", type=int, default=None,
+                        help="Number of snippets sent to the LLMs in parallel (env: LLM_CONCURRENCY)")
+    parser.add_argument("--llm-batch", action="store_true",
+                        help="Send snippets of the same file as one multi-hunk request (env: LLM_BATCH_BY_FILE=1)")
+    parser.add_argument("--llm-format", choices=RESPONSE_FORMATS, default=None,
+                        help="Ask for unified diffs or JSON edit operations (env: LLM_RESPONSE_FORMAT)")
     args = parser.parse_args()
 
     if args.no_llm:
         SKIP_LLM = True
+    if args.no_llm_cache:
+        llm_cache.set_bypass(True)
+    if args.llm_concurrency:
+        LLM_CONCURRENCY = max(1, args.llm_concurrency)
+    if args.llm_batch:
+        LLM_BATCH_BY_FILE = True
+    if args.llm_format:
+        LLM_RESPONSE_FORMAT = args.llm_format
 
     if args.cmd:
         # Run a single command non-interactively and exit
@@ -0,0 +1,212 @@
+"""Content-addressed on-disk cache for LLM responses.
+
+Entries are keyed by (provider, model, temperature, sha256(prompt)) and kept in
+a single SQLite file with zlib-compressed bodies. Old or excess entries are
+evicted least-recently-used first once the store exceeds LLM_CACHE_MAX_MB or an
+entry is older than LLM_CACHE_MAX_AGE_DAYS.
+
+Set LLM_CACHE_BYPASS=1 (or call set_bypass(True), e.g. via
+`lc_pipeline.py --no-llm-cache`) to force regeneration; responses produced
+while bypassing are still stored so the next normal run reuses them.
+set_bypass(True, workspace=ws) limits the bypass to calls made under that
+workspace (a forced re-upload) without affecting concurrent uploads.
+
+Hit/miss counters are kept process-wide and per workspace
+(rate_limiter.current_workspace()), so concurrent uploads each report their
+own counters.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import rate_limiter
+
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(Path(__file__).resolve().parent / "patches" / "llm_cache.sqlite3")))
+CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024)
+CACHE_MAX_AGE_S = int(float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "14")) * 86400)
+# Run eviction after this many writes (eviction scans the whole table)
+EVICT_EVERY = 25
+# Per-workspace counters kept for this many most recent workspaces
+MAX_WORKSPACES = 256
+
+_bypass = os.getenv("LLM_CACHE_BYPASS", "0") in ("1", "true", "True")
+_bypass_workspaces = set()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+_by_workspace = {}
+_puts_since_evict = 0
+
+
+def set_bypass(flag: bool = True, workspace: str = None):
+    """Enable/disable cache reads (writes still happen), globally or for one workspace."""
+    global _bypass
+    if workspace is None:
+        _bypass = bool(flag)
+    elif flag:
+        _bypass_workspaces.add(workspace)
+    else:
+        _bypass_workspaces.discard(workspace)
+
+
+def bypassed() -> bool:
+    """True when cache reads are off for the current thread's workspace."""
+    return _bypass or rate_limiter.current_workspace() in _bypass_workspaces
+
+
+def cache_key(provider: str, model, temperature, prompt: str) -> str:
+    """Return the content address for a request."""
+    prompt_hash = hashlib.sha256((prompt or "").encode("utf-8", errors="ignore")).hexdigest()
+    raw = f"{provider}\x00{model}\x00{temperature}\x00{prompt_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(CACHE_PATH), timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        " key TEXT PRIMARY KEY, provider TEXT, model TEXT, temperature TEXT,"
+        " body BLOB, size INTEGER, created REAL, last_access REAL)"
+    )
+    return conn
+
+
+def _bump(name: str, n: int = 1):
+    ws = rate_limiter.current_workspace()
+    with _lock:
+        _stats[name] += n
+        counters = _by_workspace.get(ws)
+        if counters is None:
+            if len(_by_workspace) >= MAX_WORKSPACES:
+                _by_workspace.pop(next(iter(_by_workspace)))
+            counters = _by_workspace[ws] = dict.fromkeys(_stats, 0)
+        counters[name] += n
+
+
+def get(provider: str, model, temperature, prompt: str, bypass: bool = None):
+    """Return the cached response text or None on miss/bypass.
+
+    bypass=None follows set_bypass() / LLM_CACHE_BYPASS for the current workspace.
+    """
+    if bypassed() if bypass is None else bypass:
+        _bump("bypassed")
+        return None
+    key = cache_key(provider, model, temperature, prompt)
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT body, created FROM entries WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (CACHE_MAX_AGE_S and now - row[1] > CACHE_MAX_AGE_S):
+                _bump("misses")
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        finally:
+            conn.close()
+        _bump("hits")
+        return zlib.decompress(row[0]).decode("utf-8")
+    except Exception as e:
+        print(f"[Debug] LLM cache read failed: {e}")
+        _bump("misses")
+        return None
+
+
+def put(provider: str, model, temperature, prompt: str, content: str):
+    """Store a response; triggers LRU/age eviction every EVICT_EVERY writes."""
+    global _puts_since_evict
+    if not content:
+        return
+    key = cache_key(provider, model, temperature, prompt)
+    body = zlib.compress(content.encode("utf-8"))
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, provider, model, temperature, body, size, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, str(model), str(temperature), body, len(body), now, now),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        _bump("stores")
+    except Exception as e:
+        print(f"[Debug] LLM cache write failed: {e}")
+        return
+    with _lock:
+        _puts_since_evict += 1
+        due = _puts_since_evict >= EVICT_EVERY
+        if due:
+            _puts_since_evict = 0
+    if due:
+        evict()
+
+
+def discard(keys) -> int:
+    """Drop entries by cache_key() so the next identical request asks the provider again."""
+    keys = [(k,) for k in keys or ()]
+    if not keys:
+        return 0
+    try:
+        conn = _connect()
+        try:
+            cur = conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+            conn.commit()
+            return cur.rowcount or 0
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[Debug] LLM cache discard failed: {e}")
+        return 0
+
+
+def evict() -> int:
+    """Drop expired entries, then least-recently-used ones until under the size cap."""
+    removed = 0
+    try:
+        conn = _connect()
+        try:
+            if CACHE_MAX_AGE_S:
+                cur = conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - CACHE_MAX_AGE_S,))
+                removed += cur.rowcount or 0
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > CACHE_MAX_BYTES:
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC"):
+                    if total <= CACHE_MAX_BYTES:
+                        break
+                    victims.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+                removed += len(victims)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[Debug] LLM cache eviction failed: {e}")
+    if removed:
+        _bump("evictions", removed)
+    return removed
+
+
+def stats(workspace: str = None) -> dict:
+    """Snapshot of the hit/miss counters of one workspace, or process-wide if None."""
+    with _lock:
+        if workspace is None:
+            return dict(_stats)
+        return dict(_by_workspace.get(workspace) or dict.fromkeys(_stats, 0))
+
+
+def stats_since(before: dict, workspace: str = None) -> dict:
+    """Counter deltas since a previous stats(workspace) snapshot (e.g. one workspace run)."""
+    now = stats(workspace)
+    delta = {k: now[k] - (before or {}).get(k, 0) for k in now}
+    lookups = delta["hits"] + delta["misses"]
+    delta["hit_rate"] = round(delta["hits"] / lookups, 3) if lookups else None
+    return delta
@@ -0,0 +1,138 @@
+"""Learned per-(provider, model) capability registry.
+
+The HuggingFace routers and Gemini used to get a separate "answer YES or NO"
+pre-flight prompt before every patch request. This registry records what
+actually happens (valid diff / NO_PATCH / invalid output, plus pre-flight
+answers) so `ask_llm` only runs the pre-flight while a model is still being
+learned, when its learned valid-diff rate is poor, or periodically to
+re-check. The stats file is plain JSON so dashboards can read the rates.
+
+Recording only updates the in-memory registry; the file is rewritten at most
+every LLM_CAPABILITY_FLUSH_S seconds and at exit (or on flush()), so the
+request path does not serialize the whole registry per call.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+STATS_PATH = Path(os.getenv("LLM_CAPABILITY_PATH", str(Path(__file__).resolve().parent / "patches" / "llm_capabilities.json")))
+# Observations required before the pre-flight may be skipped
+MIN_OBSERVATIONS = int(os.getenv("LLM_CAPABILITY_MIN_OBS", "5"))
+# Below this valid-diff rate the pre-flight is kept as a cheap NO filter
+MIN_VALID_RATE = float(os.getenv("LLM_CAPABILITY_MIN_VALID_RATE", "0.2"))
+# Re-run the pre-flight after this many seconds or skipped calls
+RECHECK_SECONDS = int(os.getenv("LLM_CAPABILITY_RECHECK_S", str(6 * 3600)))
+RECHECK_EVERY = int(os.getenv("LLM_CAPABILITY_RECHECK_EVERY", "50"))
+# Rewrite the stats file at most this often while outcomes are being recorded
+FLUSH_SECONDS = float(os.getenv("LLM_CAPABILITY_FLUSH_S", "30"))
+
+OUTCOMES = ("valid_diff", "no_patch", "invalid", "error")
+
+_lock = threading.Lock()
+_registry = None
+_dirty = False
+_last_flush = 0.0
+
+
+def _load():
+    global _registry
+    if _registry is None:
+        try:
+            _registry = json.loads(STATS_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            _registry = {}
+    return _registry
+
+
+def _save():
+    global _dirty, _last_flush
+    _last_flush = time.time()
+    try:
+        STATS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # per-process temp name: several workers may flush the same file
+        tmp = STATS_PATH.with_name(f"{STATS_PATH.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(_registry, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, STATS_PATH)
+        _dirty = False
+    except Exception as e:
+        print(f"[Debug] Failed to persist LLM capability stats: {e}")
+
+
+def _changed():
+    """Mark the registry dirty and write it if the last flush is older than FLUSH_SECONDS."""
+    global _dirty
+    _dirty = True
+    if time.time() - _last_flush >= FLUSH_SECONDS:
+        _save()
+
+
+def flush():
+    """Write pending observations to STATS_PATH."""
+    with _lock:
+        if _dirty and _registry is not None:
+            _save()
+
+
+def _entry(provider: str, model: str) -> dict:
+    entry = _load().setdefault(f"{provider}|{model}", {"provider": provider, "model": str(model)})
+    for k in OUTCOMES + ("requests", "precheck_yes", "precheck_no", "calls_since_precheck"):
+        entry.setdefault(k, 0)
+    entry.setdefault("last_precheck", 0)
+    return entry
+
+
+def _update_rates(entry: dict):
+    n = entry["requests"]
+    entry["valid_diff_rate"] = round(entry["valid_diff"] / n, 3) if n else None
+    entry["no_patch_rate"] = round(entry["no_patch"] / n, 3) if n else None
+    checks = entry["precheck_yes"] + entry["precheck_no"]
+    entry["precheck_yes_rate"] = round(entry["precheck_yes"] / checks, 3) if checks else None
+    entry["updated"] = time.time()
+
+
+def needs_precheck(provider: str, model: str) -> bool:
+    """True when the YES/NO pre-flight should run for this provider/model."""
+    with _lock:
+        entry = _entry(provider, model)
+        if entry["requests"] < MIN_OBSERVATIONS:
+            return True
+        if entry["valid_diff"] / entry["requests"] < MIN_VALID_RATE:
+            return True
+        if time.time() - entry["last_precheck"] > RECHECK_SECONDS:
+            return True
+        return entry["calls_since_precheck"] >= RECHECK_EVERY
+
+
+def record_precheck(provider: str, model: str, answered_yes: bool):
+    with _lock:
+        entry = _entry(provider, model)
+        entry["precheck_yes" if answered_yes else "precheck_no"] += 1
+        entry["last_precheck"] = time.time()
+        entry["calls_since_precheck"] = 0
+        _update_rates(entry)
+        _changed()
+
+
+def record_outcome(provider: str, model: str, outcome: str, prechecked: bool = True):
+    """Record the result of a real patch request (one of OUTCOMES)."""
+    if outcome not in OUTCOMES:
+        outcome = "invalid"
+    with _lock:
+        entry = _entry(provider, model)
+        entry["requests"] += 1
+        entry[outcome] += 1
+        if not prechecked:
+            entry["calls_since_precheck"] += 1
+        _update_rates(entry)
+        _changed()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return json.loads(json.dumps(_load()))
+
+
+atexit.register(flush)
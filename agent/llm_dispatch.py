@@ -0,0 +1,230 @@
+"""Process-wide dispatch pool for blocking LLM client calls.
+
+`lc_pipeline.ask_llm` used to build a fresh single-worker ThreadPoolExecutor
+per call; on timeout the executor's `__exit__` still joined the hung request,
+so the timeout never actually freed the caller. This module keeps one
+long-lived pool instead. Callers enforce their own deadline with
+`future.result(timeout=...)`; anything still unfinished when a `session()`
+block exits is cancelled (if queued) or detached (if running): the caller
+returns immediately, the worker's eventual result is discarded and any
+`on_abandon` callbacks run so the request's resources can be released:
+lc_pipeline reads router / Ollama requests as streams whose hook stops the
+read and closes the response. Clients without streaming (Gemini, Qwen, the
+local transformers model) can only be detached; their transport timeout
+closes the socket.
+
+A caller that no longer wants an answer (e.g. the loser of a hedged router
+race) fires a `CancelToken`: every session opened under it (`cancelling()`)
+abandons its unfinished futures at once, and a request waiting in
+`session.result()` raises `Cancelled` instead of sitting out its timeout.
+"""
+import atexit
+import concurrent.futures
+import os
+import threading
+
+
+class LLMDispatchPool:
+    """Long-lived thread pool with queue-depth / in-flight accounting."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="llm-dispatch")
+        self._lock = threading.Lock()
+        self._counts = {"queued": 0, "in_flight": 0, "detached": 0,
+                        "completed": 0, "cancelled": 0, "abandoned": 0}
+
+    def _run(self, state, fn, args, kwargs):
+        with self._lock:
+            self._counts["queued"] -= 1
+            self._counts["in_flight"] += 1
+            state["started"] = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._counts["in_flight"] -= 1
+                self._counts["completed"] += 1
+                state["finished"] = True
+                if state["abandoned"]:
+                    self._counts["detached"] -= 1
+
+    def submit(self, fn, *args, on_abandon=None, **kwargs) -> concurrent.futures.Future:
+        """Queue fn(*args, **kwargs); on_abandon() runs if the caller gives up on it."""
+        state = {"started": False, "finished": False, "abandoned": False, "on_abandon": on_abandon}
+        with self._lock:
+            self._counts["queued"] += 1
+        fut = self._executor.submit(self._run, state, fn, args, kwargs)
+        fut.dispatch_state = state
+        return fut
+
+    def abandon(self, fut: concurrent.futures.Future):
+        """Cancel a queued future or detach a running one without waiting for it."""
+        state = getattr(fut, "dispatch_state", None)
+        if state is None or fut.done() or state["abandoned"]:
+            return
+        if fut.cancel():
+            with self._lock:
+                self._counts["queued"] -= 1
+                self._counts["cancelled"] += 1
+            return
+        with self._lock:
+            if state["finished"]:
+                return
+            state["abandoned"] = True
+            self._counts["abandoned"] += 1
+            self._counts["detached"] += 1
+        if state["on_abandon"]:
+            try:
+                state["on_abandon"]()
+            except Exception as e:
+                print(f"[Debug] on_abandon hook failed: {e}")
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight and detached request counts plus lifetime totals."""
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "workers": self.max_workers,
+            "queue_depth": counts["queued"],
+            "in_flight": counts["in_flight"],
+            "detached_in_flight": counts["detached"],
+            "completed": counts["completed"],
+            "cancelled": counts["cancelled"],
+            "abandoned": counts["abandoned"],
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Cancelled(Exception):
+    """The caller gave up on the request (its CancelToken fired)."""
+
+
+class CancelToken:
+    """Fired once by whoever no longer wants the answer; sessions opened under it abandon their requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fired = concurrent.futures.Future()
+        self._sessions = []
+
+    def is_set(self) -> bool:
+        return self._fired.done()
+
+    def cancel(self):
+        with self._lock:
+            if self._fired.done():
+                return
+            self._fired.set_result(True)
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.abandon_all()
+
+    def attach(self, session):
+        with self._lock:
+            fired = self._fired.done()
+            if not fired:
+                self._sessions.append(session)
+        if fired:
+            session.abandon_all()
+
+    def wait(self, fut: concurrent.futures.Future, timeout: float):
+        """fut.result(timeout) that raises Cancelled as soon as the token fires."""
+        done, _ = concurrent.futures.wait([fut, self._fired], timeout=timeout,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        if fut in done:
+            return fut.result()
+        if self._fired.done():
+            raise Cancelled()
+        raise concurrent.futures.TimeoutError()
+
+
+_local = threading.local()
+
+
+def current_token():
+    return getattr(_local, "token", None)
+
+
+def cancelling(token: CancelToken, fn):
+    """Wrap fn so that sessions it opens (in whatever thread runs it) belong to token."""
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, "token", None)
+        _local.token = token
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.token = previous
+    return run
+
+
+class _DispatchSession:
+    """Executor-like handle whose exit abandons (never joins) unfinished futures."""
+
+    def __init__(self, pool: LLMDispatchPool, token: CancelToken = None):
+        self._pool = pool
+        self._futures = []
+        self._token = token
+        if token is not None:
+            token.attach(self)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._token is not None and self._token.is_set():
+            raise Cancelled()
+        fut = self._pool.submit(fn, *args, **kwargs)
+        self._futures.append(fut)
+        return fut
+
+    def result(self, fut, timeout: float):
+        """Wait for a submitted request; raises TimeoutError, or Cancelled if the session's token fires."""
+        if self._token is None:
+            return fut.result(timeout=timeout)
+        return self._token.wait(fut, timeout)
+
+    def abandon(self, fut):
+        self._pool.abandon(fut)
+
+    def abandon_all(self):
+        for fut in list(self._futures):
+            if not fut.done():
+                self._pool.abandon(fut)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.abandon_all()
+        return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> LLMDispatchPool:
+    """Return the process-wide pool, creating it on first use (size: LLM_POOL_WORKERS)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Detached requests keep a worker busy until their transport timeout,
+            # so leave headroom beyond the snippet concurrency.
+            default = max(8, int(os.getenv("LLM_CONCURRENCY", "1")) * 4)
+            _pool = LLMDispatchPool(max(1, int(os.getenv("LLM_POOL_WORKERS", str(default)))))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def session() -> _DispatchSession:
+    """Use as `with session() as ex: ex.submit(...)` in place of a per-call executor.
+
+    Sessions opened inside `cancelling(token, fn)` are abandoned when token fires.
+    """
+    return _DispatchSession(get_pool(), current_token())
+
+
+def stats() -> dict:
+    return get_pool().stats()
@@ -0,0 +1,215 @@
+"""Per-provider LLM latency history, adaptive timeouts and circuit breaker.
+
+Keeps a bounded window of recent call latencies for each provider name used
+in `lc_pipeline.ask_llm` and persists it to a small JSON file so learned
+percentiles (e.g. the p95 used as the hedging delay) survive restarts.
+
+`adaptive_timeout` replaces the static LLM_TIMEOUT_* values with
+p99 x LLM_TIMEOUT_FACTOR once enough samples exist (clamped to
+[LLM_TIMEOUT_MIN, static value]). A timed-out call is kept as a censored
+sample at the time it was given up on (the real latency was at least
+that), so after timeouts the learned timeout widens again instead of only
+ever shrinking; callers leave out calls whose reading stopped early. A circuit breaker opens after
+LLM_BREAKER_THRESHOLD consecutive failures (timeouts / errors) and makes
+`allow()` skip the provider for LLM_BREAKER_COOLDOWN seconds; after the
+cool-down a single trial request is let through (half-open) and its outcome
+closes or re-opens the breaker.
+
+`record()` only updates the in-memory history; the file is rewritten at
+most every LLM_HEALTH_FLUSH_S seconds and at exit (or on flush()), so no
+LLM call waits for a JSON rewrite.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+HISTORY_PATH = Path(os.getenv("LLM_HEALTH_PATH", str(Path(__file__).resolve().parent / "patches" / "llm_latency.json")))
+# Samples kept per provider and minimum needed before percentiles are trusted
+MAX_SAMPLES = int(os.getenv("LLM_HEALTH_MAX_SAMPLES", "200"))
+MIN_SAMPLES = int(os.getenv("LLM_HEALTH_MIN_SAMPLES", "5"))
+# Adaptive timeout = p99 latency x factor, never below the floor or above the static timeout
+TIMEOUT_FACTOR = float(os.getenv("LLM_TIMEOUT_FACTOR", "2.0"))
+TIMEOUT_MIN = float(os.getenv("LLM_TIMEOUT_MIN", "5"))
+# Consecutive failures that open the breaker, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "120"))
+# Rewrite the history file at most this often while calls are being recorded
+FLUSH_SECONDS = float(os.getenv("LLM_HEALTH_FLUSH_S", "30"))
+
+_lock = threading.Lock()
+_history = None
+_dirty = False
+_last_flush = 0.0
+# providers whose half-open trial request is in flight (not persisted)
+_trials = {}
+
+
+def _load():
+    global _history
+    if _history is None:
+        try:
+            _history = json.loads(HISTORY_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            _history = {}
+    return _history
+
+
+def _save():
+    global _dirty, _last_flush
+    _last_flush = time.time()
+    try:
+        HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # per-process temp name: several workers may flush the same file
+        tmp = HISTORY_PATH.with_name(f"{HISTORY_PATH.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(_history), encoding="utf-8")
+        os.replace(tmp, HISTORY_PATH)
+        _dirty = False
+    except Exception as e:
+        print(f"[Debug] Failed to persist LLM latency history: {e}")
+
+
+def _changed():
+    """Mark the history dirty and write it if the last flush is older than FLUSH_SECONDS."""
+    global _dirty
+    _dirty = True
+    if time.time() - _last_flush >= FLUSH_SECONDS:
+        _save()
+
+
+def flush():
+    """Write pending samples to HISTORY_PATH."""
+    with _lock:
+        if _dirty and _history is not None:
+            _save()
+
+
+def _entry(hist: dict, provider: str) -> dict:
+    entry = hist.setdefault(provider, {"latencies": [], "ok": 0, "failed": 0})
+    entry.setdefault("consecutive_failures", 0)
+    entry.setdefault("open_until", 0)
+    return entry
+
+
+def record(provider: str, seconds: float, ok: bool = True, timed_out: bool = False, sample: bool = True):
+    """Record one call outcome for provider.
+
+    Successful calls and timeouts (censored at `seconds`) feed the latency
+    percentiles unless sample=False (e.g. a stream cut short); other
+    failures do not. Failures (timeouts, transport errors) drive the
+    circuit breaker.
+    """
+    with _lock:
+        hist = _load()
+        entry = _entry(hist, provider)
+        trial = _trials.pop(provider, None) is not None
+        if sample and (ok or timed_out):
+            entry["latencies"] = (entry["latencies"] + [round(float(seconds), 3)])[-MAX_SAMPLES:]
+        if ok:
+            entry["ok"] += 1
+            if entry["open_until"] or entry["consecutive_failures"] >= BREAKER_THRESHOLD:
+                print(f"[+] Circuit breaker CLOSED for {provider} (call succeeded)")
+            entry["consecutive_failures"] = 0
+            entry["open_until"] = 0
+        else:
+            entry["failed"] += 1
+            entry["consecutive_failures"] += 1
+            if trial or entry["consecutive_failures"] >= BREAKER_THRESHOLD:
+                entry["open_until"] = time.time() + BREAKER_COOLDOWN
+                print(f"[!] Circuit breaker OPEN for {provider}: {entry['consecutive_failures']} consecutive "
+                      f"failures; skipping it for {BREAKER_COOLDOWN:.0f}s")
+        entry["updated"] = time.time()
+        _changed()
+
+
+def allow(provider: str) -> bool:
+    """False while provider's breaker is open (or its half-open trial is still running)."""
+    with _lock:
+        entry = _entry(_load(), provider)
+        if not entry["open_until"]:
+            return True
+        now = time.time()
+        if now < entry["open_until"]:
+            return False
+        started = _trials.get(provider)
+        if started is not None and now - started < BREAKER_COOLDOWN:
+            return False
+        _trials[provider] = now
+        print(f"[Debug] Circuit breaker HALF-OPEN for {provider}: sending one trial request")
+        return True
+
+
+def state(provider: str) -> str:
+    with _lock:
+        entry = _entry(_load(), provider)
+        if not entry["open_until"]:
+            return "closed"
+        if time.time() < entry["open_until"]:
+            return "open"
+        return "half_open"
+
+
+def adaptive_timeout(provider: str, static_timeout: float) -> float:
+    """p99 latency x TIMEOUT_FACTOR, clamped to [TIMEOUT_MIN, static_timeout]."""
+    p99 = percentile(provider, 99)
+    if p99 is None:
+        return static_timeout
+    return round(min(float(static_timeout), max(TIMEOUT_MIN, p99 * TIMEOUT_FACTOR)), 1)
+
+
+def percentile(provider: str, q: float):
+    """Return the q-th percentile (0-100) latency for provider, or None without enough history."""
+    with _lock:
+        samples = sorted(_load().get(provider, {}).get("latencies", []))
+    if len(samples) < MIN_SAMPLES:
+        return None
+    # nearest-rank percentile
+    idx = min(len(samples) - 1, max(0, math.ceil(q / 100.0 * len(samples)) - 1))
+    return samples[idx]
+
+
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 45, 90)
+
+
+def histogram(provider: str) -> dict:
+    """Bucketed counts of the rolling latency window ('<=5s': n, ..., '>90s': n)."""
+    with _lock:
+        samples = list(_load().get(provider, {}).get("latencies", []))
+    buckets = {f"<={b}s": 0 for b in HISTOGRAM_BOUNDS}
+    buckets[f">{HISTOGRAM_BOUNDS[-1]}s"] = 0
+    for v in samples:
+        key = next((f"<={b}s" for b in HISTOGRAM_BOUNDS if v <= b), f">{HISTOGRAM_BOUNDS[-1]}s")
+        buckets[key] += 1
+    return buckets
+
+
+def snapshot(static_timeouts: dict = None) -> dict:
+    """Per-provider health for reports: breaker state, failure counts, latency percentiles."""
+    with _lock:
+        names = sorted(_load())
+    out = {}
+    for name in names:
+        with _lock:
+            entry = dict(_entry(_load(), name))
+        info = {
+            "breaker": state(name),
+            "consecutive_failures": entry["consecutive_failures"],
+            "open_until": entry["open_until"] or None,
+            "ok": entry["ok"],
+            "failed": entry["failed"],
+            "samples": len(entry["latencies"]),
+            "p50_s": percentile(name, 50),
+            "p95_s": percentile(name, 95),
+            "p99_s": percentile(name, 99),
+            "histogram": histogram(name),
+        }
+        if static_timeouts and name in static_timeouts:
+            info["timeout_s"] = adaptive_timeout(name, static_timeouts[name])
+        out[name] = info
+    return out
+
+
+atexit.register(flush)
@@ -0,0 +1,290 @@
+"""Lazy LLM provider registry.
+
+`lc_pipeline` used to import langchain_google_genai / langchain_openai /
+langchain_ollama / transformers at module import and construct every client
+(the transformers client even loaded its model), so FlaskApp startup and every
+`lc_pipeline.py --cmd ...` run paid for providers they might never call. Here
+each provider is a factory that imports its SDK and builds the client on the
+first `get_llm(name)`; the result (or None when the SDK/key is missing) is
+cached for the life of the process.
+"""
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+_clients = {}
+_factories = {}
+_message_cls = None
+
+
+def register(name: str):
+    """Decorator registering a zero-argument factory for provider `name`."""
+    def deco(fn):
+        _factories[name] = fn
+        return fn
+    return deco
+
+
+def get_llm(name: str):
+    """Return the client for provider `name`, constructing it on first use (None if unavailable)."""
+    if name in _clients:
+        return _clients[name]
+    with _lock:
+        if name not in _clients:
+            factory = _factories.get(name)
+            client = None
+            if factory is not None:
+                try:
+                    client = factory()
+                except Exception as e:
+                    print(f"[!] Failed to init {name} client: {e}")
+            _clients[name] = client
+        return _clients[name]
+
+
+def loaded() -> list:
+    """Names of providers constructed so far (for startup diagnostics)."""
+    with _lock:
+        return sorted(n for n, c in _clients.items() if c is not None)
+
+
+def reset():
+    """Forget constructed clients (tests, or after changing env configuration)."""
+    with _lock:
+        _clients.clear()
+
+
+def human_message(content: str):
+    """Build a LangChain HumanMessage, importing langchain_core only on first use."""
+    global _message_cls
+    if _message_cls is None:
+        try:
+            from langchain_core.messages import HumanMessage
+        except Exception:
+            # minimal fallback so clients that only read .content still work
+            class HumanMessage:
+                def __init__(self, content: str):
+                    self.content = content
+        _message_cls = HumanMessage
+    return _message_cls(content=content)
+
+
+def _hf_timeout() -> int:
+    # transport timeout closes the socket of requests detached by llm_dispatch
+    return int(os.getenv("LLM_TIMEOUT_HF", "45"))
+
+
+@register("Gemini")
+def _gemini():
+    key = os.getenv("GEMINI_API_KEY")
+    if not key:
+        return None
+    try:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+    except Exception:
+        return None
+    return ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=key, temperature=0.1)
+
+
+@register("Qwen")
+def _qwen():
+    key = os.getenv("QWEN_API_KEY")
+    if os.getenv("DISABLE_QWEN", "0") in ("1", "true", "True"):
+        print("[Debug] Qwen disabled via DISABLE_QWEN env var; skipping initialization.")
+        return None
+    if not key:
+        return None
+    try:
+        from langchain_openai import ChatOpenAI
+    except Exception:
+        return None
+    return ChatOpenAI(api_key=key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                      model="qwen1.5-7b-chat")
+
+
+@register("Ollama")
+def _ollama():
+    try:
+        from langchain_ollama import ChatOllama
+    except Exception:
+        return None
+    ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    model = os.getenv("LOCAL_MODEL", "deepseek-coder")
+    try:
+        return ChatOllama(model=model, temperature=0.3, host=ollama_host)
+    except TypeError:
+        return ChatOllama(model=model, temperature=0.3, base_url=ollama_host)
+
+
+class _TransformersClient:
+    """Local transformers text-generation pipeline exposing .invoke(messages)."""
+
+    def __init__(self, model, trust_remote=False, device="-1"):
+        from transformers import pipeline as hf_transformers_pipeline
+        # device: '-1' for CPU, '0' for first GPU
+        device_arg = -1 if str(device) == "-1" else int(device)
+        self.pipe = hf_transformers_pipeline("text-generation", model=model, trust_remote_code=trust_remote, device=device_arg)
+
+    def invoke(self, messages):
+        prompt = "\n".join(getattr(m, 'content', str(m)) for m in messages)
+        # Respect an env var for max tokens
+        max_new_tokens = int(os.getenv("TRANSFORMERS_MAX_TOKENS", "256"))
+        resp = self.pipe(prompt, max_new_tokens=max_new_tokens)
+        # return an object with .content to match other clients
+        try:
+            text = resp[0].get('generated_text') if isinstance(resp, list) and isinstance(resp[0], dict) else str(resp)
+        except Exception:
+            text = str(resp)
+        return type("R", (), {"content": text})()
+
+
+@register("Transformers")
+def _transformers():
+    addr = os.getenv("TRANSFORMERS_WORKER_ADDR")
+    if addr:
+        # model stays loaded in local_model_worker.py, which batches concurrent prompts
+        from local_model_worker import WorkerClient
+        return WorkerClient(addr)
+    model = os.getenv("TRANSFORMERS_MODEL")
+    if not model:
+        return None
+    try:
+        import transformers  # noqa: F401
+    except Exception:
+        return None
+    return _TransformersClient(model, trust_remote=os.getenv("TRANSFORMERS_TRUST_REMOTE", "1") in ("1", "true", "True"),
+                               device=os.getenv("TRANSFORMERS_DEVICE", "-1"))
+
+
+class _HFClient:
+    """Minimal HuggingFace Inference API client exposing .invoke(messages)."""
+
+    def __init__(self, token):
+        self.token = token
+        # primary HF inference URL (model-specific)
+        self.url = os.getenv("HUGGINGFACE_MODEL_URL", "https://api-inference.huggingface.co/models/gpt2")
+        # alternate model URLs to try when the primary endpoint returns 410
+        alternates = os.getenv("HUGGINGFACE_ALTERNATE_URLS", "")
+        self.alternates = [u.strip() for u in alternates.split(',') if u.strip()]
+
+    def _call_url(self, url, prompt):
+        import http_pool
+        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        payload = {"inputs": prompt, "options": {"wait_for_model": True}}
+        resp = http_pool.post(url, headers=headers, json=payload, timeout=30)
+        resp.raise_for_status()
+        return resp.json()
+
+    def invoke(self, messages):
+        # messages is list-like of HumanMessage; we concat content
+        prompt = "\n".join(getattr(m, 'content', str(m)) for m in messages)
+        urls_to_try = [self.url] + self.alternates
+        last_exc = None
+        for url in urls_to_try:
+            try:
+                data = self._call_url(url, prompt)
+                # HF Inference API may return text or array with generated_text
+                if isinstance(data, dict) and "generated_text" in data:
+                    return type("R", (), {"content": data["generated_text"]})()
+                if isinstance(data, list) and data and isinstance(data[0], dict) and "generated_text" in data[0]:
+                    return type("R", (), {"content": data[0]["generated_text"]})()
+                # fallback: stringify response
+                return type("R", (), {"content": str(data)})()
+            except Exception as e:
+                last_exc = e
+                # If 410 Gone, try next alternate URL
+                try:
+                    code = None
+                    if hasattr(e, 'response') and e.response is not None:
+                        code = getattr(e.response, 'status_code', None)
+                except Exception:
+                    code = None
+                if code == 410:
+                    continue
+                # otherwise, break and surface the error
+                break
+        # All attempts failed
+        raise last_exc if last_exc is not None else RuntimeError("HF inference failed")
+
+
+@register("HuggingFace")
+def _huggingface():
+    token = os.getenv("HUGGINGFACE_API_TOKEN")
+    if not token:
+        return None
+    try:
+        import requests  # noqa: F401
+    except Exception:
+        return None
+    return _HFClient(token)
+
+
+def router_base_url() -> str:
+    # HUGGINGFACE_ROUTER_BASE_URL points the routers at another OpenAI-compatible
+    # endpoint, e.g. mock_llm_server.py for offline benchmarks
+    return os.getenv("HUGGINGFACE_ROUTER_BASE_URL", "https://router.huggingface.co/v1").rstrip("/")
+
+
+class _RouterClient:
+    """OpenAI-compatible chat client over http_pool, used when langchain_openai is missing."""
+
+    def __init__(self, token, base_url, model, temperature=0.2, timeout=45):
+        self.token, self.url = token, base_url + "/chat/completions"
+        self.model_name, self.temperature, self.timeout = model, temperature, timeout
+
+    def _post(self, messages, stream=False):
+        import http_pool
+        payload = {"model": self.model_name, "temperature": self.temperature, "stream": stream,
+                   "messages": [{"role": "user", "content": getattr(m, 'content', str(m))} for m in messages]}
+        resp = http_pool.post(self.url, headers={"Authorization": f"Bearer {self.token}"}, json=payload,
+                              timeout=self.timeout, stream=stream)
+        resp.raise_for_status()
+        return resp
+
+    def invoke(self, messages):
+        data = self._post(messages).json()
+        return type("R", (), {"content": data["choices"][0]["message"].get("content") or ""})()
+
+    def stream(self, messages):
+        resp = self._post(messages, stream=True)
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta") or {}
+                if delta.get("content"):
+                    yield type("R", (), {"content": delta["content"]})()
+        finally:
+            resp.close()
+
+
+def _router(token, model):
+    if not token:
+        return None
+    try:
+        from langchain_openai import ChatOpenAI
+    except Exception:
+        try:
+            import requests  # noqa: F401
+        except Exception:
+            return None
+        return _RouterClient(token, router_base_url(), model, timeout=_hf_timeout())
+    return ChatOpenAI(api_key=token, base_url=router_base_url(), model=model,
+                      temperature=0.2, timeout=_hf_timeout())
+
+
+@register("HuggingFace_Router")
+def _hf_router():
+    token = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACE_API_TOKEN")
+    return _router(token, os.getenv("HUGGINGFACE_ROUTER_MODEL", "gpt2"))
+
+
+@register("HuggingFace_Router_2")
+def _hf_router_2():
+    # Secondary HF Router (fallback router) using HF_TOKEN_2 / HUGGINGFACE_ROUTER_MODEL_2
+    model = os.getenv("HUGGINGFACE_ROUTER_MODEL_2") or os.getenv("HUGGINGFACE_ROUTER_MODEL", "gpt2")
+    return _router(os.getenv("HF_TOKEN_2"), model)
@@ -0,0 +1,142 @@
+"""Streaming LLM invocation with early abort on non-diff output.
+
+`ask_llm` used to wait for the whole completion before checking for
+"diff --git". With LLM_STREAM=1 the OpenAI-compatible router and Ollama
+clients are read through LangChain's `.stream()` and a DiffStreamMonitor
+watches the text as it arrives:
+
+- abort once the first LLM_STREAM_PROBE_CHARS characters contain no diff
+  marker (prose, apologies) or the reply starts with NO_PATCH;
+- stop once the diff has started and a line arrives that cannot be part
+  of it (closing fence, explanation), the same rule diff_model uses to end
+  a hunk body. Declared hunk line counts are never used to stop: models
+  get them wrong too often, and the diff_model `recount` repair would turn
+  a cut-off body into a valid but wrong patch.
+
+Replies whose reading stopped in the middle of the model's output
+(cancelled by the caller) are marked `.partial`; callers must not repair
+those into patches.
+
+Closing the stream generator closes the underlying HTTP response, so the
+provider stops generating (and billing) output tokens.
+"""
+import os
+import threading
+
+PROBE_CHARS = int(os.getenv("LLM_STREAM_PROBE_CHARS", "300"))
+
+DIFF_MARKERS = ("diff --git", "--- a/", "+++ b/", "@@ -")
+HEADER_PREFIXES = ("diff --git", "index ", "--- ", "+++ ", "new file mode", "deleted file mode",
+                   "similarity index", "rename from", "rename to", "old mode", "new mode")
+BODY_PREFIXES = (" ", "-", "+", "\\")
+
+_lock = threading.Lock()
+_stats = {"streams": 0, "aborted": 0, "completed_early": 0, "exhausted": 0, "cancelled": 0}
+
+
+class DiffStreamMonitor:
+    """Incremental unified-diff watcher; feed() returns 'continue', 'abort' or 'complete'."""
+
+    def __init__(self, probe_chars: int = PROBE_CHARS):
+        self.probe_chars = probe_chars
+        self.text = ""
+        self.reason = None
+        self._pos = 0            # offset of the first unprocessed line in self.text
+        self._in_diff = False
+        self._hunks = 0          # hunk headers seen so far
+        self._end = None         # offset where the diff ends
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk or ""
+        head = self.text.lstrip().lstrip("`").lstrip()
+        if head[:8].upper() == "NO_PATCH":
+            self.reason = "no_patch"
+            return "abort"
+        if not self._in_diff:
+            idx = min((i for i in (self.text.find(m) for m in DIFF_MARKERS) if i >= 0), default=-1)
+            if idx < 0:
+                if len(self.text.strip()) >= self.probe_chars:
+                    self.reason = "no_diff_in_probe"
+                    return "abort"
+                return "continue"
+            self._in_diff = True
+            # start line processing at the first diff line
+            self._pos = self.text.rfind("\n", 0, idx) + 1
+        return self._scan_lines()
+
+    def _scan_lines(self) -> str:
+        while True:
+            nl = self.text.find("\n", self._pos)
+            if nl < 0:
+                return "continue"
+            line = self.text[self._pos:nl].rstrip("\r")
+            start = self._pos
+            self._pos = nl + 1
+            if line.startswith("@@"):
+                self._hunks += 1
+                continue
+            if line.startswith(HEADER_PREFIXES) or not line.strip():
+                continue
+            if not self._hunks or line[:1] in BODY_PREFIXES:
+                continue
+            # first line after the diff that cannot belong to it
+            self._end = start
+            self.reason = "diff_complete"
+            return "complete"
+
+    def content(self) -> str:
+        """Text received so far, trimmed to the complete diff when one was detected."""
+        return self.text[:self._end] if self._end is not None else self.text
+
+
+def _bump(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def stream_invoke(llm, messages, cancel: threading.Event = None, probe_chars: int = PROBE_CHARS,
+                  watch: bool = True):
+    """Stream llm's reply to messages, stopping early per DiffStreamMonitor.
+
+    watch=False reads the whole reply (replies that are not diffs) and only
+    stops on `cancel`.
+
+    Returns an object with .content (like `llm.invoke`) plus .stream_status
+    ('abort', 'complete', 'exhausted' or 'cancelled'), .stream_reason and
+    .partial (True when reading stopped mid-reply, see the module docstring).
+    `cancel` (e.g. set by llm_dispatch's on_abandon hook) stops reading.
+    """
+    monitor = DiffStreamMonitor(probe_chars)
+    status = "exhausted"
+    _bump("streams")
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                status = "cancelled"
+                break
+            piece = getattr(chunk, "content", chunk)
+            if not isinstance(piece, str):
+                piece = str(piece or "")
+            if not watch:
+                monitor.text += piece
+                continue
+            decision = monitor.feed(piece)
+            if decision != "continue":
+                status = decision
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+    _bump({"abort": "aborted", "complete": "completed_early"}.get(status, status))
+    return type("R", (), {"content": monitor.content(), "stream_status": status,
+                          "stream_reason": monitor.reason, "partial": status == "cancelled"})()
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
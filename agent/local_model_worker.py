@@ -0,0 +1,265 @@
+"""Long-lived local transformers worker with batched generation.
+
+With TRANSFORMERS_MODEL set, every process that imported `lc_pipeline` used
+to load its own copy of the model and `_TransformersClient.invoke` ran one
+prompt at a time. This worker loads the model once and serves prompts over a
+local socket; requests that arrive within TRANSFORMERS_WORKER_WINDOW_MS of
+each other (up to TRANSFORMERS_WORKER_BATCH) are padded into one `generate`
+call, which is where CPU inference gains most of its throughput.
+
+Start it with
+    python local_model_worker.py --model <hf-model-id> [--addr 127.0.0.1:8765]
+and set TRANSFORMERS_WORKER_ADDR=127.0.0.1:8765 (or unix:/path/worker.sock)
+so `llm_providers.get_llm("Transformers")` talks to it instead of loading the
+model in-process. The protocol is one JSON object per line:
+{"prompt": ..., "max_new_tokens": ...} -> {"text", "new_tokens", "latency_s",
+"batch_size"}, and {"cmd": "stats"} returns throughput counters (tokens/s).
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+DEFAULT_ADDR = "127.0.0.1:8765"
+BATCH_MAX = int(os.getenv("TRANSFORMERS_WORKER_BATCH", "8"))
+BATCH_WINDOW_S = float(os.getenv("TRANSFORMERS_WORKER_WINDOW_MS", "20")) / 1000.0
+MAX_NEW_TOKENS = int(os.getenv("TRANSFORMERS_MAX_TOKENS", "256"))
+CLIENT_TIMEOUT = float(os.getenv("TRANSFORMERS_WORKER_TIMEOUT", "600"))
+
+
+def parse_addr(addr: str):
+    """'host:port' -> (AF_INET, (host, port)); 'unix:/path' -> (AF_UNIX, path)."""
+    if addr.startswith("unix:"):
+        return socket.AF_UNIX, addr[5:]
+    host, _, port = addr.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+class TransformersBackend:
+    """Tokenizer + causal LM kept in memory; generate() runs one padded batch."""
+
+    def __init__(self, model, device="-1", trust_remote=False):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model, trust_remote_code=trust_remote)
+        # left padding so every row's continuation starts at the same position
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model, trust_remote_code=trust_remote)
+        if str(device) != "-1":
+            self.model.to(f"cuda:{int(device)}")
+        self.model.eval()
+
+    def generate(self, prompts, max_new_tokens):
+        """Returns [(text, new_tokens)] with text = prompt + continuation, like the HF pipeline."""
+        import torch
+        enc = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        with torch.no_grad():
+            out = self.model.generate(**enc, max_new_tokens=max_new_tokens, do_sample=False,
+                                      pad_token_id=self.tokenizer.pad_token_id)
+        width = enc["input_ids"].shape[1]
+        results = []
+        for prompt, row in zip(prompts, out):
+            new_ids = [t for t in row[width:].tolist() if t != self.tokenizer.pad_token_id]
+            results.append((prompt + self.tokenizer.decode(new_ids, skip_special_tokens=True), len(new_ids)))
+        return results
+
+
+class _Request:
+    def __init__(self, prompt, max_new_tokens):
+        self.prompt, self.max_new_tokens = prompt, max_new_tokens
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.enqueued = time.monotonic()
+
+
+class LocalModelWorker:
+    """Batches queued prompts into backend.generate calls on a single thread."""
+
+    def __init__(self, backend, batch_max=BATCH_MAX, window_s=BATCH_WINDOW_S):
+        self.backend, self.batch_max, self.window_s = backend, batch_max, window_s
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "max_batch": 0, "new_tokens": 0, "generate_s": 0.0}
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, max_new_tokens=MAX_NEW_TOKENS, timeout=CLIENT_TIMEOUT):
+        req = _Request(prompt, max_new_tokens)
+        self._queue.put(req)
+        if not req.done.wait(timeout):
+            raise TimeoutError("local model worker did not answer in time")
+        if req.error:
+            raise RuntimeError(req.error)
+        return req.result
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            # one generate per distinct max_new_tokens so short requests are not padded to long ones
+            groups = {}
+            for req in batch:
+                groups.setdefault(req.max_new_tokens, []).append(req)
+            for max_new, reqs in groups.items():
+                started = time.monotonic()
+                try:
+                    outputs = self.backend.generate([r.prompt for r in reqs], max_new)
+                    if len(outputs) != len(reqs):
+                        raise ValueError(f"{len(outputs)} outputs for {len(reqs)} prompts")
+                    error = None
+                except Exception as e:
+                    outputs, error = [], f"generate failed: {e}"
+                elapsed = time.monotonic() - started
+                with self._stats_lock:
+                    self._stats["batches"] += 1
+                    self._stats["requests"] += len(reqs)
+                    self._stats["max_batch"] = max(self._stats["max_batch"], len(reqs))
+                    self._stats["new_tokens"] += sum(n for _, n in outputs)
+                    self._stats["generate_s"] = round(self._stats["generate_s"] + elapsed, 3)
+                for i, req in enumerate(reqs):
+                    if error:
+                        req.error = error
+                    else:
+                        text, new_tokens = outputs[i]
+                        req.result = {"text": text, "new_tokens": new_tokens, "batch_size": len(reqs),
+                                      "latency_s": round(time.monotonic() - req.enqueued, 3)}
+                    req.done.set()
+                if not error and elapsed > 0:
+                    print(f"[Debug] Worker batch of {len(reqs)}: {sum(n for _, n in outputs)} tokens "
+                          f"in {elapsed:.2f}s ({sum(n for _, n in outputs) / elapsed:.1f} tok/s)")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["avg_batch"] = round(s["requests"] / s["batches"], 2) if s["batches"] else 0.0
+        s["tokens_per_s"] = round(s["new_tokens"] / s["generate_s"], 2) if s["generate_s"] else 0.0
+        return s
+
+
+def make_server(worker: LocalModelWorker, addr: str = DEFAULT_ADDR):
+    family, address = parse_addr(addr)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    msg = json.loads(line)
+                    if msg.get("cmd") == "stats":
+                        reply = worker.stats()
+                    else:
+                        reply = worker.submit(msg["prompt"], int(msg.get("max_new_tokens") or MAX_NEW_TOKENS))
+                except Exception as e:
+                    reply = {"error": str(e)}
+                self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = socketserver.ThreadingUnixStreamServer(address, Handler)
+    else:
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer(address, Handler)
+    server.daemon_threads = True
+    return server
+
+
+class WorkerClient:
+    """LLM-style client (.invoke(messages) -> obj.content) for a running worker."""
+
+    def __init__(self, addr: str, timeout: float = CLIENT_TIMEOUT, max_new_tokens: int = None):
+        self.addr, self.timeout = addr, timeout
+        self.max_new_tokens = max_new_tokens or MAX_NEW_TOKENS
+        self.model_name = f"worker@{addr}"
+
+    def _request(self, msg: dict) -> dict:
+        family, address = parse_addr(self.addr)
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(address)
+            sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                reply = json.loads(f.readline() or b"{}")
+        if "error" in reply:
+            raise RuntimeError(f"local model worker: {reply['error']}")
+        return reply
+
+    def invoke(self, messages):
+        prompt = "\n".join(getattr(m, 'content', str(m)) for m in messages)
+        reply = self._request({"prompt": prompt, "max_new_tokens": self.max_new_tokens})
+        return type("R", (), {"content": reply.get("text", "")})()
+
+    def stats(self) -> dict:
+        return self._request({"cmd": "stats"})
+
+
+def bench(addr: str, requests: int, concurrency: int, max_new_tokens: int):
+    """Fire `requests` prompts with `concurrency` parallel clients and report tokens/s."""
+    from concurrent.futures import ThreadPoolExecutor
+    client = WorkerClient(addr, max_new_tokens=max_new_tokens)
+    before = client.stats()
+    prompt = "# Python\ndef fibonacci(n):\n"
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(lambda _: client._request({"prompt": prompt, "max_new_tokens": max_new_tokens}),
+                    range(requests)))
+    wall = time.monotonic() - started
+    after = client.stats()
+    tokens = after["new_tokens"] - before["new_tokens"]
+    batches = after["batches"] - before["batches"]
+    print(f"[*] {requests} requests, concurrency {concurrency}: {tokens} new tokens in {wall:.2f}s "
+          f"= {tokens / wall:.1f} tok/s end-to-end, {batches} generate calls "
+          f"(avg batch {requests / max(1, batches):.1f})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Warm local transformers worker with batched generation")
+    ap.add_argument("--addr", default=os.getenv("TRANSFORMERS_WORKER_ADDR", DEFAULT_ADDR))
+    ap.add_argument("--model", default=os.getenv("TRANSFORMERS_MODEL"))
+    ap.add_argument("--device", default=os.getenv("TRANSFORMERS_DEVICE", "-1"))
+    ap.add_argument("--bench", type=int, metavar="N", help="send N requests to a running worker and report tok/s")
+    ap.add_argument("--concurrency", type=int, default=BATCH_MAX)
+    ap.add_argument("--max-new-tokens", type=int, default=64)
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(args.addr, args.bench, args.concurrency, args.max_new_tokens)
+        return
+    if not args.model:
+        raise SystemExit("[!] --model or TRANSFORMERS_MODEL is required")
+    print(f"[*] Loading {args.model} ...")
+    started = time.monotonic()
+    backend = TransformersBackend(args.model, args.device,
+                                  trust_remote=os.getenv("TRANSFORMERS_TRUST_REMOTE", "1") in ("1", "true", "True"))
+    print(f"[+] Model loaded in {time.monotonic() - started:.1f}s; serving on {args.addr} "
+          f"(batch up to {BATCH_MAX}, window {BATCH_WINDOW_S * 1000:.0f} ms)")
+    worker = LocalModelWorker(backend)
+    server = make_server(worker, args.addr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"[*] Worker stats: {worker.stats()}")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Offline stand-in for the LLM endpoints used by the pipeline.
+
+Speaks the HF router's OpenAI-compatible API (`POST /v1/chat/completions`,
+streaming and non-streaming, `GET /v1/models`) and Ollama's `/api/generate`
+and `/api/chat`. Replies are replayed from the recorded corpus of
+`raw_resp_*.txt` / `raw_gemini_pipeline_*.json` files and response journal
+segments (plus, optionally, saved `*.diff` patches); YES/NO capability
+pre-flight prompts get "YES" and edit-operation prompts (LLM_RESPONSE_FORMAT=edits)
+a JSON edit of one of the numbered lines.
+Latency is drawn from a configurable distribution and a fraction of requests
+can fail with 503 / 429 or hang past the client timeout.
+
+Run standalone:
+    python mock_llm_server.py --port 8089 --latency lognormal:0.7,0.5 --error-rate 0.05
+then point the pipeline at it with
+    HUGGINGFACE_ROUTER_BASE_URL=http://127.0.0.1:8089/v1 HF_TOKEN=dummy OLLAMA_HOST=http://127.0.0.1:8089
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_CORPUS_DIRS = [
+    BASE_DIR / "patches_py_fixed",
+    BASE_DIR / "patches" / "patches_cpp_fixed",
+    BASE_DIR / "archive_python_tools_20251124_142656" / "patches_py_fixed",
+    BASE_DIR / "patches" / "journal",
+]
+PRECHECK_MARKERS = ("Reply exactly 'YES' or 'NO'", "Reply YES or NO")
+EDITS_MARKER = '{"edits": []}'
+NUMBERED_LINE_RE = re.compile(r"^\s*(\d+) \| (.*)$", re.MULTILINE)
+EDIT_FILE_RE = re.compile(r"^# Buggy Code Regions in (.+)$", re.MULTILINE)
+
+
+def load_corpus(dirs=None, include_diffs: bool = False, skip_empty: bool = False) -> list:
+    """Recorded LLM replies from raw_resp_*.txt / raw_gemini_pipeline_*.json, response
+    journal segments (responses-*.jsonl.gz) and optionally saved *.diff patches."""
+    replies = []
+    for d in dirs or DEFAULT_CORPUS_DIRS:
+        d = Path(d)
+        if not d.is_dir():
+            continue
+        for f in sorted(d.glob("raw_resp_*.txt")):
+            replies.append(f.read_text(encoding="utf-8", errors="ignore"))
+        for f in sorted(d.glob("raw_gemini_pipeline_*.json")):
+            try:
+                replies.append(json.loads(f.read_text(encoding="utf-8")).get("content") or "")
+            except Exception:
+                continue
+        for f in sorted(d.glob("responses-*.jsonl.gz")):
+            from response_journal import read_segment
+            replies.extend(e.get("content") or "" for e in read_segment(f)
+                           if e and e.get("kind") in ("response", "gemini_variant", "gemini_trimmed", "gemini_minimal"))
+        if include_diffs:
+            for f in sorted(d.glob("*.diff")):
+                replies.append(f.read_text(encoding="utf-8", errors="ignore"))
+    if skip_empty:
+        replies = [r for r in replies if r.strip()]
+    return replies or ["NO_PATCH"]
+
+
+def parse_latency(spec: str):
+    """'fixed:S', 'uniform:A,B', 'normal:MEAN,SD' or 'lognormal:MU,SIGMA' -> sampler(rng) in seconds."""
+    kind, _, args = (spec or "fixed:0").partition(":")
+    vals = [float(v) for v in args.split(",") if v.strip()] or [0.0]
+    if kind == "fixed":
+        return lambda rng: vals[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(vals[0], vals[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(vals[0], vals[1]))
+    if kind == "lognormal":
+        # MU is the median in seconds, SIGMA the log-space spread
+        import math
+        return lambda rng: rng.lognormvariate(math.log(max(vals[0], 1e-6)), vals[1])
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class MockLLMServer:
+    """Threaded mock server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0, rate_limit_rate=0.0,
+                 hang_rate=0.0, hang_seconds=120.0, corpus=None, seed=None, stream_chunk=24):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate, self.rate_limit_rate, self.hang_rate = error_rate, rate_limit_rate, hang_rate
+        self.hang_seconds = hang_seconds
+        self.corpus = corpus if corpus is not None else load_corpus()
+        self.stream_chunk = stream_chunk
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._replies = itertools.cycle(self.corpus)
+        self.stats = {"requests": 0, "prechecks": 0, "errors": 0, "rate_limited": 0, "hangs": 0, "streams": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _plan(self, prompt: str):
+        """Decide (status, reply, delay) for one request."""
+        with self._rng_lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            delay = self.sample_latency(self._rng)
+            if roll < self.error_rate:
+                self.stats["errors"] += 1
+                return 503, None, delay
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429, None, 0.0
+            if roll < self.error_rate + self.rate_limit_rate + self.hang_rate:
+                self.stats["hangs"] += 1
+                delay = self.hang_seconds
+            if any(m in prompt for m in PRECHECK_MARKERS):
+                self.stats["prechecks"] += 1
+                return 200, "YES", delay
+            if EDITS_MARKER in prompt:
+                return 200, self._edit_reply(prompt), delay
+            return 200, next(self._replies), delay
+
+    def _edit_reply(self, prompt: str) -> str:
+        """Edit-operation answer touching one numbered line of the prompt (caller holds _rng_lock)."""
+        lines = [m for m in NUMBERED_LINE_RE.finditer(prompt) if m.group(2).strip()]
+        if not lines:
+            return json.dumps({"edits": []})
+        m = self._rng.choice(lines)
+        path = EDIT_FILE_RE.search(prompt)
+        comment = "#" if path and path.group(1).strip().endswith(".py") else "//"
+        return json.dumps({"edits": [{"file": path.group(1).strip() if path else None,
+                                      "start_line": int(m.group(1)), "end_line": int(m.group(1)),
+                                      "replacement": f"{m.group(2)}  {comment} mock edit"}]})
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, obj):
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, content_type, pieces):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for piece in pieces:
+                        data = piece.encode("utf-8")
+                        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client stopped reading early (e.g. llm_stream abort)
+
+            def _chunks(self, text):
+                n = mock.stream_chunk
+                return [text[i:i + n] for i in range(0, len(text), n)] or [""]
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/v1/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+                elif self.path == "/__stats":
+                    self._send_json(200, mock.stats)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                except Exception:
+                    payload = {}
+                path = self.path.rstrip("/")
+                if path.endswith("/chat/completions"):
+                    prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+                elif path.endswith("/api/generate"):
+                    prompt = str(payload.get("prompt", ""))
+                elif path.endswith("/api/chat"):
+                    prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+                else:
+                    self._send_json(404, {"error": "not found"})
+                    return
+                status, reply, delay = mock._plan(prompt)
+                time.sleep(delay)
+                if status != 200:
+                    self._send_json(status, {"error": {"message": "mock failure", "code": status}})
+                    return
+                model = payload.get("model", "mock-model")
+                if path.endswith("/chat/completions"):
+                    self._openai(payload, model, reply)
+                else:
+                    self._ollama(payload, model, reply, chat=path.endswith("/api/chat"))
+
+            def _openai(self, payload, model, reply):
+                created = int(time.time())
+                if payload.get("stream"):
+                    mock.stats["streams"] += 1
+                    events = []
+                    for piece in self._chunks(reply):
+                        chunk = {"id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                                 "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                        events.append(f"data: {json.dumps(chunk)}\n\n")
+                    done = {"id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                    events += [f"data: {json.dumps(done)}\n\n", "data: [DONE]\n\n"]
+                    self._send_stream("text/event-stream", events)
+                    return
+                self._send_json(200, {
+                    "id": "mock", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(reply) // 4, "total_tokens": len(reply) // 4},
+                })
+
+            def _ollama(self, payload, model, reply, chat=False):
+                def body(piece, done):
+                    obj = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+                    if chat:
+                        obj["message"] = {"role": "assistant", "content": piece}
+                    else:
+                        obj["response"] = piece
+                    return obj
+                # like Ollama, stream NDJSON unless "stream": false
+                if payload.get("stream", True):
+                    mock.stats["streams"] += 1
+                    lines = [json.dumps(body(p, False)) + "\n" for p in self._chunks(reply)]
+                    lines.append(json.dumps(body("", True)) + "\n")
+                    self._send_stream("application/x-ndjson", lines)
+                else:
+                    self._send_json(200, body(reply, True))
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline OpenAI-compatible / Ollama mock LLM server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", default="lognormal:0.7,0.5",
+                    help="fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,SIGMA (seconds)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 replies")
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 replies")
+    ap.add_argument("--hang-rate", type=float, default=0.0, help="fraction of requests that stall --hang-seconds")
+    ap.add_argument("--hang-seconds", type=float, default=120.0)
+    ap.add_argument("--corpus-dir", action="append", help="directory with raw_resp_*.txt / raw_gemini_pipeline_*.json")
+    ap.add_argument("--include-diffs", action="store_true", help="also replay saved *.diff patches")
+    ap.add_argument("--skip-empty", action="store_true", help="drop empty recorded replies")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus_dir, include_diffs=args.include_diffs, skip_empty=args.skip_empty)
+    server = MockLLMServer(args.host, args.port, args.latency, args.error_rate, args.rate_limit_rate,
+                           args.hang_rate, args.hang_seconds, corpus, args.seed)
+    print(f"[*] Mock LLM server on {server.url} replaying {len(corpus)} recorded replies")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""In-process unified-diff application with offset search and context fuzz.
+
+Checking a candidate patch used to mean one `git apply --check` subprocess
+per file (reconstruct_patches / rerun_failed_snippets), and
+dynamic_tester.apply_patches_from_dir did nothing at all. Here patches are
+parsed with diff_model and applied to in-memory buffers of a `Snapshot` of
+the workspace, which reads (and indexes) each file once, so hundreds of
+candidates can be dry-run in one process.
+
+Each hunk is located like GNU patch does it: at its stated line, else at the
+nearest position within PATCH_MAX_OFFSET lines ("offset"), else with up to
+PATCH_FUZZ context lines dropped from its ends or whitespace ignored
+("fuzz"); otherwise it is a "conflict". Hunks are matched against the
+original file, so every patch in a batch sees the same snapshot.
+
+    python patch_apply.py --repo ../python_repo --patches patches_py_fixed --out dry_run.json
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import diff_model
+
+FUZZ = int(os.getenv("PATCH_FUZZ", "2"))
+MAX_OFFSET = int(os.getenv("PATCH_MAX_OFFSET", "1000"))
+SKIP_DIRS = {".git", "__pycache__", "build", "node_modules", ".venv", "venv"}
+# worst hunk outcome decides the file / patch status
+_RANK = {"applied": 0, "offset": 1, "fuzz": 2, "conflict": 3, "error": 4}
+
+
+class FileBuffer:
+    """Lines of one file without line endings, plus what is needed to write it back."""
+
+    def __init__(self, text: str):
+        self.eol = "\r\n" if "\r\n" in text else "\n"
+        self.final_eol = text.endswith(("\n", "\r"))
+        self.lines = text.replace("\r\n", "\n").split("\n")
+        if self.final_eol:
+            self.lines.pop()
+        self._index = {}
+
+    def positions(self, line: str, loose: bool = False) -> list:
+        """0-based positions of a line (whitespace-insensitive when loose), built on first use."""
+        if loose not in self._index:
+            index = {}
+            for n, text in enumerate(self.lines):
+                index.setdefault(" ".join(text.split()) if loose else text, []).append(n)
+            self._index[loose] = index
+        return self._index[loose].get(" ".join(line.split()) if loose else line, [])
+
+    def text(self, lines: list) -> str:
+        return self.eol.join(lines) + (self.eol if self.final_eol and lines else "")
+
+
+class Snapshot:
+    """Read-once view of a workspace; patch paths are resolved against it."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._files = {}
+        self._by_name = None
+        self.reads = 0
+
+    def _names(self) -> dict:
+        if self._by_name is None:
+            self._by_name = {}
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+                for name in filenames:
+                    rel = Path(dirpath, name).relative_to(self.root).as_posix()
+                    self._by_name.setdefault(name, []).append(rel)
+        return self._by_name
+
+    def resolve(self, path: str):
+        """Workspace-relative path for a patch path (tries -p0..-pN, then a unique basename)."""
+        if not path:
+            return None
+        parts = path.replace("\\", "/").strip("/").split("/")
+        for n in range(len(parts)):
+            candidate = "/".join(parts[n:])
+            if (self.root / candidate).is_file():
+                return candidate
+        matches = self._names().get(parts[-1], [])
+        return matches[0] if len(matches) == 1 else None
+
+    def update(self, contents: dict):
+        """Take over the contents of an applied patch (as written by write_contents)."""
+        for rel, text in contents.items():
+            self._files[rel] = None if text is None else FileBuffer(text)
+
+    def buffer(self, rel: str):
+        if rel not in self._files:
+            try:
+                self._files[rel] = FileBuffer((self.root / rel).read_text(encoding="utf-8", errors="surrogateescape"))
+                self.reads += 1
+            except OSError:
+                self._files[rel] = None
+        return self._files[rel]
+
+
+def _matches(lines: list, at: int, block: list, loose: bool) -> bool:
+    if at < 0 or at + len(block) > len(lines):
+        return False
+    if loose:
+        return all(" ".join(a.split()) == " ".join(b.split()) for a, b in zip(lines[at:at + len(block)], block))
+    return lines[at:at + len(block)] == block
+
+
+def _locate(buf: FileBuffer, block: list, expected: int, lo: int, max_offset: int, loose: bool):
+    """Nearest position >= lo where block matches, within max_offset of expected."""
+    if not block:
+        return expected if lo <= expected <= len(buf.lines) else None
+    best = None
+    for pos in buf.positions(block[0], loose):
+        if pos < lo or abs(pos - expected) > max_offset:
+            continue
+        if best is not None and abs(pos - expected) >= abs(best - expected):
+            continue
+        if _matches(buf.lines, pos, block, loose):
+            best = pos
+    return best
+
+
+def locate_hunk(buf: FileBuffer, hunk, delta: int, lo: int, fuzz: int = FUZZ, max_offset: int = MAX_OFFSET) -> dict:
+    """Where a hunk applies in buf: {'status', 'start', 'end', 'new', 'line', 'offset', 'fuzz', 'whitespace'}.
+
+    start/end are 0-based bounds of the replaced lines in the original file
+    (without context dropped by fuzz) and line the 1-based line the hunk starts at;
+    delta is the offset found for earlier hunks of the same file.
+    """
+    body = [line for line in hunk.lines if line[:1] != "\\"]
+    old = [line[1:] for line in body if line[:1] in (" ", "-")]
+    new = [line[1:] for line in body if line[:1] in (" ", "+")]
+    lead = next((n for n, line in enumerate(body) if line[:1] != " "), len(body))
+    trail = next((n for n, line in enumerate(reversed(body)) if line[:1] != " "), len(body))
+    # insertions (no old lines) go after old_start; everything else starts at old_start
+    expected = (hunk.old_start if not old else hunk.old_start - 1) + delta
+    for level in range(fuzz + 1):
+        top, bottom = min(level, lead), min(level, trail)
+        if level and not (top or bottom):
+            break
+        block = old[top:len(old) - bottom]
+        for loose in (False, True):
+            pos = _locate(buf, block, expected + top, lo, max_offset, loose)
+            if pos is None:
+                continue
+            start = pos - top
+            offset = start - (hunk.old_start - 1 if old else hunk.old_start)
+            fuzzed = level or loose
+            status = "fuzz" if fuzzed else "offset" if offset else "applied"
+            return {"status": status, "start": pos, "end": pos + len(block), "new": new[top:len(new) - bottom],
+                    "line": start + 1, "offset": offset, "fuzz": level, "whitespace": loose}
+    return {"status": "conflict", "offset": None, "fuzz": None}
+
+
+def apply_file(buf: FileBuffer, file_diff, fuzz: int = FUZZ, max_offset: int = MAX_OFFSET):
+    """(new lines or None, [per-hunk results]) for one FileDiff against buf."""
+    results, pieces, cursor, delta = [], [], 0, 0
+    for n, hunk in enumerate(file_diff.hunks, start=1):
+        found = locate_hunk(buf, hunk, delta, cursor, fuzz, max_offset)
+        results.append({"hunk": n, "old_start": hunk.old_start, **{k: v for k, v in found.items()
+                                                                    if k not in ("start", "end", "new")}})
+        if found["status"] == "conflict":
+            continue
+        pieces.append(buf.lines[cursor:found["start"]])
+        pieces.append(found["new"])
+        cursor = found["end"]
+        delta = found["offset"]
+    if any(r["status"] == "conflict" for r in results):
+        return None, results
+    pieces.append(buf.lines[cursor:])
+    return [line for piece in pieces for line in piece], results
+
+
+def _worst(statuses) -> str:
+    return max(statuses, key=_RANK.__getitem__, default="error")
+
+
+def apply_patch(snapshot: Snapshot, patch, fuzz: int = FUZZ, max_offset: int = MAX_OFFSET) -> dict:
+    """Dry-run one patch (text or diff_model.Patch) against the snapshot.
+
+    Returns {'status', 'files': [{'path', 'status', 'hunks': [...]}], 'contents': {path: new text}};
+    nothing is written.
+    """
+    if isinstance(patch, str):
+        patch = diff_model.parse(patch).repair()
+    report = {"status": "error", "files": [], "contents": {}}
+    if not patch.files:
+        report["reason"] = "no file diffs"
+        return report
+    for f in patch.files:
+        entry = {"path": f.path, "status": "error", "hunks": []}
+        report["files"].append(entry)
+        if f.old_path == diff_model.DEV_NULL:
+            rel = f.new_path
+            if snapshot.resolve(rel) is not None:
+                entry["reason"] = "file already exists"
+                continue
+            entry["status"] = "applied"
+            report["contents"][rel] = "\n".join(l[1:] for h in f.hunks for l in h.lines if l[:1] == "+") + "\n"
+            continue
+        rel = snapshot.resolve(f.old_path)
+        buf = snapshot.buffer(rel) if rel else None
+        if rel in report["contents"] and report["contents"][rel] is not None:
+            buf = FileBuffer(report["contents"][rel])  # second diff of the same file in one patch
+        if buf is None:
+            entry["reason"] = "file not found"
+            continue
+        entry["path"] = rel
+        new_lines, entry["hunks"] = apply_file(buf, f, fuzz, max_offset)
+        entry["status"] = _worst(h["status"] for h in entry["hunks"])
+        if new_lines is not None:
+            report["contents"][rel] = None if f.new_path == diff_model.DEV_NULL else buf.text(new_lines)
+    report["status"] = _worst(e["status"] for e in report["files"])
+    return report
+
+
+def write_contents(root, contents: dict):
+    """Write the new file contents of an apply_patch report (None deletes the file)."""
+    root = Path(root)
+    for rel, text in contents.items():
+        target = root / rel
+        if text is None:
+            target.unlink(missing_ok=True)
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text, encoding="utf-8", errors="surrogateescape", newline="")
+
+
+def dry_run(root, patch_paths, fuzz: int = FUZZ, max_offset: int = MAX_OFFSET) -> dict:
+    """Dry-run many patch files against one snapshot of root; per-patch and per-hunk outcomes."""
+    snapshot = Snapshot(root)
+    started = time.perf_counter()
+    patches, summary = [], {status: 0 for status in _RANK}
+    for path in patch_paths:
+        path = Path(path)
+        try:
+            result = apply_patch(snapshot, path.read_text(encoding="utf-8", errors="ignore"), fuzz, max_offset)
+        except Exception as e:
+            result = {"status": "error", "files": [], "reason": str(e)}
+        result.pop("contents", None)
+        patches.append({"patch": path.name, **result})
+        summary[result["status"]] += 1
+    elapsed = time.perf_counter() - started
+    return {"repo": str(root), "patches": patches, "summary": summary, "elapsed_s": round(elapsed, 3),
+            "files_read": snapshot.reads, "fuzz": fuzz, "max_offset": max_offset}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dry-run unified diffs against a workspace without git apply")
+    ap.add_argument("--repo", required=True, help="workspace root the patches refer to")
+    ap.add_argument("--patches", required=True, help="patch file or directory of *.diff files")
+    ap.add_argument("--fuzz", type=int, default=FUZZ)
+    ap.add_argument("--max-offset", type=int, default=MAX_OFFSET)
+    ap.add_argument("--out", help="write the JSON report to this path")
+    args = ap.parse_args()
+
+    target = Path(args.patches)
+    paths = sorted(target.glob("*.diff")) if target.is_dir() else [target]
+    report = dry_run(args.repo, paths, args.fuzz, args.max_offset)
+    for p in report["patches"]:
+        hunks = [h for f in p["files"] for h in f["hunks"]]
+        print(f"[{'-' if p['status'] in ('conflict', 'error') else '+'}] {p['patch']}: {p['status']} "
+              f"({', '.join(h['status'] for h in hunks) or p.get('reason') or 'no hunks'})")
+    print(f"[*] {len(paths)} patches in {report['elapsed_s']}s ({report['files_read']} files read): {report['summary']}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[+] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
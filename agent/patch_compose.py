@@ -0,0 +1,235 @@
+"""Compose the per-snippet patches of one iteration into one patch per file.
+
+run_pipeline writes an independent patch_{iteration}_{ts}_{i}.diff per
+snippet; applied one after another, the first patch that changes a file's
+line count shifts every later hunk for that file, so they fail or land in
+the wrong place. `compose()` places every candidate hunk against the
+current content of the file (patch_apply.locate_hunk, so offsets and fuzz
+are absorbed), merges the patches whose hunks do not overlap into one
+combined diff, and records a decision per patch:
+
+- merged:    all hunks placed, no overlap with an earlier patch
+- duplicate: the same change was already merged from another snippet
+- conflict:  overlaps a patch merged earlier (lower snippet index wins);
+             queued for the next iteration (PATCH_COMPOSE_QUEUE_ROUNDS
+             times) and then dropped
+- stale:     does not apply to the current content at all; dropped
+
+`compose_iteration()` writes the combined diff and the decisions next to the
+patches (combined/combined_{iteration}_{ts}.diff and .json), so each
+iteration needs one apply and one rebuild instead of one per snippet. Given
+build/test commands it first verifies the candidates in parallel overlays
+(patch_verify): rejected ones are decided "rejected", the rest are merged
+best verdict first. Verdicts and apply outcomes go to patch_store, so an
+identical patch is not verified again while the files it touches are unchanged.
+"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import diff_model
+import edit_ops
+import patch_apply
+import patch_store
+import patch_verify
+
+QUEUE_ROUNDS = int(os.getenv("PATCH_COMPOSE_QUEUE_ROUNDS", "2"))
+COMBINED_DIR = "combined"
+QUEUE_FILE = "queue.json"
+PATCH_NAME_RE = re.compile(r"^patch_(?:(\d+)_)?(\d+)_(\d+)\.diff$")
+
+
+def _order(name: str):
+    """Priority of a patch file: snippet index within its iteration (lower wins)."""
+    m = PATCH_NAME_RE.match(name)
+    return (int(m.group(1) or 0), int(m.group(2)), int(m.group(3)), name) if m else (0, 0, 1 << 30, name)
+
+
+def _overlaps(a, b) -> bool:
+    (s1, e1), (s2, e2) = a, b
+    if s1 == e1 and s2 == e2:
+        return s1 == s2  # two insertions at the same point
+    if s1 == e1:
+        return s2 < s1 < e2
+    if s2 == e2:
+        return s1 < s2 < e1
+    return s1 < e2 and s2 < e1
+
+
+def _place(snapshot, patch, fuzz: int):
+    """[(rel, start, end, new_lines, hunk_result)] for every hunk, or (None, reason)."""
+    placements = []
+    for f in patch.files:
+        rel = snapshot.resolve(f.old_path) if f.old_path != diff_model.DEV_NULL else None
+        buf = snapshot.buffer(rel) if rel else None
+        if buf is None:
+            return None, f"file not found: {f.path}"
+        cursor, delta = 0, 0
+        for n, hunk in enumerate(f.hunks, start=1):
+            found = patch_apply.locate_hunk(buf, hunk, delta, cursor, fuzz)
+            if found["status"] == "conflict":
+                return None, f"hunk {n} of {rel} does not match the current content"
+            placements.append((rel, found["start"], found["end"], found["new"],
+                               {"file": rel, "hunk": n, "status": found["status"], "line": found["line"],
+                                "offset": found["offset"], "fuzz": found["fuzz"]}))
+            cursor, delta = found["end"], found["offset"]
+    return placements, None
+
+
+def compose(snapshot, candidates, fuzz: int = patch_apply.FUZZ) -> dict:
+    """Merge candidate patches [(name, text), ...] in priority order against snapshot.
+
+    Returns {'patch': combined diff text, 'files': [paths], 'decisions': [...]}.
+    """
+    accepted = {}  # rel -> [(start, end, new_lines, name)]
+    decisions = []
+    for name, text in candidates:
+        patch = diff_model.parse(text).repair()
+        if not patch.is_valid():
+            decisions.append({"patch": name, "decision": "stale", "reason": "not a valid diff"})
+            continue
+        placements, reason = _place(snapshot, patch, fuzz)
+        if placements is None:
+            decisions.append({"patch": name, "decision": "stale", "reason": reason})
+            continue
+        clash, same = None, 0
+        for rel, start, end, new, _ in placements:
+            for s, e, other_new, other in accepted.get(rel, []):
+                if (s, e, other_new) == (start, end, new):
+                    same += 1
+                    break
+                if _overlaps((start, end), (s, e)):
+                    clash = other
+                    break
+            if clash:
+                break
+        hunks = [p[4] for p in placements]
+        if clash:
+            decisions.append({"patch": name, "decision": "conflict", "with": clash, "hunks": hunks})
+        elif same == len(placements):
+            decisions.append({"patch": name, "decision": "duplicate", "hunks": hunks})
+        else:
+            for rel, start, end, new, _ in placements:
+                if not any((s, e, n) == (start, end, new) for s, e, n, _ in accepted.get(rel, [])):
+                    accepted.setdefault(rel, []).append((start, end, new, name))
+            decisions.append({"patch": name, "decision": "merged", "hunks": hunks,
+                              "rebased": any(h["status"] != "applied" for h in hunks)})
+
+    combined = []
+    for rel in sorted(accepted):
+        old = snapshot.buffer(rel).lines
+        new, cursor = [], 0
+        for start, end, lines, _ in sorted(accepted[rel], key=lambda p: (p[0], p[1])):
+            new += old[cursor:start] + lines
+            cursor = end
+        new += old[cursor:]
+        combined.append(edit_ops.render_diff(rel, 1, old, new))
+    return {"patch": "".join(combined), "files": sorted(accepted), "decisions": decisions}
+
+
+def _load_queue(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def compose_iteration(repo, patch_dir, names, iteration=None, fuzz: int = patch_apply.FUZZ,
+                      verify_cmds: dict = None) -> dict:
+    """Compose this iteration's patch files (plus queued conflicts) against repo and write the result.
+
+    verify_cmds ({'build', 'test'}) enables verification of the candidates
+    before selection; if both commands are empty the report says it was skipped. Returns a summary for the iteration report: counts per
+    decision, the combined patch file name and the decisions themselves.
+    """
+    patch_dir = Path(patch_dir)
+    out_dir = patch_dir / COMBINED_DIR
+    queue_path = out_dir / QUEUE_FILE
+    queue = _load_queue(queue_path)
+    fresh = sorted(set(names or []), key=_order)
+    queued = [n for n in sorted(queue, key=_order) if n not in fresh and (patch_dir / n).exists()]
+    candidates = []
+    for name in fresh + queued:
+        try:
+            candidates.append((name, (patch_dir / name).read_text(encoding="utf-8", errors="ignore")))
+        except OSError as e:
+            print(f"[!] Compose: cannot read {name}: {e}")
+
+    started = time.time()
+    total = len(candidates)
+    snapshot = patch_apply.Snapshot(repo)
+    keys = {name: patch_store.key(snapshot, text) for name, text in candidates}
+    verification, verdicts, rejected, skipped = None, {}, [], None
+    if verify_cmds is not None and not (verify_cmds.get("build") or verify_cmds.get("test")):
+        skipped = "no build or test command"
+        print(f"[!] Compose: verification requested but skipped ({skipped}); "
+              "set PATCH_VERIFY_BUILD_CMD / PATCH_VERIFY_TEST_CMD")
+    elif verify_cmds and candidates:
+        build_cmd, test_cmd = verify_cmds.get("build", ""), verify_cmds.get("test", "")
+        cmds = patch_store.commands_hash(build_cmd, test_cmd)
+        for name, _ in candidates:
+            known = patch_store.lookup(*keys[name], "verify", cmds)
+            if known:
+                verdicts[name] = {"patch": name, "verdict": known["status"], "vs_baseline": known.get("vs_baseline"),
+                                  "cached": True}
+        unknown = [c for c in candidates if c[0] not in verdicts]
+        verification = patch_verify.verify(repo, unknown, build_cmd, test_cmd) if unknown else None
+        for v in (verification or {}).get("verdicts", []):
+            verdicts[v["patch"]] = v
+            if patch_store.persist_verdict(v):
+                patch_store.record(*keys[v["patch"]], "verify", v["verdict"], vs_baseline=v.get("vs_baseline"), cmds=cmds)
+        ranking = patch_verify.rank([verdicts[name] for name, _ in candidates])
+        position = {name: n for n, name in enumerate(ranking["order"])}
+        rejected = [{"patch": name, "decision": "rejected", "verdict": reason}
+                    for name, reason in ranking["rejected"].items()]
+        candidates = sorted([c for c in candidates if c[0] in position], key=lambda c: position[c[0]])
+    result = compose(snapshot, candidates, fuzz)
+    for d in result["decisions"]:
+        if d["decision"] != "stale" or "hunk" in d.get("reason", ""):
+            patch_store.record(*keys[d["patch"]], "apply", "conflict" if d["decision"] == "stale" else "applied")
+    patch_store.flush()
+    result["decisions"] += rejected
+    next_queue = {}
+    for d in result["decisions"]:
+        if d["decision"] != "conflict":
+            continue
+        rounds = queue.get(d["patch"], 0) + 1
+        if rounds <= QUEUE_ROUNDS:
+            next_queue[d["patch"]] = rounds
+            d["decision"] = "queued"
+        else:
+            d["decision"] = "dropped"
+    counts = {}
+    for d in result["decisions"]:
+        counts[d["decision"]] = counts.get(d["decision"], 0) + 1
+
+    summary = {"candidates": total, "from_queue": len(queued), "counts": counts,
+               "files": result["files"], "combined": None, "compose_s": round(time.time() - started, 3),
+               "decisions": result["decisions"]}
+    if skipped:
+        summary["verification"] = {"skipped": skipped}
+    elif verdicts:
+        summary["verification"] = {k: (verification or {}).get(k, 0) for k in ("workers", "wall_s", "serial_s")}
+        summary["verification"]["baseline"] = verification["baseline"]["verdict"] if verification else None
+        summary["verification"]["reused"] = sum(1 for v in verdicts.values() if v.get("cached"))
+        summary["verification"]["counts"] = {}
+        for v in verdicts.values():
+            summary["verification"]["counts"][v["verdict"]] = summary["verification"]["counts"].get(v["verdict"], 0) + 1
+        for d in result["decisions"]:
+            v = verdicts.get(d["patch"])
+            if v is not None:
+                d["verdict"], d["vs_baseline"] = v["verdict"], v.get("vs_baseline")
+    try:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if result["patch"]:
+            stem = f"combined_{iteration}_{int(time.time())}" if iteration is not None else f"combined_{int(time.time())}"
+            (out_dir / f"{stem}.diff").write_text(result["patch"], encoding="utf-8")
+            (out_dir / f"{stem}.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+            summary["combined"] = f"{COMBINED_DIR}/{stem}.diff"
+        queue_path.write_text(json.dumps(next_queue, indent=2), encoding="utf-8")
+    except OSError as e:
+        print(f"[!] Compose: failed to write results: {e}")
+    print(f"[*] Composed {len(candidates)} patches into {len(result['files'])} files: {counts}")
+    return summary
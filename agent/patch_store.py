@@ -0,0 +1,205 @@
+"""Fingerprint store of generated patches and their earlier outcomes.
+
+The LLMs often return byte-identical or whitespace-equivalent diffs across
+iterations and reruns (the archives are full of patch_1_*_1/_2/_3
+near-duplicates), and each copy was validated, dry-run and built/tested
+again. A patch's fingerprint is taken from its diff_model parse, so index
+lines, ---/+++ timestamps, hunk counts, markdown around the diff and trailing
+whitespace do not matter; file paths, hunk positions and line content do.
+
+Outcomes are stored per fingerprint and per *context*, a hash of the
+current content of the files the patch touches: an "apply" outcome (from
+patch_compose) or a "verify" verdict (from patch_verify, together with the
+hash of the build/test commands) is only reused while those files are
+unchanged, for PATCH_STORE_TTL_DAYS. run_pipeline does not write patches
+whose outcome in the current context was a rejection (a conflict, not
+applying, or doing worse than the baseline under the current commands),
+and patch_compose only verifies candidates without a stored verdict. Call flush() after a
+batch of record() calls.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import diff_model
+
+STORE_PATH = Path(os.getenv("PATCH_STORE_PATH", str(Path(__file__).resolve().parent / "patches" / "patch_fingerprints.json")))
+ENABLED = os.getenv("PATCH_STORE", "1") not in ("0", "false", "False")
+TTL_S = float(os.getenv("PATCH_STORE_TTL_DAYS", "14")) * 86400
+MAX_ENTRIES = int(os.getenv("PATCH_STORE_MAX_ENTRIES", "5000"))
+MAX_NAMES = 5
+# outcomes that say "this exact patch is not worth trying again here"; a verify
+# verdict also rejects when it was worse than the baseline (vs_baseline == "regressed")
+REJECTING = {"apply": {"conflict", "error"}, "verify": {"not_applied"}}
+
+_lock = threading.Lock()
+_store = None
+_dirty = False
+_stats = {"hits": 0, "misses": 0, "recorded": 0}
+
+
+def _load():
+    global _store
+    if _store is None:
+        try:
+            _store = json.loads(STORE_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            _store = {}
+    return _store
+
+
+def _digest(parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode("utf-8", errors="surrogateescape"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _canonical(patch) -> list:
+    out = []
+    for f in patch.files:
+        out.append(f"F {f.old_path} {f.new_path}")
+        for h in f.hunks:
+            out.append(f"@ {h.old_start}")
+            out.extend(line.rstrip() or line[:1] for line in h.lines)
+    return out
+
+
+def fingerprint(text: str):
+    """Normalized fingerprint of a patch text, or None if it holds no usable diff."""
+    patch = diff_model.parse(text).repair()
+    return _digest(_canonical(patch)) if patch.files else None
+
+
+def key(snapshot, text: str):
+    """(fingerprint, context) of a patch against a patch_apply.Snapshot; (None, None) if unusable."""
+    patch = diff_model.parse(text).repair()
+    if not patch.files:
+        return None, None
+    parts = []
+    for f in patch.files:
+        rel = snapshot.resolve(f.old_path) if f.old_path != diff_model.DEV_NULL else None
+        buf = snapshot.buffer(rel) if rel else None
+        parts += [rel or f"missing:{f.path}", "\n".join(buf.lines) if buf is not None else ""]
+    return _digest(_canonical(patch)), _digest(parts)
+
+
+def commands_hash(build_cmd: str = "", test_cmd: str = "") -> str:
+    return _digest([build_cmd or "", test_cmd or ""])[:12]
+
+
+def lookup(fp: str, ctx: str, kind: str, cmds: str = None):
+    """Stored outcome of a patch in this context ('apply' or 'verify'), or None."""
+    if not (ENABLED and fp and ctx):
+        return None
+    with _lock:
+        outcome = (_load().get(fp) or {}).get("outcomes", {}).get(f"{kind}:{ctx}")
+        if outcome and time.time() - outcome.get("at", 0) <= TTL_S and (cmds is None or outcome.get("cmds") == cmds):
+            _stats["hits"] += 1
+            return dict(outcome)
+        _stats["misses"] += 1
+        return None
+
+
+def rejected(fp: str, ctx: str, cmds: str = None):
+    """The stored rejecting outcome ('apply: conflict', 'verify: regressed', ...) or None.
+
+    Verify verdicts only count when they were recorded with the same build/test
+    commands (cmds, see commands_hash); without cmds only apply outcomes do.
+    """
+    for kind in ("verify", "apply"):
+        if kind == "verify" and cmds is None:
+            continue
+        outcome = lookup(fp, ctx, kind, cmds if kind == "verify" else None)
+        if outcome and outcome.get("status") in REJECTING[kind]:
+            return f"{kind}: {outcome['status']}"
+        if outcome and outcome.get("vs_baseline") == "regressed":
+            return f"{kind}: regressed"
+    return None
+
+
+def persist_verdict(verdict: dict) -> bool:
+    """Whether a patch_verify verdict is worth storing.
+
+    Transient results (timeout, error) are not; a build failure only when it
+    was worse than the baseline, since a shared one says nothing about the patch.
+    """
+    if verdict["verdict"] in ("pass", "fail", "not_applied"):
+        return True
+    return verdict.get("vs_baseline") == "regressed"
+
+
+def seen(fp: str, name: str = "") -> int:
+    """Count one more sighting of a fingerprint; returns how often it was seen before."""
+    global _dirty
+    if not (ENABLED and fp):
+        return 0
+    with _lock:
+        now = time.time()
+        entry = _load().setdefault(fp, {"first_seen": now, "seen": 0, "names": [], "outcomes": {}})
+        before = entry["seen"]
+        entry["seen"] += 1
+        entry["last_seen"] = now
+        if name and name not in entry["names"]:
+            entry["names"] = (entry["names"] + [name])[-MAX_NAMES:]
+        _dirty = True
+        return before
+
+
+def record(fp: str, ctx: str, kind: str, status: str, **details):
+    """Remember the outcome of a patch in a context; details (cmds, vs_baseline, ...) are stored with it."""
+    global _dirty
+    if not (ENABLED and fp and ctx):
+        return
+    with _lock:
+        now = time.time()
+        entry = _load().setdefault(fp, {"first_seen": now, "seen": 0, "names": [], "outcomes": {}})
+        entry["last_seen"] = now
+        entry["outcomes"][f"{kind}:{ctx}"] = {"status": status, "at": now, **details}
+        _stats["recorded"] += 1
+        _dirty = True
+
+
+def flush():
+    """Persist recorded outcomes, dropping expired outcomes and the least recently seen entries."""
+    global _dirty
+    if not ENABLED:
+        return
+    with _lock:
+        if not _dirty:
+            return
+        now = time.time()
+        store = _load()
+        for fp in list(store):
+            outcomes = store[fp].get("outcomes", {})
+            store[fp]["outcomes"] = {k: v for k, v in outcomes.items() if now - v.get("at", 0) <= TTL_S}
+        if len(store) > MAX_ENTRIES:
+            for fp in sorted(store, key=lambda fp: store[fp].get("last_seen", 0))[:len(store) - MAX_ENTRIES]:
+                del store[fp]
+        try:
+            STORE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp = STORE_PATH.with_suffix(".tmp")
+            tmp.write_text(json.dumps(store, indent=1, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, STORE_PATH)
+            _dirty = False
+        except Exception as e:
+            print(f"[Debug] Failed to persist patch store: {e}")
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_store or {})}
+
+
+def reset():
+    """Forget the in-memory copy and counters (tests / after STORE_PATH changes)."""
+    global _store, _dirty
+    with _lock:
+        _store = None
+        _dirty = False
+        for k in _stats:
+            _stats[k] = 0
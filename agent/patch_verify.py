@@ -0,0 +1,306 @@
+"""Parallel speculative verification of candidate patches in workspace overlays.
+
+Knowing whether a patch helps means rebuilding and re-testing, and that
+used to happen serially on the one shared workspace. Each candidate now
+gets its own overlay of the workspace: source files (LINK_SUFFIXES, which
+compilers and test runners only read) are hardlinked, so no file data is
+copied, and the files the patch edits are copy-on-write, i.e. unlinked and
+rewritten so the original is never touched. Everything else (Makefile,
+CMakeLists.txt, *.pro, fixtures, data) is copied: build steps such as
+qmake/cmake and tests rewrite those in place, which through a hardlink
+would modify the workspace. Build and
+targeted test commands run in the overlays on a process pool
+(PATCH_VERIFY_WORKERS), next to one unpatched baseline overlay, and every
+candidate gets a verdict:
+
+- not_applied / build_failed / timeout / fail / pass
+- vs_baseline: fixed (baseline did not pass, candidate does), regressed
+  (baseline passed and the candidate does not, or baseline built and the
+  candidate does not) or same; a workspace that already fails to build
+  therefore does not get every candidate rejected
+
+`rank()` turns verdicts into the order and rejections patch_compose uses
+to select patches. Commands are shell strings run in the overlay root;
+`{files}` is replaced by the changed files (for the baseline: every file
+any candidate changes; a step using {files} is skipped when there are none)
+and `{tests}` by the test files named after them (empty when there are
+none, i.e. the full suite runs).
+SKIP_DIRS (build output, caches) are not mirrored at all.
+
+    python patch_verify.py --repo ../python_repo --patches patches_py_fixed --test-cmd "python -m pytest -q {tests}"
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import diff_model
+import patch_apply
+
+WORKERS = int(os.getenv("PATCH_VERIFY_WORKERS", str(min(4, os.cpu_count() or 1))))
+TIMEOUT_S = float(os.getenv("PATCH_VERIFY_TIMEOUT_S", "300"))
+OUTPUT_TAIL = 2000
+SKIP_DIRS = patch_apply.SKIP_DIRS | {".pytest_cache", "release", "debug"}
+# read-only inputs of builds and tests, safe to share with the workspace by hardlink
+LINK_SUFFIXES = {".py", ".c", ".cc", ".cpp", ".cxx", ".h", ".hh", ".hpp", ".hxx", ".ui", ".qrc"}
+DEFAULT_COMMANDS = {
+    # only the touched files: unrelated broken modules must not fail every candidate
+    "py": {"build": f'"{sys.executable}" -m compileall -q {{files}}', "test": ""},
+    # filled in by commands(): a syntax check of the touched files with the C++ compiler found
+    "cpp": {"build": "", "test": ""},
+}
+CPP_STD = os.getenv("PATCH_VERIFY_CPP_STD", "c++17")
+# verdicts that take a candidate out of patch selection (besides vs_baseline == "regressed")
+REJECTED = {"not_applied", "error"}
+# verdicts of a run whose build step succeeded
+BUILT = {"pass", "fail"}
+# order among candidates that are no worse than the baseline
+_VERDICT_ORDER = {"pass": 0, "fail": 1, "build_failed": 2, "timeout": 2}
+
+
+def _cpp_syntax_check() -> str:
+    """`<cxx> -fsyntax-only` over {files}, with QT_INCLUDES on the include path; "" without a compiler."""
+    cxx = os.getenv("CXX") or shutil.which("g++") or shutil.which("clang++")
+    if not cxx:
+        return ""
+    includes = ["."]
+    for root in filter(None, (os.getenv("QT_INCLUDES") or "").replace(";", os.pathsep).split(os.pathsep)):
+        includes.append(root)
+        includes += [str(Path(root, sub)) for sub in ("QtCore", "QtGui", "QtWidgets") if Path(root, sub).is_dir()]
+    return f'"{cxx}" -fsyntax-only -std={CPP_STD} ' + " ".join(f'"-I{inc}"' for inc in includes) + " {files}"
+
+
+def commands(lang: str) -> dict:
+    """Build / test commands for a language: PATCH_VERIFY_BUILD_CMD / PATCH_VERIFY_TEST_CMD override the defaults."""
+    defaults = dict(DEFAULT_COMMANDS.get(lang, {"build": "", "test": ""}))
+    if lang == "cpp" and not defaults["build"]:
+        defaults["build"] = _cpp_syntax_check()
+    return {"build": os.getenv("PATCH_VERIFY_BUILD_CMD", defaults["build"]),
+            "test": os.getenv("PATCH_VERIFY_TEST_CMD", defaults["test"])}
+
+
+def _join(paths: list) -> str:
+    if os.name == "nt":
+        return subprocess.list2cmdline(paths)
+    return " ".join(shlex.quote(p) for p in paths)
+
+
+class Overlay:
+    """Mirror of a workspace: LINK_SUFFIXES files hardlinked, the rest copied; write() breaks links."""
+
+    def __init__(self, source, path):
+        self.source = Path(source)
+        self.root = Path(path)
+        self.linked = self.copied = 0
+
+    def create(self):
+        for dirpath, dirnames, filenames in os.walk(self.source):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            rel = Path(dirpath).relative_to(self.source)
+            (self.root / rel).mkdir(parents=True, exist_ok=True)
+            for name in filenames:
+                src, dst = Path(dirpath, name), self.root / rel / name
+                if src.suffix.lower() in LINK_SUFFIXES:
+                    try:
+                        os.link(src, dst)
+                        self.linked += 1
+                        continue
+                    except OSError:
+                        pass  # other filesystem / no hardlink support: plain copy
+                shutil.copy2(src, dst)
+                self.copied += 1
+        return self
+
+    def write(self, contents: dict):
+        """Copy-on-write the new contents of an apply_patch report (None deletes the file)."""
+        for rel, text in contents.items():
+            target = self.root / rel
+            if target.exists():
+                target.unlink()
+            if text is None:
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(text, encoding="utf-8", errors="surrogateescape", newline="")
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def targeted_tests(root: Path, changed: list) -> list:
+    """Test files named after the changed files (test_<stem>.py, <stem>_test.py, tst_<stem>.cpp)."""
+    stems = {Path(rel).stem for rel in changed}
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            stem = Path(name).stem
+            for s in stems:
+                if stem in (f"test_{s}", f"{s}_test", f"tst_{s}"):
+                    found.append(Path(dirpath, name).relative_to(root).as_posix())
+    return sorted(found)
+
+
+def _run(cmd: str, cwd: Path, deadline: float) -> dict:
+    started = time.time()
+    try:
+        proc = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True,
+                              timeout=max(1.0, deadline - started))
+        rc, out = proc.returncode, (proc.stdout or "") + (proc.stderr or "")
+    except subprocess.TimeoutExpired as e:
+        rc, out = None, str(e)
+    return {"cmd": cmd, "rc": rc, "elapsed_s": round(time.time() - started, 3), "output": out[-OUTPUT_TAIL:]}
+
+
+def verify_candidate(repo, name, patch_text, build_cmd="", test_cmd="", timeout_s=TIMEOUT_S, keep=False,
+                     files=None) -> dict:
+    """Apply one patch (or none, for the baseline) in a fresh overlay, then build and test it.
+
+    Runs in a pool worker, so everything it needs comes in as arguments.
+    files: what {files} stands for in the baseline run (the candidates' files).
+    """
+    started = time.time()
+    deadline = started + timeout_s
+    result = {"patch": name, "verdict": None, "apply": None, "build": None, "tests": None, "changed": []}
+    overlay = Overlay(repo, tempfile.mkdtemp(prefix="overlay_"))
+    try:
+        overlay.create()
+        result["overlay"] = {"root": str(overlay.root), "linked": overlay.linked, "copied": overlay.copied}
+        if patch_text is not None:
+            applied = patch_apply.apply_patch(patch_apply.Snapshot(repo), patch_text)
+            contents = applied.pop("contents", {})
+            result["apply"] = applied["status"]
+            if applied["status"] in ("conflict", "error"):
+                result["verdict"] = "not_applied"
+                return result
+            overlay.write(contents)
+            result["changed"] = sorted(contents)
+        touched = result["changed"] if patch_text is not None else sorted(files or [])
+        quoted = _join(touched)
+        tests = _join(targeted_tests(overlay.root, touched))
+        for step, cmd in (("build", build_cmd), ("tests", test_cmd)):
+            if not cmd or ("{files}" in cmd and not touched):
+                continue
+            run = _run(cmd.replace("{files}", quoted).replace("{tests}", tests), overlay.root, deadline)
+            result[step] = run
+            if run["rc"] is None:
+                result["verdict"] = "timeout"
+                return result
+            if run["rc"] != 0:
+                result["verdict"] = "build_failed" if step == "build" else "fail"
+                return result
+        result["verdict"] = "pass"
+        return result
+    except Exception as e:
+        result["verdict"] = "error"
+        result["error"] = str(e)
+        return result
+    finally:
+        result["elapsed_s"] = round(time.time() - started, 3)
+        if not keep:
+            overlay.cleanup()
+
+
+def _compare(verdict: str, baseline: str):
+    if baseline is None or verdict in ("not_applied", "error"):
+        return None
+    if baseline != "pass" and verdict == "pass":
+        return "fixed"
+    if baseline == "pass" and verdict != "pass":
+        return "regressed"
+    if baseline in BUILT and verdict not in BUILT:
+        return "regressed"  # the workspace built before this patch
+    return "same"
+
+
+def _touched(repo, candidates) -> list:
+    """Workspace paths any candidate patch changes (the baseline builds / tests the same files)."""
+    snapshot = patch_apply.Snapshot(repo)
+    touched = set()
+    for _, text in candidates:
+        for f in diff_model.parse(text).repair().files:
+            rel = snapshot.resolve(f.old_path) if f.old_path != diff_model.DEV_NULL else None
+            if rel:
+                touched.add(rel)
+    return sorted(touched)
+
+
+def verify(repo, candidates, build_cmd="", test_cmd="", workers: int = None, timeout_s: float = TIMEOUT_S) -> dict:
+    """Verify [(name, patch_text), ...] against repo in parallel overlays, plus one baseline run."""
+    started = time.time()
+    workers = max(1, workers or WORKERS)
+    jobs = [(None, None)] + list(candidates)
+    results = [None] * len(jobs)
+    touched = _touched(repo, candidates)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = {pool.submit(verify_candidate, str(repo), name, text, build_cmd, test_cmd, timeout_s, False,
+                               touched if text is None else None): i
+                   for i, (name, text) in enumerate(jobs)}
+        for fut in concurrent.futures.as_completed(futures):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                results[i] = {"patch": jobs[i][0], "verdict": "error", "error": str(e)}
+    baseline, verdicts = results[0], results[1:]
+    for v in verdicts:
+        v["vs_baseline"] = _compare(v["verdict"], baseline["verdict"])
+    counts = {}
+    for v in verdicts:
+        counts[v["verdict"]] = counts.get(v["verdict"], 0) + 1
+    serial_s = sum(r.get("elapsed_s", 0) for r in results)
+    wall_s = time.time() - started
+    print(f"[*] Verified {len(verdicts)} patches with {workers} workers in {wall_s:.1f}s "
+          f"(serial {serial_s:.1f}s): {counts}")
+    return {"repo": str(repo), "baseline": baseline, "verdicts": verdicts, "counts": counts,
+            "workers": workers, "wall_s": round(wall_s, 3), "serial_s": round(serial_s, 3)}
+
+
+def rank(verdicts: list) -> dict:
+    """{'order': names best-first, 'rejected': {name: reason}} for patch selection.
+
+    Only patches that do not apply or are worse than the baseline are
+    rejected; a build failure the baseline shares ranks as "same".
+    """
+    order, rejected = [], {}
+    for v in verdicts:
+        if v["verdict"] in REJECTED or v.get("vs_baseline") == "regressed":
+            rejected[v["patch"]] = v.get("vs_baseline") if v.get("vs_baseline") == "regressed" else v["verdict"]
+        else:
+            order.append(v)
+    preference = {"fixed": 0, None: 1, "same": 1}
+    order.sort(key=lambda v: (preference.get(v.get("vs_baseline"), 1), _VERDICT_ORDER.get(v["verdict"], 2)))
+    return {"order": [v["patch"] for v in order], "rejected": rejected}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build and test candidate patches in parallel workspace overlays")
+    ap.add_argument("--repo", required=True, help="workspace root the patches refer to")
+    ap.add_argument("--patches", required=True, help="patch file or directory of *.diff files")
+    ap.add_argument("--build-cmd", default="", help="shell command run in each overlay before the tests")
+    ap.add_argument("--test-cmd", default="", help="shell command; {files} / {tests} are the changed / targeted test files")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--timeout", type=float, default=TIMEOUT_S, help="seconds per candidate")
+    ap.add_argument("--out", help="write the JSON report to this path")
+    args = ap.parse_args()
+
+    target = Path(args.patches)
+    paths = sorted(target.glob("*.diff")) if target.is_dir() else [target]
+    candidates = [(p.name, p.read_text(encoding="utf-8", errors="ignore")) for p in paths]
+    report = verify(args.repo, candidates, args.build_cmd, args.test_cmd, args.workers, args.timeout)
+    for v in report["verdicts"]:
+        mark = "+" if v["verdict"] == "pass" else "-"
+        print(f"[{mark}] {v['patch']}: {v['verdict']}" + (f" ({v['vs_baseline']})" if v.get("vs_baseline") else ""))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[+] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Token-budget-aware prompt assembly.
+
+Prompts used to be trimmed ad hoc (GEMINI_TRIM_TAIL, the Gemini
+minimal-snippet retry, hard-coded README/file-list slices in
+hf_test_generator), so an oversized prompt was only discovered by walking the
+retry ladder. `fit_prompt` fills a template's sections into a per-provider
+input budget up front, shrinking the least important sections first.
+
+Token counts use tiktoken when it is installed (optional dependency,
+imported on the first count that needs it, not at startup) and a
+per-provider characters-per-token ratio otherwise. Budgets are
+context window minus reserved output tokens and can be overridden with
+PROMPT_BUDGET_<PROVIDER> (e.g. PROMPT_BUDGET_HUGGINGFACE_ROUTER=4000).
+"""
+import math
+import os
+
+# provider -> (context window tokens, tokens reserved for the reply)
+MODEL_LIMITS = {
+    "HuggingFace_Router": (8192, 1024),
+    "HuggingFace_Router_2": (8192, 1024),
+    "HuggingFace": (1024, 256),
+    "Gemini": (32768, 2048),
+    "Qwen": (8192, 1024),
+    "Ollama": (4096, 512),
+    "OpenAI": (8192, 1024),
+    "Transformers": (1024, int(os.getenv("TRANSFORMERS_MAX_TOKENS", "256"))),
+}
+DEFAULT_LIMITS = (4096, 512)
+# Heuristic chars/token when tiktoken is unavailable (code-heavy prompts tokenize densely)
+CHARS_PER_TOKEN = {"Gemini": 4.0, "OpenAI": 3.5, "Qwen": 3.5}
+DEFAULT_CHARS_PER_TOKEN = 3.2
+# Tokens kept free for suffixes ask_llm appends (strict-diff instructions, YES/NO stage)
+SAFETY_MARGIN = int(os.getenv("PROMPT_SAFETY_MARGIN", "128"))
+
+_encoders = {}
+
+
+def _encoder(provider: str):
+    if provider not in ("OpenAI", "Qwen"):
+        return None
+    if "cl100k" not in _encoders:
+        try:
+            import tiktoken
+            _encoders["cl100k"] = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoders["cl100k"] = None
+    return _encoders["cl100k"]
+
+
+def count_tokens(text: str, provider: str = None) -> int:
+    """Estimated number of input tokens `text` costs with `provider`."""
+    text = text or ""
+    enc = _encoder(provider)
+    if enc is not None:
+        return len(enc.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN.get(provider, DEFAULT_CHARS_PER_TOKEN))
+
+
+def budget_for(provider: str) -> int:
+    """Input-token budget for provider: env override or context window minus reply reserve."""
+    env = os.getenv("PROMPT_BUDGET_" + (provider or "default").upper())
+    if env:
+        return int(env)
+    ctx, reserve = MODEL_LIMITS.get(provider, DEFAULT_LIMITS)
+    return max(256, ctx - reserve - SAFETY_MARGIN)
+
+
+def budget_for_any(providers) -> int:
+    """Smallest budget among providers that may receive the same prompt (e.g. router fallbacks)."""
+    return min(budget_for(p) for p in providers)
+
+
+def fits(text: str, provider: str) -> bool:
+    return count_tokens(text, provider) <= budget_for(provider)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: str = None, keep: str = "head") -> str:
+    """Cut text on line boundaries to at most max_tokens; keep='head' or 'tail'."""
+    if count_tokens(text, provider) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    lines = text.splitlines()
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    marker = "... (truncated to fit the prompt budget)"
+    room = max_tokens - count_tokens(marker, provider) - 1
+    for line in lines:
+        cost = count_tokens(line + "\n", provider)
+        if used + cost > room:
+            break
+        kept.append(line)
+        used += cost
+    if not kept and lines:
+        # a single huge line: fall back to a character cut
+        chars = int(room * CHARS_PER_TOKEN.get(provider, DEFAULT_CHARS_PER_TOKEN))
+        kept = [lines[0][:chars] if keep == "head" else lines[0][-chars:]]
+    if keep == "tail":
+        kept.reverse()
+        return "\n".join([marker] + kept)
+    return "\n".join(kept + [marker])
+
+
+def fit_prompt(template: str, sections: dict, provider: str = None, budget: int = None,
+               shrink_order: list = None, keep: dict = None):
+    """Format template with sections, trimming sections until the prompt fits the budget.
+
+    shrink_order: section names trimmed first to last (default: dict order
+      reversed). keep: per-section 'head' (default) or 'tail'.
+    Returns (prompt, info) with info = {provider, budget, tokens, trimmed}.
+    """
+    budget = budget if budget is not None else budget_for(provider)
+    keep = keep or {}
+    sections = dict(sections)
+    order = list(shrink_order or reversed(list(sections)))
+    fixed = count_tokens(template.format(**{k: "" for k in sections}), provider)
+    trimmed = []
+    costs = {k: count_tokens(v, provider) for k, v in sections.items()}
+    for name in order:
+        if fixed + sum(costs.values()) <= budget:
+            break
+        allowed = budget - fixed - sum(c for k, c in costs.items() if k != name)
+        sections[name] = truncate_to_tokens(sections[name], max(0, allowed), provider, keep.get(name, "head"))
+        costs[name] = count_tokens(sections[name], provider)
+        trimmed.append(name)
+    prompt = template.format(**sections)
+    tokens = count_tokens(prompt, provider)
+    if trimmed:
+        print(f"[Debug] Prompt for {provider or 'default'} trimmed ({', '.join(trimmed)}) "
+              f"to ~{tokens} tokens (budget {budget})")
+    return prompt, {"provider": provider, "budget": budget, "tokens": tokens, "trimmed": trimmed}
@@ -1,3 +1,6 @@
+# Bump when BUG_FIX_PROMPT / BATCH_FIX_PROMPT / EDIT_FIX_PROMPT change: failure_memo entries are keyed by it
+PROMPT_VERSION = "2"
+
 BUG_FIX_PROMPT = """
 You are an expert software engineer.
 
@@ -30,3 +33,67 @@ Your task: Generate a valid unified diff patch to fix bugs in the given code sni
 # Final Output:
 Return ONLY the unified diff patch or "".
 """
+
+
+BATCH_FIX_PROMPT = """
+You are an expert software engineer.
+
+Your task: Generate ONE valid unified diff patch for the file {file_path} that fixes the bugs in the numbered code regions below, based on the static analysis report. Each region shows real line numbers from the file.
+
+---------------------
+# Static Analysis Report
+{analysis}
+---------------------
+# Buggy Code Regions in {file_path}
+{code_regions}
+---------------------
+
+# Output Rules (STRICT):
+- Output ONLY a valid unified diff patch, compatible with `git apply`.
+- DO NOT include any text before or after the patch. No explanations, no examples.
+- The first line MUST start with:
+  diff --git a/<file> b/<file>
+- MUST include:
+  index <hash>..<hash> <mode>
+  --- a/<file>
+  +++ b/<file>
+- Include only {file_path}, with one @@ hunk per region you change. Use the line numbers shown.
+- Leave regions that need no change out of the patch.
+- The patch MUST be syntactically correct and compilable.
+- Do NOT wrap the output in code blocks (no ``` or markdown).
+- Do NOT include commentary or instructional text.
+- If there are no necessary changes, return exactly: ""
+
+# Final Output:
+Return ONLY the unified diff patch or "".
+"""
+
+
+# LLM_RESPONSE_FORMAT=edits: JSON edit operations instead of a diff (see edit_ops.py)
+EDIT_FIX_PROMPT = """
+You are an expert software engineer.
+
+Your task: Fix the bugs in the numbered code regions of {file_path} below, based on the static analysis report. Each line is shown as "<line number> | <code>".
+
+---------------------
+# Static Analysis Report
+{analysis}
+---------------------
+# Buggy Code Regions in {file_path}
+{code_regions}
+---------------------
+
+# Output Rules (STRICT):
+- Output ONLY a JSON object of the form:
+  {{"edits": [{{"file": "{file_path}", "start_line": <int>, "end_line": <int>, "replacement": "<new code>"}}]}}
+- Each edit replaces lines start_line..end_line (inclusive, using the numbers shown) with "replacement".
+- "replacement" holds the complete new code for those lines, with its original indentation and WITHOUT line numbers or the "|" separator. Use "\\n" between lines.
+- To insert without replacing, set end_line = start_line - 1. To delete lines, use an empty replacement.
+- Only edit lines shown above; edits must not overlap.
+- The resulting code MUST be syntactically correct and compilable.
+- Do NOT wrap the output in code blocks and do NOT include commentary.
+- If there are no necessary changes, return exactly: {{"edits": []}}
+
+# Final Output:
+Return ONLY the JSON object.
+"""
@@ -0,0 +1,237 @@
+"""Token-bucket rate limiting for LLM providers, shared by all workspaces.
+
+Every FlaskApp upload runs in its own background thread and may call
+`generate_tests` and the patch pipeline at the same time as other uploads,
+so the HF router used to see bursts from all of them at once and throttle.
+`acquire(provider, tokens)` blocks until the provider's requests-per-minute
+and tokens-per-minute buckets allow the call. Waiting callers are served
+round-robin by workspace (set with `workspace(ws_id)` / `set_workspace`), so
+one large upload cannot starve the others.
+
+Limits come from LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER> (falling back to
+LLM_RPM / LLM_TPM; 0 = unlimited). Set LLM_RATE_LIMIT_DB to a SQLite path to
+share the buckets between processes (e.g. several Flask workers); fairness
+between workspaces is then still per process.
+"""
+import collections
+import contextlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+MAX_WAIT_S = float(os.getenv("LLM_RATE_MAX_WAIT", "300"))
+
+_local = threading.local()
+
+
+def set_workspace(ws_id):
+    """Tag LLM calls made from the current thread with a workspace id."""
+    _local.workspace = ws_id
+
+
+def current_workspace():
+    return getattr(_local, "workspace", None) or "default"
+
+
+@contextlib.contextmanager
+def workspace(ws_id):
+    previous = getattr(_local, "workspace", None)
+    _local.workspace = ws_id
+    try:
+        yield
+    finally:
+        _local.workspace = previous
+
+
+def bind(fn):
+    """Wrap fn so it runs under the caller's workspace in another thread (executor submits)."""
+    ws = current_workspace()
+
+    def run(*args, **kwargs):
+        with workspace(ws):
+            return fn(*args, **kwargs)
+    return run
+
+
+class TokenBucket:
+    """In-process bucket holding up to `per_minute` units, refilled continuously."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def peek(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60.0 / self.capacity
+
+    def try_take(self, amount: float) -> float:
+        """Take amount if available and return 0, else return seconds until it will be."""
+        wait = self.peek(amount)
+        if not wait:
+            self.level -= min(amount, self.capacity)
+        return wait
+
+
+class SQLiteTokenBucket:
+    """Bucket whose level lives in a SQLite row so several processes share it."""
+
+    def __init__(self, path: str, key: str, per_minute: float):
+        self.path, self.key, self.capacity = path, key, float(per_minute)
+
+    def _level(self, conn, now):
+        row = conn.execute("SELECT level, updated FROM buckets WHERE key = ?", (self.key,)).fetchone()
+        return self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.capacity / 60.0)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, level REAL, updated REAL)")
+        return conn
+
+    def peek(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        conn = self._connect()
+        try:
+            level = self._level(conn, time.time())
+        finally:
+            conn.close()
+        return 0.0 if level >= amount else (amount - level) * 60.0 / self.capacity
+
+    def try_take(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            level = self._level(conn, now)
+            wait = 0.0
+            if level >= amount:
+                level -= amount
+            else:
+                wait = (amount - level) * 60.0 / self.capacity
+            conn.execute("INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)", (self.key, level, now))
+            conn.execute("COMMIT")
+            return wait
+        finally:
+            conn.close()
+
+
+class ProviderLimiter:
+    """RPM + TPM buckets for one provider with round-robin queuing by workspace."""
+
+    def __init__(self, name: str, rpm: float, tpm: float, db_path: str = None):
+        self.name = name
+        self.buckets = []
+        for kind, limit in (("rpm", rpm), ("tpm", tpm)):
+            if limit and limit > 0:
+                bucket = (SQLiteTokenBucket(db_path, f"{name}:{kind}", limit) if db_path else TokenBucket(limit))
+                self.buckets.append((kind, bucket))
+        self._cond = threading.Condition()
+        self._queues = collections.OrderedDict()  # workspace -> deque of tickets
+        self._tickets = itertools.count()
+        self.stats = {"granted": 0, "cancelled": 0, "waited_s": 0.0, "max_wait_s": 0.0, "by_workspace": {}}
+
+    def _wait_needed(self, tokens: float) -> float:
+        amounts = [(bucket, 1 if kind == "rpm" else tokens) for kind, bucket in self.buckets]
+        # check every bucket before taking from any, so a TPM shortfall does not burn an RPM slot
+        wait = max(bucket.peek(amount) for bucket, amount in amounts)
+        if wait:
+            return wait
+        for bucket, amount in amounts:
+            wait = bucket.try_take(amount)
+            if wait:
+                return wait  # another process got there first (shared SQLite buckets)
+        return 0.0
+
+    def acquire(self, tokens: float, ws: str, cancel=None) -> float:
+        """Wait for this workspace's turn and the budget; stops early (no slot taken) once cancel.is_set()."""
+        if not self.buckets:
+            return 0.0
+        started = time.monotonic()
+        ticket = next(self._tickets)
+        with self._cond:
+            self._queues.setdefault(ws, collections.deque()).append(ticket)
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        self.stats["cancelled"] += 1
+                        return time.monotonic() - started
+                    turn = next(iter(self._queues))
+                    if turn == ws and self._queues[ws][0] == ticket:
+                        wait = self._wait_needed(tokens)
+                        if not wait or time.monotonic() - started > MAX_WAIT_S:
+                            if wait:
+                                print(f"[!] Rate limiter for {self.name}: gave up waiting after {MAX_WAIT_S:.0f}s")
+                            break
+                        self._cond.wait(timeout=min(wait, 5.0))
+                    else:
+                        self._cond.wait(timeout=1.0)
+            finally:
+                queue = self._queues[ws]
+                queue.remove(ticket)
+                # round-robin: the served workspace goes to the back of the line
+                del self._queues[ws]
+                if queue:
+                    self._queues[ws] = queue
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            self.stats["granted"] += 1
+            self.stats["waited_s"] = round(self.stats["waited_s"] + waited, 3)
+            self.stats["max_wait_s"] = round(max(self.stats["max_wait_s"], waited), 3)
+            self.stats["by_workspace"][ws] = self.stats["by_workspace"].get(ws, 0) + 1
+        if waited > 1.0:
+            print(f"[Debug] Rate limiter: {ws} waited {waited:.1f}s for {self.name}")
+        return waited
+
+
+_limiters = {}
+_lock = threading.Lock()
+
+
+def _limit(kind: str, provider: str) -> float:
+    env = os.getenv(f"LLM_{kind}_{provider.upper()}")
+    return float(env if env is not None else os.getenv(f"LLM_{kind}", "0"))
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    with _lock:
+        lim = _limiters.get(provider)
+        if lim is None:
+            lim = ProviderLimiter(provider, _limit("RPM", provider), _limit("TPM", provider),
+                                  os.getenv("LLM_RATE_LIMIT_DB") or None)
+            _limiters[provider] = lim
+        return lim
+
+
+def acquire(provider: str, tokens: float = 0, ws: str = None, cancel=None) -> float:
+    """Block until provider's RPM/TPM budget allows one request of `tokens`; returns seconds waited.
+
+    cancel (e.g. an llm_dispatch.CancelToken) ends the wait without taking a slot.
+    """
+    try:
+        return get_limiter(provider).acquire(tokens, ws or current_workspace(), cancel)
+    except Exception as e:
+        # never let the limiter itself break an LLM call
+        print(f"[Debug] Rate limiter error for {provider}: {e}")
+        return 0.0
+
+
+def stats() -> dict:
+    with _lock:
+        items = list(_limiters.items())
+    return {name: dict(lim.stats, by_workspace=dict(lim.stats["by_workspace"]))
+            for name, lim in items if lim.buckets}
+
+
+def reset():
+    with _lock:
+        _limiters.clear()
@@ -1,7 +1,16 @@
+import concurrent.futures
+import hashlib
+import json
 import os
+import re
+import time
 from pathlib import Path
 import traceback
 
+import llm_cache
+import prompt_builder
+import rate_limiter
+
 try:
     from langchain_core.messages import HumanMessage
 except ImportError:
@@ -16,6 +25,13 @@ except ImportError:
     ChatOpenAI = None
 
 REPORT_FILE = Path(__file__).resolve().parent.parent / "dynamic_analysis_report.txt"
+SUGGESTIONS_FILE = "reasoning_suggestions.json"
+# Failures analysed in parallel (1 = the old sequential loop)
+REASONING_CONCURRENCY = max(1, int(os.getenv("REASONING_CONCURRENCY", "4")))
+# Send up to REASONING_BATCH_SIZE short failures (< REASONING_BATCH_MAX_CHARS) per request
+REASONING_BATCH = os.getenv("REASONING_BATCH", "0") in ("1", "true", "True")
+REASONING_BATCH_SIZE = max(1, int(os.getenv("REASONING_BATCH_SIZE", "4")))
+REASONING_BATCH_MAX_CHARS = int(os.getenv("REASONING_BATCH_MAX_CHARS", "1500"))
 
 # === Initialize LLM client (OpenAI / Qwen / Gemini) ===
 API_KEY = os.getenv("OPENAI_API_KEY")  # or QWEN_API_KEY / GEMINI_API_KEY
@@ -24,48 +40,91 @@ if ChatOpenAI and API_KEY:
     llm_client = ChatOpenAI(api_key=API_KEY, model="gpt-4", temperature=0.2)
 
 
-def generate_fix_suggestion(error_log: str, language: str = "py") -> str:
+def generate_fix_suggestion(error_log: str, language: str = "py", use_cache: bool = None) -> str:
     """
     Ask LLM to read a test failure log and suggest a possible patch/fix.
+    Suggestions are served from the shared LLM cache unless use_cache=False
+    (None follows the cache's global/workspace bypass).
     """
     if llm_client is None:
         return "[Reasoning module skipped] LLM client not initialized."
 
-    prompt = f"""
+    template = f"""
 You are a software engineer assistant. A test has failed in a {language.upper()} project.
 Below is the test output or error log:
 
-{error_log}
+{{error_log}}
 
 Please suggest a possible fix. Focus on concrete code changes, not abstract ideas.
 Provide the answer as a unified diff if possible, or as a short code snippet.
 """
+    # long logs keep their tail, where the failure usually is
+    prompt, _ = prompt_builder.fit_prompt(template, {"error_log": error_log}, provider="OpenAI",
+                                          keep={"error_log": "tail"})
+
+    model = getattr(llm_client, "model_name", "gpt-4")
+    temperature = getattr(llm_client, "temperature", 0.2)
+    cached = llm_cache.get("OpenAI", model, temperature, prompt, bypass=None if use_cache is None else not use_cache)
+    if cached:
+        return cached
 
     try:
+        rate_limiter.acquire("OpenAI", prompt_builder.count_tokens(prompt, "OpenAI"))
         resp = llm_client.invoke([HumanMessage(content=prompt)])
-        content = getattr(resp, "content", str(resp))
-        return content.strip()
+        content = getattr(resp, "content", str(resp)).strip()
+        llm_cache.put("OpenAI", model, temperature, prompt, content)
+        return content
     except Exception as e:
         return f"[Reasoning module error] {e}\n{traceback.format_exc()}"
 
 
-def run_reasoning_on_report(report_path: Path = REPORT_FILE, language: str = "py") -> None:
-    """
-    Parse the dynamic analysis report and generate suggestions for failed tests.
-    """
-    if not report_path.exists():
-        print("[Reasoning] Report not found, skipping reasoning.")
-        return
+def generate_batch_suggestions(error_logs: list, language: str = "py", use_cache: bool = None) -> list:
+    """One request for several short failures; returns one suggestion per log, or None
+    when the reply cannot be split back into per-failure sections."""
+    if llm_client is None:
+        return None
+    failures = "\n\n".join(f"### Failure {n}\n{log}" for n, log in enumerate(error_logs, start=1))
+    prompt = f"""
+You are a software engineer assistant. Several tests have failed in a {language.upper()} project.
+Below are their outputs, each under a "### Failure N" heading:
+
+{failures}
+
+For EACH failure suggest a possible fix. Focus on concrete code changes, not abstract ideas.
+Answer with one section per failure, in order, each starting with its own "### Failure N" heading.
+"""
+    model = getattr(llm_client, "model_name", "gpt-4")
+    temperature = getattr(llm_client, "temperature", 0.2)
+    content = llm_cache.get("OpenAI", model, temperature, prompt, bypass=None if use_cache is None else not use_cache)
+    if not content:
+        try:
+            rate_limiter.acquire("OpenAI", prompt_builder.count_tokens(prompt, "OpenAI"))
+            resp = llm_client.invoke([HumanMessage(content=prompt)])
+            content = getattr(resp, "content", str(resp)).strip()
+        except Exception as e:
+            print(f"[Reasoning] Batched request failed: {e}")
+            return None
+    parts = re.split(r"^#+\s*Failure\s+(\d+)\s*:?\s*$", content, flags=re.MULTILINE)
+    sections = {int(parts[k]): parts[k + 1].strip() for k in range(1, len(parts) - 1, 2)}
+    if sorted(sections) != list(range(1, len(error_logs) + 1)):
+        return None
+    llm_cache.put("OpenAI", model, temperature, prompt, content)
+    return [sections[n] for n in range(1, len(error_logs) + 1)]
+
 
-    report_text = report_path.read_text(encoding="utf-8")
+def parse_failures(report_text: str) -> list:
+    """Failure blocks of a dynamic analysis report: a "[-]" line plus its indented detail lines."""
     failed_sections = []
     current_fail = []
     in_fail = False
     for line in report_text.splitlines():
         if line.startswith("[-]"):
+            if in_fail and current_fail:
+                failed_sections.append("\n".join(current_fail))
             in_fail = True
             current_fail = [line]
-        elif in_fail and line.startswith("    "):
+        elif in_fail and line[:1] in (" ", "\t"):
+            # dynamic_tester indents details by one space in the report
             current_fail.append(line)
         elif in_fail:
             # End of failure block
@@ -76,11 +135,106 @@ def run_reasoning_on_report(report_path: Path = REPORT_FILE, language: str = "py
     # Catch last failure
     if in_fail and current_fail:
         failed_sections.append("\n".join(current_fail))
+    return failed_sections
+
+
+_VOLATILE_RE = re.compile(r"0x[0-9a-fA-F]+|\b\d+(\.\d+)?s\b|/tmp/[^\s:'\"]+")
+
+
+def failure_signature(fail_text: str) -> str:
+    """Hash of a failure's details without the test name, addresses, timings and temp paths."""
+    lines = fail_text.splitlines()
+    body = "\n".join(" ".join(_VOLATILE_RE.sub("#", l).split()) for l in lines[1:] if l.strip())
+    return hashlib.sha1((body or lines[0] if lines else "").encode("utf-8", errors="ignore")).hexdigest()[:16]
 
-    # Generate suggestions
-    print(f"[Reasoning] Found {len(failed_sections)} failed tests to analyze")
-    for i, fail_text in enumerate(failed_sections, start=1):
-        print(f"\n=== Reasoning on failure {i} ===")
-        suggestion = generate_fix_suggestion(fail_text, language=language)
-        print(suggestion)
+
+def _test_name(fail_text: str) -> str:
+    first = fail_text.splitlines()[0] if fail_text else ""
+    return first[3:].replace("... FAIL", "").strip()
+
+
+def run_reasoning_on_report(report_path: Path = REPORT_FILE, language: str = "py", concurrency: int = None,
+                            batch: bool = None, out_path: Path = None, use_cache: bool = None) -> dict:
+    """
+    Parse the dynamic analysis report and generate suggestions for failed tests.
+
+    Failures with identical details (same stack from different generated
+    tests) are analysed once; unique failures run on a pool of `concurrency`
+    workers (REASONING_CONCURRENCY), and with `batch` (REASONING_BATCH) short
+    failures share one request. Suggestions are written as JSON to
+    reasoning_suggestions.json next to the report (or out_path) and returned.
+    use_cache=False regenerates every suggestion instead of reusing cached ones.
+    """
+    if not report_path.exists():
+        print("[Reasoning] Report not found, skipping reasoning.")
+        return {}
+
+    failed_sections = parse_failures(report_path.read_text(encoding="utf-8"))
+    groups = {}
+    for fail_text in failed_sections:
+        groups.setdefault(failure_signature(fail_text), []).append(fail_text)
+    print(f"[Reasoning] Found {len(failed_sections)} failed tests to analyze "
+          f"({len(groups)} unique failure logs)")
+
+    entries = [{"id": sig, "tests": [_test_name(t) for t in texts], "fan_in": len(texts),
+                "failure": texts[0], "suggestion": None, "batched": False, "latency_s": None}
+               for sig, texts in groups.items()]
+
+    # Optionally pack short failures into shared requests; the rest go one by one
+    batched, units = [], []
+    if batch if batch is not None else REASONING_BATCH:
+        short = [e for e in entries if len(e["failure"]) <= REASONING_BATCH_MAX_CHARS]
+        batched = [short[k:k + REASONING_BATCH_SIZE] for k in range(0, len(short), REASONING_BATCH_SIZE)]
+        batched = [b for b in batched if len(b) > 1]
+    in_batch = {id(e) for b in batched for e in b}
+    units = [("batch", b) for b in batched] + [("single", [e]) for e in entries if id(e) not in in_batch]
+
+    def run_unit(unit):
+        kind, members = unit
+        started = time.time()
+        suggestions = None
+        if kind == "batch":
+            suggestions = generate_batch_suggestions([e["failure"] for e in members], language=language,
+                                                     use_cache=use_cache)
+            if suggestions is None:
+                print(f"[Reasoning] Batched reply for {len(members)} failures could not be split; asking one by one")
+        if suggestions is None:
+            suggestions = [generate_fix_suggestion(e["failure"], language=language, use_cache=use_cache)
+                           for e in members]
+        else:
+            for e in members:
+                e["batched"] = True
+        for e, suggestion in zip(members, suggestions):
+            e["suggestion"] = suggestion
+            e["latency_s"] = round(time.time() - started, 3)
+
+    workers = max(1, min(int(concurrency if concurrency is not None else REASONING_CONCURRENCY), len(units) or 1))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for fut in [pool.submit(rate_limiter.bind(run_unit), u) for u in units]:
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"[Reasoning] Suggestion failed: {e}")
+
+    for i, e in enumerate(entries, start=1):
+        suffix = f" (same failure in {e['fan_in']} tests)" if e["fan_in"] > 1 else ""
+        print(f"\n=== Reasoning on failure {i}{suffix} ===")
+        print(e["suggestion"])
         print("=== End suggestion ===")
+
+    result = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "report": str(report_path),
+        "language": language,
+        "failures": len(failed_sections),
+        "unique_failures": len(entries),
+        "requests": len(units),
+        "suggestions": entries,
+    }
+    out_path = Path(out_path) if out_path else report_path.with_name(SUGGESTIONS_FILE)
+    try:
+        out_path.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[Reasoning] Suggestions written to {out_path}")
+    except Exception as e:
+        print(f"[Reasoning] Failed to write {out_path}: {e}")
+    return result
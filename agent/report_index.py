@@ -0,0 +1,99 @@
+"""Indexed view of a static-analysis report for per-snippet prompt slicing.
+
+`run_pipeline` used to paste the whole cppcheck / pylint report into
+BUG_FIX_PROMPT for every snippet. IssueIndex parses the report once per
+iteration, keyed by file basename and line, so each prompt can carry only
+the findings near its snippet plus a short global summary.
+"""
+import os
+import re
+
+from prompt_builder import count_tokens
+
+# path:line: ... (optionally with a Windows drive prefix and a column)
+ISSUE_RE = re.compile(r"^\s*(?P<path>(?:[A-Za-z]:)?[^:\n]+?):(?P<line>\d+):(?P<rest>.*)$")
+SNIPPET_HEADER_RE = re.compile(r"^\s*(?P<path>(?:[A-Za-z]:)?[^:\n]+?):(?P<line>\d+)")
+SEVERITY_RE = re.compile(r"\b(fatal error|error|warning|style|performance|portability|information)\b", re.IGNORECASE)
+PYLINT_CODE_RE = re.compile(r"\b([CRWEF])\d{4}\b")
+PYLINT_SEVERITY = {"C": "convention", "R": "refactor", "W": "warning", "E": "error", "F": "error"}
+
+# Lines on each side of the snippet's reported line that count as "relevant"
+SNIPPET_WINDOW = int(os.getenv("REPORT_SLICE_WINDOW", "5"))
+# Findings from the same file used when none fall inside the window
+NEAREST_FALLBACK = 5
+
+
+def _key(path: str) -> str:
+    return os.path.basename(path.strip().replace("\\", "/")).lower()
+
+
+def estimate_tokens(text: str, provider: str = None) -> int:
+    """Token estimate for prompt-size logging (see prompt_builder.count_tokens)."""
+    return count_tokens(text, provider)
+
+
+class IssueIndex:
+    """Static-analysis findings indexed by file basename and line number."""
+
+    def __init__(self, report_text: str):
+        self.by_file = {}
+        self.severity_counts = {}
+        self.total = 0
+        for raw in (report_text or "").splitlines():
+            m = ISSUE_RE.match(raw)
+            if not m:
+                continue
+            line = raw.strip()
+            self.by_file.setdefault(_key(m.group("path")), []).append((int(m.group("line")), line))
+            self.total += 1
+            sev = self._severity(m.group("rest"))
+            self.severity_counts[sev] = self.severity_counts.get(sev, 0) + 1
+        for hits in self.by_file.values():
+            hits.sort(key=lambda h: h[0])
+
+    @staticmethod
+    def _severity(rest: str) -> str:
+        m = SEVERITY_RE.search(rest)
+        if m:
+            return m.group(1).lower()
+        m = PYLINT_CODE_RE.search(rest)
+        if m:
+            return PYLINT_SEVERITY[m.group(1)]
+        return "other"
+
+    def findings_for(self, path: str, start: int, end: int) -> list:
+        """Report lines for `path` whose line number lies in [start, end]."""
+        hits = self.by_file.get(_key(path), [])
+        inside = [text for ln, text in hits if start <= ln <= end]
+        if inside or not hits:
+            return inside
+        centre = (start + end) // 2
+        nearest = sorted(hits, key=lambda h: abs(h[0] - centre))[:NEAREST_FALLBACK]
+        return [text for _, text in sorted(nearest, key=lambda h: h[0])]
+
+    def summary(self, max_files: int = 8) -> str:
+        """Short global overview: totals by severity and the busiest files."""
+        if not self.total:
+            return "Global summary: no file:line findings parsed from the report."
+        sev = ", ".join(f"{k}={v}" for k, v in sorted(self.severity_counts.items(), key=lambda kv: -kv[1]))
+        busiest = sorted(self.by_file.items(), key=lambda kv: -len(kv[1]))[:max_files]
+        files = ", ".join(f"{name} ({len(hits)})" for name, hits in busiest)
+        return f"Global summary: {self.total} findings ({sev}) in {len(self.by_file)} files; most affected: {files}"
+
+    def context_for_snippet(self, snippet: str, lines: list = None) -> str:
+        """Analysis text for one snippet: its relevant findings plus the global summary.
+
+        lines: optional extra reported line numbers covered by the snippet
+        (e.g. when several findings were merged into one region).
+        """
+        first = (snippet.splitlines()[0] if snippet else "").strip()
+        m = SNIPPET_HEADER_RE.match(first)
+        if not m:
+            return self.summary()
+        path = m.group("path")
+        reported = [int(m.group("line"))] + list(lines or [])
+        start = max(1, min(reported) - SNIPPET_WINDOW)
+        end = max(reported) + SNIPPET_WINDOW
+        findings = self.findings_for(path, start, end)
+        body = "\n".join(findings) if findings else f"(no findings recorded for {path} near line {reported[0]})"
+        return f"Findings for {path} lines {start}-{end}:\n{body}\n\n{self.summary()}"
@@ -0,0 +1,243 @@
+"""Append-only, gzip-compressed JSONL journal of raw LLM responses.
+
+The Gemini path used to write a pretty-printed raw_gemini_pipeline_*.json per
+variant / trimmed / minimal attempt and run_pipeline a raw_resp_{i}.txt per
+failed snippet, synchronously on the hot path, so hundreds of files piled up
+in patches_py_fixed/. `record()` now only enqueues the entry; a background
+thread appends it to patches/journal/responses-<ts>.jsonl.gz (rotated at
+RESPONSE_JOURNAL_ROTATE_MB compressed) and indexes it by workspace and
+snippet in patches/journal/index.sqlite3 so `find()` can pull the responses
+of one upload or snippet back out. When the queue is full entries are
+dropped (and counted) rather than blocking an LLM call.
+"""
+import atexit
+import contextlib
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+JOURNAL_DIR = Path(os.getenv("RESPONSE_JOURNAL_DIR", str(Path(__file__).resolve().parent / "patches" / "journal")))
+ENABLED = os.getenv("RESPONSE_JOURNAL", "1") not in ("0", "false", "False")
+ROTATE_BYTES = int(float(os.getenv("RESPONSE_JOURNAL_ROTATE_MB", "8")) * 1024 * 1024)
+QUEUE_MAX = int(os.getenv("RESPONSE_JOURNAL_QUEUE", "10000"))
+FLUSH_S = 1.0
+
+_local = threading.local()
+_lock = threading.Lock()
+_writer = None
+_stats = {"queued": 0, "written": 0, "dropped": 0, "rotations": 0}
+
+
+def _context() -> dict:
+    return dict(getattr(_local, "context", None) or {})
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """Attach fields (e.g. snippet=3) to every entry recorded from this thread."""
+    previous = getattr(_local, "context", None)
+    _local.context = dict(previous or {}, **fields)
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+
+def bind(fn):
+    """Wrap fn so entries it records in another thread keep the caller's context."""
+    ctx = _context()
+
+    def run(*args, **kwargs):
+        with context(**ctx):
+            return fn(*args, **kwargs)
+    return run
+
+
+class _Writer(threading.Thread):
+    def __init__(self, directory: Path):
+        super().__init__(name="response-journal", daemon=True)
+        self.dir = directory
+        self.queue = queue.Queue(maxsize=QUEUE_MAX)
+        self._fh = None
+        self._raw = None
+        self._segment = None
+        self._seq = 0
+        self._segments = 0
+        self._db = None
+
+    def _open_segment(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._segments += 1
+        name = f"responses-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._segments}.jsonl.gz"
+        self._segment = name
+        self._raw = open(self.dir / name, "ab")
+        self._fh = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._seq = 0
+
+    def _close_segment(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._raw.close()
+            self._fh = self._raw = None
+
+    def _index(self):
+        if self._db is None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.dir / "index.sqlite3"))
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (ts REAL, workspace TEXT, snippet TEXT, "
+                             "kind TEXT, provider TEXT, segment TEXT, seq INTEGER)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS by_ws ON entries (workspace, snippet)")
+        return self._db
+
+    def _write(self, batch):
+        if self._fh is None or self._raw.tell() >= ROTATE_BYTES:
+            if self._fh is not None:
+                with _lock:
+                    _stats["rotations"] += 1
+            self._close_segment()
+            self._open_segment()
+        rows = []
+        for entry in batch:
+            self._fh.write((json.dumps(entry, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            rows.append((entry["ts"], entry.get("workspace"), str(entry.get("snippet", "")), entry.get("kind"),
+                         entry.get("provider"), self._segment, self._seq))
+            self._seq += 1
+        # sync flush so readers (find(), mock_llm_server) see complete gzip blocks
+        self._fh.flush()
+        db = self._index()
+        db.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        db.commit()
+        with _lock:
+            _stats["written"] += len(batch)
+
+    def run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=FLUSH_S)]
+            except queue.Empty:
+                continue
+            while len(batch) < 500 and batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            try:
+                if [e for e in batch if e is not None]:
+                    self._write([e for e in batch if e is not None])
+                if stop:
+                    self._close_segment()
+            except Exception as e:
+                print(f"[Debug] Response journal write failed: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                return
+
+
+def _get_writer() -> _Writer:
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = _Writer(JOURNAL_DIR)
+            _writer.start()
+        return _writer
+
+
+def close(timeout: float = 5.0):
+    """Write out queued entries and finish the current gzip segment."""
+    global _writer
+    with _lock:
+        writer, _writer = _writer, None
+    if writer is None:
+        return
+    try:
+        writer.queue.put(None, timeout=timeout)
+    except queue.Full:
+        return
+    writer.join(timeout)
+
+
+atexit.register(close)
+
+
+def record(kind: str, content: str, provider: str = None, **fields):
+    """Queue one raw response for the journal; never blocks the caller."""
+    if not ENABLED:
+        return
+    from rate_limiter import current_workspace
+    entry = {"ts": time.time(), "kind": kind, "provider": provider, "workspace": current_workspace()}
+    entry.update(_context())
+    entry.update(fields)
+    entry["content"] = content or ""
+    try:
+        _get_writer().queue.put_nowait(entry)
+        with _lock:
+            _stats["queued"] += 1
+    except queue.Full:
+        with _lock:
+            _stats["dropped"] += 1
+
+
+def flush(timeout: float = 10.0) -> bool:
+    """Wait until every queued entry is on disk (tests, shutdown, find())."""
+    writer = _writer
+    if writer is None:
+        return True
+    deadline = time.time() + timeout
+    while writer.queue.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.01)
+    return not writer.queue.unfinished_tasks
+
+
+def read_segment(path) -> list:
+    """All entries of one journal segment (tolerates a truncated last block)."""
+    entries = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    entries.append(None)  # keep positions aligned with the index
+    except (EOFError, OSError):
+        pass  # segment still being written
+    return entries
+
+
+def find(workspace: str = None, snippet=None, kind: str = None, limit: int = 100, directory: Path = None) -> list:
+    """Journal entries for a workspace and/or snippet, newest first."""
+    directory = Path(directory or JOURNAL_DIR)
+    flush()
+    db_path = directory / "index.sqlite3"
+    if not db_path.exists():
+        return []
+    where, args = [], []
+    for col, val in (("workspace", workspace), ("snippet", None if snippet is None else str(snippet)), ("kind", kind)):
+        if val is not None:
+            where.append(f"{col} = ?")
+            args.append(val)
+    sql = "SELECT segment, seq FROM entries" + (" WHERE " + " AND ".join(where) if where else "")
+    conn = sqlite3.connect(str(db_path))
+    try:
+        rows = conn.execute(sql + " ORDER BY ts DESC LIMIT ?", args + [limit]).fetchall()
+    finally:
+        conn.close()
+    segments, out = {}, []
+    for segment, seq in rows:
+        if segment not in segments:
+            segments[segment] = read_segment(directory / segment)
+        if seq < len(segments[segment]) and segments[segment][seq] is not None:
+            out.append(segments[segment][seq])
+    return out
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
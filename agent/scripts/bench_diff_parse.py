@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: diff_model single-pass parsing vs the legacy regex chain.
+
+Runs every file of the patch corpus (by default the archived
+`patches_py_fixed/*.diff` plus the raw responses next to them) through
+
+- legacy: clean_patch_output -> validate_patch -> sanitize_patch ->
+  header-repair regexes -> clean_patch_output -> validate_patch, as
+  `_extract_valid_patch` did before diff_model (frozen copy below), and
+- model:  diff_model.parse -> repair -> is_valid -> render,
+
+and reports time per response, how many responses each turns into a patch
+and how many of the legacy patches had hunk counts that do not match their
+bodies (which `git apply` rejects).
+
+Usage (from agent/):
+    python scripts/bench_diff_parse.py --repeat 20 --out ../docs/diff_parse_benchmark.md
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AGENT_DIR))
+
+import diff_model  # noqa: E402
+
+DEFAULT_CORPUS = AGENT_DIR / "archive_python_tools_20251124_142656" / "patches_py_fixed"
+PATTERNS = ("*.diff", "raw_resp*.txt")
+
+
+# --- legacy chain (lc_pipeline before diff_model), kept verbatim for comparison ---
+
+def _legacy_clean(patch: str) -> str:
+    if not patch:
+        return ""
+    patch = re.sub(r"^```diff", "", patch, flags=re.MULTILINE)
+    patch = re.sub(r"^```", "", patch, flags=re.MULTILINE)
+    valid_lines = []
+    for line in patch.splitlines():
+        line = line.rstrip()
+        if line.startswith("diff --git"):
+            parts = line.split()
+            if len(parts) != 4:
+                continue
+        if line.startswith(("diff --git", "--- ", "+++ ", "@@ ", "+", "-", " ")):
+            if line in ("+", "-"):
+                continue
+            valid_lines.append(line)
+    patch = "\n".join(valid_lines)
+    if not patch.startswith("diff --git"):
+        return ""
+    return patch.strip()
+
+
+def _legacy_validate(patch_text: str) -> bool:
+    if not patch_text:
+        return False
+    return bool("diff --git" in patch_text
+                and re.search(r"@@ -\d+,\d+ \+\d+,\d+ @@", patch_text)
+                and "--- a/" in patch_text
+                and "+++ b/" in patch_text)
+
+
+def _legacy_sanitize(raw_patch: str) -> str:
+    lines = raw_patch.strip().splitlines()
+    clean_lines = []
+    inside_patch = False
+    for line in lines:
+        if line.startswith("diff --git"):
+            inside_patch = True
+            clean_lines = [line]
+            continue
+        if not inside_patch:
+            continue
+        if line.strip().startswith("Explanation:") or line.strip().startswith("```"):
+            break
+        if line.startswith(("index ", "--- ", "+++ ", "@@", "+", "-", " ")):
+            clean_lines.append(line)
+    return "\n".join(clean_lines).strip()
+
+
+def legacy_extract(raw_patch: str):
+    patch_text = _legacy_clean(raw_patch)
+    if _legacy_validate(patch_text):
+        return patch_text
+    alt = _legacy_sanitize(raw_patch or "")
+    if alt and _legacy_validate(alt):
+        return alt
+    repaired = (raw_patch or "").replace('\r\n', '\n')
+    repaired = re.sub(r"^---\s+(?!a/)(.+)$", r"--- a/\1", repaired, flags=re.MULTILINE)
+    repaired = re.sub(r"^\+\+\+\s+(?!b/)(.+)$", r"+++ b/\1", repaired, flags=re.MULTILINE)
+    repaired = re.sub(r"^```.*$", "", repaired, flags=re.MULTILINE)
+    alt2 = _legacy_clean(repaired)
+    if alt2 and _legacy_validate(alt2):
+        return alt2
+    return None
+
+
+# ---
+
+def load(corpus_dirs) -> list:
+    texts = []
+    for d in corpus_dirs:
+        for pattern in PATTERNS:
+            for path in sorted(Path(d).glob(pattern)):
+                texts.append(path.read_text(encoding="utf-8", errors="ignore"))
+    return texts
+
+
+def _time(fn, texts, repeat: int) -> list:
+    """Per-response seconds (best of `repeat` passes over the corpus)."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            fn(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / max(1, len(texts))
+
+
+def run(corpus_dirs, repeat: int) -> dict:
+    texts = load(corpus_dirs)
+    legacy = [legacy_extract(t) for t in texts]
+    model = [diff_model.extract(t) for t in texts]
+    miscounted = sum(1 for p in legacy if p and not diff_model.parse(p).is_valid())
+    parse_only = _time(diff_model.parse, texts, repeat)
+    return {
+        "responses": len(texts),
+        "chars": sum(len(t) for t in texts),
+        "legacy_us": round(_time(legacy_extract, texts, repeat) * 1e6, 1),
+        "model_us": round(_time(diff_model.extract, texts, repeat) * 1e6, 1),
+        "parse_only_us": round(parse_only * 1e6, 1),
+        "legacy_patches": sum(1 for p in legacy if p),
+        "model_patches": sum(1 for p in model if p),
+        "legacy_miscounted": miscounted,
+        "model_only": sum(1 for a, b in zip(legacy, model) if b and not a),
+        "legacy_only": sum(1 for a, b in zip(legacy, model) if a and not b),
+        "repairs": _repair_counts(texts),
+    }
+
+
+def _repair_counts(texts) -> dict:
+    counts = {}
+    for text in texts:
+        for name in diff_model.parse(text).repair().repairs:
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--corpus-dir", action="append", help=f"default: {DEFAULT_CORPUS.relative_to(AGENT_DIR)}")
+    ap.add_argument("--repeat", type=int, default=10, help="passes over the corpus; the fastest is reported")
+    ap.add_argument("--out", help="write a markdown report to this path")
+    args = ap.parse_args()
+
+    r = run(args.corpus_dir or [DEFAULT_CORPUS], args.repeat)
+    speedup = r["legacy_us"] / r["model_us"] if r["model_us"] else float("nan")
+    report = [
+        "# Diff parsing benchmark: `diff_model` vs legacy sanitizer chain", "",
+        f"Python {sys.version.split()[0]} on {sys.platform}; {r['responses']} responses "
+        f"({r['chars']} chars), best of {args.repeat} passes.", "",
+        "| | legacy chain | diff_model |", "|---|---:|---:|",
+        f"| time per response (µs) | {r['legacy_us']} | {r['model_us']} |",
+        f"| responses turned into a patch | {r['legacy_patches']} | {r['model_patches']} |",
+        f"| ...of which hunk counts do not match the body | {r['legacy_miscounted']} | 0 |", "",
+        f"diff_model is {speedup:.1f}x the legacy speed (parse alone: {r['parse_only_us']} µs per response).",
+        f"{r['model_only']} responses are only recovered by diff_model, {r['legacy_only']} only by the legacy chain.",
+        "Repair passes that changed something: "
+        + (", ".join(f"`{k}` {v}" for k, v in sorted(r["repairs"].items())) or "none") + ".",
+    ]
+    text = "\n".join(report)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+        print(f"[+] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Offline throughput benchmark for the patch pipeline.
+
+Starts mock_llm_server.py in-process (or uses --server-url), points the HF
+routers and Ollama at it, clears every other provider key so nothing reaches
+a live service, and runs `lc_pipeline.run_pipeline` over the snippet file for
+--iterations rounds. Reports snippets/minute and p50/p95 end-to-end iteration
+time plus per-snippet latency and status counts, so concurrency, batching,
+streaming and retry changes can be compared without API keys or quota.
+
+Usage (from agent/):
+    python scripts/bench_pipeline.py --iterations 5 --latency lognormal:0.8,0.5 --error-rate 0.05 --llm-concurrency 4
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AGENT_DIR))
+
+import mock_llm_server  # noqa: E402
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+def _offline_env(server_url: str, work: Path):
+    os.environ.update({
+        "HF_TOKEN": "mock", "HF_TOKEN_2": "mock",
+        "HUGGINGFACE_ROUTER_BASE_URL": server_url + "/v1",
+        "OLLAMA_HOST": server_url,
+        # blank keys win over .env (load_dotenv does not override)
+        "GEMINI_API_KEY": "", "QWEN_API_KEY": "", "HUGGINGFACE_API_TOKEN": "", "TRANSFORMERS_MODEL": "",
+        "LLM_CACHE_BYPASS": "1",
+        "LLM_CACHE_PATH": str(work / "llm_cache.sqlite3"),
+        "LLM_HEALTH_PATH": str(work / "llm_latency.json"),
+        "LLM_CAPABILITY_PATH": str(work / "llm_capabilities.json"),
+        "FAILURE_MEMO_PATH": str(work / "failure_memo.json"),
+        "RESPONSE_JOURNAL_DIR": str(work / "journal"),
+        "PATCH_STORE_PATH": str(work / "patch_fingerprints.json"),
+    })
+
+
+def run(args) -> dict:
+    work = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    server = None
+    if args.server_url:
+        url = args.server_url.rstrip("/")
+    else:
+        corpus = mock_llm_server.load_corpus(args.corpus_dir, include_diffs=args.include_diffs,
+                                             skip_empty=args.skip_empty)
+        server = mock_llm_server.MockLLMServer(latency=args.latency, error_rate=args.error_rate,
+                                               rate_limit_rate=args.rate_limit_rate, hang_rate=args.hang_rate,
+                                               hang_seconds=args.hang_seconds, corpus=corpus, seed=args.seed).start()
+        url = server.url
+    _offline_env(url, work)
+
+    import lc_pipeline as lp
+    lp.BASE_DIR = work
+    lp.PATCHES_DIR = work / "patches"
+
+    snippet_file = Path(args.snippets)
+    if args.limit:
+        parts = snippet_file.read_text(encoding="utf-8").split("--- ")
+        snippet_file = work / "snippets.txt"
+        snippet_file.write_text("--- ".join(parts[:args.limit + 1]), encoding="utf-8")
+    report_file = Path(args.report)
+    if not report_file.exists():
+        report_file = work / "report.txt"
+        report_file.write_text("", encoding="utf-8")
+
+    iteration_s, snippet_latency, statuses, processed, all_results = [], [], collections.Counter(), 0, []
+    try:
+        for it in range(1, args.iterations + 1):
+            started = time.perf_counter()
+            results = lp.run_pipeline(report_file, snippet_file, lang=args.lang, iteration=it,
+                                      concurrency=args.llm_concurrency, batch_by_file=args.llm_batch,
+                                      response_format=args.llm_format)
+            iteration_s.append(time.perf_counter() - started)
+            all_results += results
+            processed += len(results)
+            statuses.update(r.get("status") for r in results)
+            snippet_latency += [r["latency_s"] for r in results if r.get("latency_s") is not None]
+            print(f"[*] iteration {it}: {len(results)} snippets in {iteration_s[-1]:.2f}s")
+    finally:
+        if server:
+            server.stop()
+
+    total = sum(iteration_s)
+    return {
+        "server": url,
+        "iterations": len(iteration_s),
+        "snippets": processed,
+        "snippets_per_min": round(processed / total * 60.0, 1) if total else None,
+        "iteration_p50_s": round(_pct(iteration_s, 50), 3),
+        "iteration_p95_s": round(_pct(iteration_s, 95), 3),
+        "snippet_p50_s": _pct(snippet_latency, 50),
+        "snippet_p95_s": _pct(snippet_latency, 95),
+        "statuses": dict(statuses),
+        "response_format": lp.response_format_stats(all_results),
+        "mock": dict(server.stats) if server else None,
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out",)},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--snippets", default=str(AGENT_DIR / "snippets" / "bug_snippets_cpp.txt"))
+    ap.add_argument("--report", default=str(AGENT_DIR / "analysis_report_cpp.txt"))
+    ap.add_argument("--lang", default="cpp")
+    ap.add_argument("--limit", type=int, default=0, help="only the first N snippets")
+    ap.add_argument("--iterations", type=int, default=3)
+    ap.add_argument("--llm-concurrency", type=int, default=None)
+    ap.add_argument("--llm-batch", action="store_true", default=None)
+    ap.add_argument("--llm-format", choices=("diff", "edits"), default=None,
+                    help="compare the valid-patch rate of diff and edit-operation replies")
+    ap.add_argument("--server-url", help="use an already running mock (or real) server instead")
+    ap.add_argument("--latency", default="lognormal:0.7,0.5")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0)
+    ap.add_argument("--hang-rate", type=float, default=0.0)
+    ap.add_argument("--hang-seconds", type=float, default=120.0)
+    ap.add_argument("--corpus-dir", action="append")
+    ap.add_argument("--include-diffs", action="store_true")
+    ap.add_argument("--skip-empty", action="store_true")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="write the JSON summary to this path")
+    args = ap.parse_args()
+
+    summary = run(args)
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"[+] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Startup-time benchmark for the agent entry points.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter a few
+times, reports the wall time and the slowest imports, and lists which
+provider SDKs (langchain_*, transformers, requests, ...) were pulled in at
+import. With --baseline REV the same measurement is taken on `agent/` as of
+git revision REV (exported with `git archive`) for a before/after table.
+
+Usage (from agent/):
+    python scripts/bench_startup.py --module lc_pipeline --baseline HEAD~1 --out ../docs/startup_benchmark.md
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+PROVIDER_PREFIXES = ("langchain", "langchain_core", "langchain_openai", "langchain_ollama",
+                     "langchain_google_genai", "transformers", "torch", "openai", "httpx",
+                     "requests", "urllib3", "google", "tiktoken")
+
+
+def _importtime(module: str, cwd: Path):
+    """One fresh-interpreter run; returns (wall_s, [(cumulative_us, self_us, name)])."""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=str(cwd), capture_output=True, text=True,
+                          env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+    wall = time.perf_counter() - started
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            self_us, cum_us, name = line.replace("import time:", "").split("|")
+            name = name.rstrip()
+            rows.append((int(cum_us), int(self_us), name))
+        except ValueError:
+            continue
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit(f"import {module} failed in {cwd}")
+    return wall, rows
+
+
+def measure(module: str, cwd: Path, runs: int) -> dict:
+    _importtime(module, cwd)  # warm the OS file cache
+    walls, rows = [], []
+    for _ in range(runs):
+        wall, rows = _importtime(module, cwd)
+        walls.append(wall)
+    top_level = {name.strip() for _, _, name in rows}
+    providers = sorted(n for n in top_level if n.split(".")[0] in PROVIDER_PREFIXES and "." not in n)
+    return {
+        "wall_median_s": statistics.median(walls),
+        "wall_min_s": min(walls),
+        "module_us": next((cum for cum, _, name in rows if name.strip() == module), None),
+        "top": sorted(rows, reverse=True)[:15],
+        "providers": providers,
+    }
+
+
+def export_revision(rev: str, dest: Path) -> Path:
+    repo = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=str(AGENT_DIR),
+                          capture_output=True, text=True, check=True).stdout.strip()
+    data = subprocess.run(["git", "archive", rev, "agent"], cwd=repo, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(data)) as tar:
+        members = [m for m in tar.getmembers() if m.name.count("/") <= 1]  # top-level agent files only
+        tar.extractall(dest, members=members)
+    return dest / "agent"
+
+
+def _section(title: str, res: dict) -> list:
+    lines = [f"### {title}", "",
+             f"- wall time (median): {res['wall_median_s'] * 1000:.0f} ms, min {res['wall_min_s'] * 1000:.0f} ms",
+             f"- cumulative import time of the module: {(res['module_us'] or 0) / 1000:.0f} ms",
+             f"- provider / HTTP packages imported (or attempted) at startup: {', '.join(res['providers']) or 'none'}",
+             "", "| cumulative (ms) | self (ms) | module |", "|---:|---:|---|"]
+    lines += [f"| {cum / 1000:.1f} | {own / 1000:.1f} | `{name.strip()}` |" for cum, own, name in res["top"]]
+    return lines + [""]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--module", default="lc_pipeline")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--baseline", help="git revision to compare against (e.g. HEAD~1)")
+    ap.add_argument("--out", help="write a markdown report to this path")
+    args = ap.parse_args()
+
+    current = measure(args.module, AGENT_DIR, args.runs)
+    baseline = None
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = measure(args.module, export_revision(args.baseline, Path(tmp)), args.runs)
+
+    report = [f"# Startup benchmark: `import {args.module}`", "",
+              f"Python {sys.version.split()[0]} on {sys.platform}; {args.runs} fresh interpreters per side, "
+              "`python -X importtime`.", ""]
+    if baseline:
+        report += ["| | baseline | current |", "|---|---:|---:|",
+                   f"| wall time, median (ms) | {baseline['wall_median_s'] * 1000:.0f} | {current['wall_median_s'] * 1000:.0f} |",
+                   f"| `{args.module}` cumulative import (ms) | {(baseline['module_us'] or 0) / 1000:.0f} | "
+                   f"{(current['module_us'] or 0) / 1000:.0f} |", ""]
+        report += _section(f"Baseline ({args.baseline})", baseline)
+    report += _section("Current tree", current)
+    text = "\n".join(report)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"[+] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
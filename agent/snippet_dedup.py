@@ -0,0 +1,160 @@
+"""Snippet deduplication and overlap merging before LLM dispatch.
+
+`analyzer_cpp.extract_snippets` emits a +-5 line window for every
+cppcheck/clang-tidy hit, so several findings on neighbouring lines of one
+file produced near-identical snippets and one LLM request each. `dedupe()`
+drops snippets whose normalized text was already seen for the same file and
+line (identical code elsewhere in the file is a finding of its own) and
+merges overlapping or adjacent windows into one region that carries every
+reported line. Merged regions get a header like
+
+    --- src/a.cpp:15 (lines 11-27; findings at 15, 16, 22) ---
+
+which still matches SNIPPET_HEADER_RE; `reported_lines()` and `span()` read
+the extra information back for report slicing and batch demultiplexing.
+Regions are capped at SNIPPET_MERGE_MAX_LINES source lines.
+"""
+import hashlib
+import os
+import re
+
+from report_index import SNIPPET_HEADER_RE
+
+MERGE_MAX_LINES = int(os.getenv("SNIPPET_MERGE_MAX_LINES", "40"))
+MERGED_RE = re.compile(r"\(lines (?P<lo>\d+)-(?P<hi>\d+); findings at (?P<lines>[\d, ]+)\)")
+
+
+def window(line: int):
+    # analyzer_*.extract_snippets take source lines[line-5:line+5] (1-based line-4..line+5)
+    return max(1, line - 4), line + 5
+
+
+def _norm_path(path: str) -> str:
+    return os.path.normcase(path.strip().replace("\\", "/"))
+
+
+def normalized_hash(body_lines) -> str:
+    """Hash of the snippet body ignoring indentation, inner whitespace and blank lines."""
+    text = "\n".join(" ".join(l.split()) for l in body_lines if l.strip())
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def reported_lines(snippet: str) -> list:
+    """All reported line numbers a (possibly merged) snippet carries."""
+    first = (snippet.splitlines()[0] if snippet.splitlines() else "").strip()
+    m = MERGED_RE.search(first)
+    if m:
+        return [int(x) for x in m.group("lines").replace(" ", "").split(",") if x]
+    m = SNIPPET_HEADER_RE.match(first)
+    return [int(m.group("line"))] if m else []
+
+
+def span(snippet: str):
+    """(first, last) source line covered by the snippet, or None without a header."""
+    first = (snippet.splitlines()[0] if snippet.splitlines() else "").strip()
+    m = MERGED_RE.search(first)
+    if m:
+        return int(m.group("lo")), int(m.group("hi"))
+    m = SNIPPET_HEADER_RE.match(first)
+    return window(int(m.group("line"))) if m else None
+
+
+class Region:
+    """Union of overlapping snippet windows of one file."""
+
+    def __init__(self, index, path, line, start, body):
+        self.index = index
+        self.path = path
+        self.members = [index]
+        self.lines = [line]
+        self.start = start
+        self.text = {start + n: t for n, t in enumerate(body)}
+
+    @property
+    def end(self):
+        return max(self.text) if self.text else self.start
+
+    def try_merge(self, index, line, start, body) -> bool:
+        end = start + len(body) - 1
+        if start > self.end + 1 or end < self.start - 1:
+            return False
+        if max(end, self.end) - min(start, self.start) + 1 > MERGE_MAX_LINES:
+            return False
+        # overlapping lines must agree, otherwise the windows come from different file versions
+        for n, t in enumerate(body):
+            known = self.text.get(start + n)
+            if known is not None and known.rstrip() != t.rstrip():
+                return False
+        for n, t in enumerate(body):
+            self.text.setdefault(start + n, t)
+        self.start = min(self.start, start)
+        self.members.append(index)
+        if line not in self.lines:
+            self.lines.append(line)
+        return True
+
+    def snippet(self, original: str) -> str:
+        if len(self.members) == 1:
+            return original
+        lines = sorted(self.lines)
+        header = (f"{self.path}:{lines[0]} (lines {self.start}-{self.end}; "
+                  f"findings at {', '.join(str(l) for l in lines)}) ---")
+        body = "\n".join(self.text.get(n, "") for n in range(self.start, self.end + 1))
+        return f"{header}\n{body}\n"
+
+
+def _parse(snippet: str):
+    """(path, line, start, body_lines) for a snippet as split on '--- ', or None."""
+    lines = snippet.splitlines()
+    m = SNIPPET_HEADER_RE.match(lines[0].strip()) if lines else None
+    if not m:
+        return None
+    line = int(m.group("line"))
+    start, end = window(line)
+    body = lines[1:][:end - start + 1]
+    while body and not body[-1].strip():
+        body.pop()  # blank separator lines between snippets
+    return m.group("path").strip(), line, start, body
+
+
+def dedupe(jobs: list):
+    """Collapse (index, snippet) jobs into one job per unique region.
+
+    Returns (jobs, fan_in) where jobs keeps the first member's index for each
+    region and fan_in maps that index to {'members', 'lines', 'duplicates'}.
+    """
+    regions, order, seen, passthrough = {}, [], {}, {}
+    originals = dict(jobs)
+    duplicates = {}
+    for index, snippet in jobs:
+        parsed = _parse(snippet)
+        if parsed is None:
+            passthrough[index] = snippet
+            order.append(("raw", index))
+            continue
+        path, line, start, body = parsed
+        key = _norm_path(path)
+        digest = (key, line, normalized_hash(body))
+        if digest in seen:
+            duplicates.setdefault(seen[digest], []).append(index)
+            continue
+        for region in regions.get(key, []):
+            if region.try_merge(index, line, start, body):
+                seen[digest] = region.index
+                break
+        else:
+            region = Region(index, path, line, start, body)
+            regions.setdefault(key, []).append(region)
+            order.append(("region", region))
+            seen[digest] = index
+
+    out, fan_in = [], {}
+    for kind, item in order:
+        if kind == "raw":
+            out.append((item, passthrough[item]))
+            continue
+        dups = duplicates.get(item.index, [])
+        out.append((item.index, item.snippet(originals[item.index])))
+        fan_in[item.index] = {"members": sorted(item.members + dups), "lines": sorted(item.lines),
+                              "duplicates": dups}
+    return out, fan_in
@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the agent modules are flat files in agent/; make them importable when pytest runs from the repo root (CI)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import failure_memo  # noqa: E402
+import patch_store  # noqa: E402
+import response_journal  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _isolated_state_files(tmp_path, monkeypatch):
+    """Keep the response journal, failure memo and patch store of pipeline tests out of agent/patches."""
+    response_journal.close()
+    monkeypatch.setattr(response_journal, "JOURNAL_DIR", tmp_path / "journal")
+    monkeypatch.setattr(failure_memo, "MEMO_PATH", tmp_path / "failure_memo.json")
+    failure_memo.reset()
+    monkeypatch.setattr(patch_store, "STORE_PATH", tmp_path / "patch_fingerprints.json")
+    patch_store.reset()
+    yield
+    response_journal.close()
+    failure_memo.reset()
+    patch_store.reset()
@@ -0,0 +1,45 @@
+import diff_model
+import lc_pipeline
+
+NOISY = """Here is the fix:
+```diff
+diff --git a/src/a.py b/src/a.py
+--- src/a.py
++++ src/a.py
+@@ -10 +10 @@ def f():
+-    x = 1
++    x = 2
+@@ -20,9 +20,2 @@
+ def g():
+
+-    return None
++    return 0
+```
+Explanation: x must be 2.
+- a bullet that is not a removed line
+"""
+
+
+def test_noisy_response_is_parsed_once_and_repaired():
+    patch = diff_model.parse(NOISY)
+    assert [f.path for f in patch.files] == ["src/a.py"]
+    first, second = patch.files[0].hunks
+    assert (first.old_start, first.old_len, first.new_len, first.section) == (10, 1, 1, "def f():")
+    # the empty line kept as context, the commentary and bullet after the fence ignored
+    assert second.lines == [" def g():", " ", "-    return None", "+    return 0"]
+    assert not patch.is_valid()  # second hunk claims 9/2 lines
+
+    text = diff_model.extract(NOISY)
+    assert "@@ -20,3 +20,3 @@" in text and "--- a/src/a.py\n+++ b/src/a.py" in text
+    assert lc_pipeline.validate_patch(text) and not lc_pipeline.validate_patch(NOISY)
+
+
+def test_multi_file_headers_and_unusable_hunks():
+    text = ("--- a/x.py\n+++ b/x.py\n@@ -1,1 +1,1 @@\n-a\n+b\n"
+            "--- a/y.py\n+++ b/y.py\n@@ @@\n-c\n+d\n"
+            "diff --git a/z.py b/z.py\n@@ -3,1 +3,1 @@\n same\n")
+    patch = diff_model.parse(text).repair()
+    assert [f.path for f in patch.files] == ["x.py"]
+    assert patch.repairs == ["fill_paths", "drop_unlocated", "drop_noops"]
+    assert patch.render().startswith("diff --git a/x.py b/x.py\n--- a/x.py\n+++ b/x.py\n@@ -1,1 +1,1 @@\n")
+    assert diff_model.extract("Sorry, I cannot help with that.") is None
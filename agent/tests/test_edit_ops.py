@@ -0,0 +1,54 @@
+import json
+
+import edit_ops
+import lc_pipeline
+
+SNIPPET = "a.cpp:6 ---\n" + "\n".join(f"line {n}" for n in range(2, 12)) + "\n"
+
+
+def _reply(*edits):
+    return "```json\n" + json.dumps({"edits": list(edits)}) + "\n```"
+
+
+def test_edits_render_a_valid_diff_with_exact_counts():
+    reply = _reply({"file": "src/a.cpp", "start_line": 5, "end_line": 5, "replacement": "LINE five\nextra"},
+                   {"start_line": 9, "end_line": 8, "replacement": "inserted"},
+                   {"start_line": 11, "end_line": 11, "replacement": ""})
+    diff = edit_ops.to_diff(reply, SNIPPET, "src/a.cpp")
+    assert lc_pipeline.validate_patch(diff)
+    assert "@@ -2,10 +2,11 @@" in diff
+    assert "-line 5\n+LINE five\n+extra\n" in diff and "+inserted\n line 9" in diff and "-line 11" in diff
+
+
+def test_unusable_replies_are_rejected():
+    assert edit_ops.parse_edits("NO_PATCH") == [] and edit_ops.parse_edits('{"edits": []}') == []
+    assert edit_ops.parse_edits("diff --git a/a.cpp b/a.cpp") is None
+    # outside the snippet's lines, overlapping, or for another file
+    assert edit_ops.to_diff(_reply({"start_line": 1, "end_line": 1, "replacement": "x"}), SNIPPET, "a.cpp") is None
+    assert edit_ops.to_diff(_reply({"start_line": 4, "end_line": 6, "replacement": "x"},
+                                   {"start_line": 5, "end_line": 5, "replacement": "y"}), SNIPPET, "a.cpp") is None
+    assert edit_ops.to_diff(_reply({"file": "b.cpp", "start_line": 4, "end_line": 4, "replacement": "x"}),
+                            SNIPPET, "a.cpp") is None
+
+
+def test_pipeline_edits_mode_writes_rendered_patch(tmp_path, monkeypatch):
+    monkeypatch.setattr(lc_pipeline, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(lc_pipeline, "PATCHES_DIR", tmp_path / "patches")
+    snippets = tmp_path / "snippets.txt"
+    snippets.write_text("--- " + SNIPPET, encoding="utf-8")
+    report = tmp_path / "report.txt"
+    report.write_text("a.cpp:6: warning: something\n", encoding="utf-8")
+    seen = []
+
+    def fake_ask_llm(prompt, _orig, _patched, expect="diff"):
+        seen.append(expect)
+        lc_pipeline._last_ask.answered = ["HuggingFace_Router"]
+        assert "    6 | line 6" in prompt
+        return _reply({"start_line": 6, "end_line": 6, "replacement": "fixed 6"})
+
+    monkeypatch.setattr(lc_pipeline, "ask_llm", fake_ask_llm)
+    results = lc_pipeline.run_pipeline(report, snippets, lang="cpp", response_format="edits")
+    assert seen == ["edits"] and results[0]["status"] == "patched"
+    patch = (tmp_path / "patches" / "patches_cpp_fixed" / results[0]["patch"]).read_text(encoding="utf-8")
+    assert "-line 6\n+fixed 6" in patch
+    assert lc_pipeline.response_format_stats(results)["edits"]["valid_rate"] == 1.0
@@ -0,0 +1,33 @@
+import failure_memo
+import lc_pipeline as lp
+
+
+def test_repeated_no_patch_backs_off_then_defers(tmp_path, monkeypatch):
+    monkeypatch.setattr(failure_memo, "MEMO_PATH", tmp_path / "memo.json")
+    monkeypatch.setattr(failure_memo, "MAX_FAILURES", 3)
+    failure_memo.reset()
+    report = tmp_path / "report.txt"
+    report.write_text("a.cpp:3: warning: x\n", encoding="utf-8")
+    snippets = tmp_path / "snippets.txt"
+    snippets.write_text("--- a.cpp:3 ---\nint x = y;\n", encoding="utf-8")
+    calls = []
+
+    def fake_ask_llm(prompt, *_):
+        calls.append(prompt)
+        lp._last_ask.answered = ["HuggingFace_Router"]
+        return "NO_PATCH"
+
+    monkeypatch.setattr(lp, "ask_llm", fake_ask_llm)
+    monkeypatch.setattr(lp, "BASE_DIR", tmp_path)
+    statuses = [lp.run_pipeline(report, snippets, lang="cpp", iteration=n)[0]["status"] for n in range(1, 6)]
+    assert statuses == ["no_patch", "no_patch", "backoff", "no_patch", "deferred"]
+    assert len(calls) == 3
+
+    key = failure_memo.snippet_key("a.cpp:3 ---\nint x = y;\n", "cpp")
+    assert failure_memo.get(key)["failures"] == 3 and failure_memo.get(key)["last_reason"] == "no_patch"
+    # moved lines (same text) keep the key; edited text or a new prompt version do not
+    assert failure_memo.snippet_key("a.cpp:9 ---\n  int x =  y;\n", "cpp") == key
+    assert failure_memo.snippet_key("a.cpp:3 ---\nint x = z;\n", "cpp") != key
+    monkeypatch.setattr(failure_memo, "PROMPT_VERSION", "next")
+    assert failure_memo.snippet_key("a.cpp:3 ---\nint x = y;\n", "cpp") != key
+    failure_memo.reset()
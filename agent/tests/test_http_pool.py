@@ -0,0 +1,51 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_pool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    fail_first = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if _Handler.fail_first > 0:
+            _Handler.fail_first -= 1
+            status, body = 503, b"{}"
+        else:
+            status, body = 200, json.dumps({"choices": [{"text": "ok"}]}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+def test_connections_are_reused_and_posts_not_resent_on_503(monkeypatch):
+    monkeypatch.setattr(http_pool, "HTTP_RETRY_BACKOFF", 0.01)
+    http_pool.close_all()
+    server, url = _serve()
+    try:
+        # the server may have generated (and billed) a completion before answering 503
+        _Handler.fail_first = 1
+        assert http_pool.post(url, json={"prompt": "x"}, timeout=5).status_code == 503
+        for _ in range(4):
+            resp = http_pool.post(url, json={"prompt": "x"}, timeout=5)
+            assert resp.status_code == 200 and resp.json()["choices"][0]["text"] == "ok"
+        host = http_pool.stats()[url.split("/v1")[0]]
+        assert host["requests"] == 5
+        assert host["connections_opened"] == 1
+    finally:
+        http_pool.close_all()
+        server.shutdown()
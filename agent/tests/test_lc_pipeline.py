@@ -0,0 +1,197 @@
+import random
+import threading
+import time
+
+import failure_memo
+import lc_pipeline as lp
+import llm_cache
+import patch_apply
+import patch_store
+
+
+def _fake_patch(fname):
+    return (
+        f"diff --git a/{fname} b/{fname}\n"
+        f"--- a/{fname}\n"
+        f"+++ b/{fname}\n"
+        "@@ -1,1 +1,1 @@\n"
+        "-old\n"
+        "+new\n"
+    )
+
+
+def test_run_pipeline_concurrent_keeps_order(tmp_path, monkeypatch):
+    report = tmp_path / "report.txt"
+    report.write_text("a.cpp:3: warning: x\n", encoding="utf-8")
+    snippets = tmp_path / "snippets.txt"
+    snippets.write_text(
+        "\n\n".join(f"--- f{i}.cpp:{i} ---\ncode {i}\n" for i in range(1, 7)),
+        encoding="utf-8",
+    )
+
+    def fake_ask_llm(prompt, *_):
+        time.sleep(random.uniform(0, 0.05))
+        m = [ln for ln in prompt.splitlines() if ln.startswith("code ")][0]
+        idx = int(m.split()[1])
+        return "" if idx == 4 else _fake_patch(f"f{idx}.cpp")
+
+    monkeypatch.setattr(lp, "ask_llm", fake_ask_llm)
+    monkeypatch.setattr(lp, "BASE_DIR", tmp_path)
+
+    results = lp.run_pipeline(report, snippets, lang="py", iteration=2, concurrency=4)
+
+    assert [r["index"] for r in results] == [1, 2, 3, 4, 5, 6]
+    assert results[3]["status"] == "no_patch" and results[3]["patch"] is None
+    names = [r["patch"] for r in results if r["patch"]]
+    assert len(names) == 5
+    assert len({n.split("_")[2] for n in names}) == 1  # one timestamp per run
+    assert [int(n.rsplit("_", 1)[1].split(".")[0]) for n in names] == [1, 2, 3, 5, 6]
+    assert all(r["latency_s"] is not None for r in results)
+
+
+def test_hedged_router_call_prefers_first_valid(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "0.05")
+    calls = []
+
+    def invoke(llm, name, timeout):
+        calls.append(name)
+        if name == "primary":
+            time.sleep(0.5)  # slow primary: secondary should win
+        return type("R", (), {"content": _fake_patch("a.py")})()
+
+    routers = [("l1", "primary", 5), ("l2", "secondary", 5)]
+    llm, name, content = lp._hedged_router_call(routers, invoke)
+    assert name == "secondary" and "diff --git" in content
+    assert calls == ["primary", "secondary"]
+
+
+def test_hedged_router_call_skips_secondary_when_primary_fast(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "1")
+    calls = []
+
+    def invoke(llm, name, timeout):
+        calls.append(name)
+        return type("R", (), {"content": _fake_patch("a.py")})()
+
+    assert lp._hedged_router_call([("l1", "primary", 5), ("l2", "secondary", 5)], invoke)[1] == "primary"
+    assert calls == ["primary"]
+
+
+def test_hedged_router_call_abandons_the_loser(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "0.05")
+    release, closed, finished = threading.Event(), [], {}
+
+    def invoke(llm, name, timeout):
+        started = time.time()
+        with lp.llm_dispatch.session() as ex:
+            if name == "primary":  # hangs until its timeout unless cancelled
+                fut = ex.submit(release.wait, timeout, on_abandon=lambda: closed.append(name))
+            else:
+                fut = ex.submit(lambda: type("R", (), {"content": _fake_patch("a.py")})())
+            try:
+                resp = ex.result(fut, timeout)
+            except lp.llm_dispatch.Cancelled:
+                resp = None
+        finished[name] = time.time() - started
+        return resp
+
+    try:
+        assert lp._hedged_router_call([("l1", "primary", 5), ("l2", "secondary", 5)], invoke)[1] == "secondary"
+        deadline = time.time() + 2
+        while "primary" not in finished and time.time() < deadline:
+            time.sleep(0.01)
+        assert closed == ["primary"] and finished["primary"] < 1
+    finally:
+        release.set()
+
+
+def test_abandoned_plain_request_closes_its_stream(monkeypatch):
+    closed = threading.Event()
+
+    class SlowRouter:
+        def invoke(self, messages):
+            raise AssertionError("plain invoke cannot be abandoned")
+
+        def stream(self, messages):
+            try:
+                for _ in range(200):
+                    time.sleep(0.01)
+                    yield type("C", (), {"content": "{"})()
+            finally:
+                closed.set()
+
+    monkeypatch.setattr(lp, "LLM_STREAM", False)
+    with lp.llm_dispatch.session() as ex:
+        fut = lp._submit_llm_request(ex, SlowRouter(), "HuggingFace_Router", "edit this", stream=False)
+        time.sleep(0.05)
+    # leaving the session abandons the request: it stops reading well before the reply ends
+    assert closed.wait(1)
+    assert fut.result(timeout=1).stream_status == "cancelled"
+
+
+def test_batch_by_file_demuxes_hunks_and_falls_back(tmp_path, monkeypatch):
+    report = tmp_path / "report.txt"
+    report.write_text("src\\a.cpp:10: warning: x\nsrc\\a.cpp:40: warning: y\n", encoding="utf-8")
+    snippets = tmp_path / "snippets.txt"
+    snippets.write_text(
+        "--- src\\a.cpp:10 ---\nint x = 0;\n\n"
+        "--- src\\a.cpp:40 ---\nint y = 0;\n\n"
+        "--- src\\b.cpp:5 ---\nint z = 0;\n\n"
+        "--- src\\b.cpp:50 ---\nint w = 0;\n",
+        encoding="utf-8",
+    )
+    prompts = []
+
+    def fake_ask_llm(prompt, *_):
+        prompts.append(prompt)
+        if "Region" not in prompt:
+            return _fake_patch("src/b.cpp")  # per-snippet fallback requests
+        if "src\\b.cpp" in prompt:
+            return "Sorry, I cannot help with that."
+        return ("diff --git a/src/a.cpp b/src/a.cpp\n--- a/src/a.cpp\n+++ b/src/a.cpp\n"
+                "@@ -40,1 +40,1 @@\n-int y = 0;\n+int y = 1;\n")
+
+    monkeypatch.setattr(lp, "ask_llm", fake_ask_llm)
+    monkeypatch.setattr(lp, "BASE_DIR", tmp_path)
+
+    results = lp.run_pipeline(report, snippets, lang="cpp", iteration=1, batch_by_file=True)
+
+    assert len(prompts) == 4  # two batches + two fallback requests for b.cpp
+    # both fallback requests for b.cpp answered the same patch: only the first is written
+    assert [r["status"] for r in results] == ["no_patch", "patched", "patched", "duplicate"]
+    assert results[3]["duplicate_of"] == 3 and results[3]["patch"] is None
+    assert results[1]["batch"] == 1 and results[1]["hunks"] == 1
+    assert results[2].get("batch_fallback") and results[3].get("batch_fallback")
+    written = (tmp_path / "patches" / "patches_cpp_fixed" / results[1]["patch"]).read_text(encoding="utf-8")
+    assert "+int y = 1;" in written and written.startswith("diff --git a/src/a.cpp")
+
+
+def test_known_rejected_patch_is_not_a_success_and_leaves_the_cache(tmp_path, monkeypatch):
+    workspace = tmp_path / "ws"
+    workspace.mkdir()
+    (workspace / "a.py").write_text("old\n", encoding="utf-8")
+    report = tmp_path / "report.txt"
+    report.write_text("a.py:1: warning: x\n", encoding="utf-8")
+    snippets = tmp_path / "snippets.txt"
+    snippets.write_text("--- a.py:1 ---\nold\n", encoding="utf-8")
+    patch = _fake_patch("a.py")
+    patch_store.record(*patch_store.key(patch_apply.Snapshot(workspace), patch), "apply", "conflict")
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+
+    prompts = []
+
+    def fake_ask_llm(prompt, *_):
+        prompts.append(prompt)
+        llm_cache.put("HF", "m", 0.2, prompt, patch)  # as if served from the cache
+        lp._last_ask.cache_keys = [llm_cache.cache_key("HF", "m", 0.2, prompt)]
+        return patch
+
+    monkeypatch.setattr(lp, "ask_llm", fake_ask_llm)
+    monkeypatch.setattr(lp, "BASE_DIR", tmp_path)
+
+    results = lp.run_pipeline(report, snippets, lang="py", iteration=1, workspace=workspace)
+
+    assert [(r["status"], r["known_rejected"], r["patch"]) for r in results] == [("known_rejected", "apply: conflict", None)]
+    assert llm_cache.get("HF", "m", 0.2, prompts[0]) is None  # the next iteration asks again
+    memo = list(failure_memo._load().values())
+    assert [m["last_reason"] for m in memo] == ["known_rejected"]
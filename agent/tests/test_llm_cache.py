@@ -0,0 +1,62 @@
+import threading
+
+import llm_cache
+import rate_limiter
+
+
+def test_cache_roundtrip_bypass_and_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    before = llm_cache.stats()
+
+    assert llm_cache.get("HF", "m", 0.2, "prompt") is None
+    llm_cache.put("HF", "m", 0.2, "prompt", "diff --git a/x b/x")
+    assert llm_cache.get("HF", "m", 0.2, "prompt") == "diff --git a/x b/x"
+    # any key component change is a miss
+    assert llm_cache.get("HF", "m", 0.0, "prompt") is None
+    assert llm_cache.get("HF", "m", 0.2, "prompt", bypass=True) is None
+
+    delta = llm_cache.stats_since(before)
+    assert delta["hits"] == 1 and delta["misses"] == 2 and delta["bypassed"] == 1
+
+    monkeypatch.setattr(llm_cache, "CACHE_MAX_BYTES", 1)
+    llm_cache.put("HF", "m", 0.2, "other", "x" * 100)
+    assert llm_cache.evict() >= 1
+    assert llm_cache.get("HF", "m", 0.2, "prompt") is None
+
+
+def test_counters_are_kept_per_workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    llm_cache.put("HF", "m", 0.2, "shared", "diff")
+    before = {ws: llm_cache.stats(ws) for ws in ("ws-a", "ws-b")}
+
+    def run(ws, prompts):
+        with rate_limiter.workspace(ws):
+            for prompt in prompts:
+                llm_cache.get("HF", "m", 0.2, prompt)
+
+    threads = [threading.Thread(target=run, args=("ws-a", ["shared", "shared"])),
+               threading.Thread(target=run, args=("ws-b", ["new"]))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    a, b = (llm_cache.stats_since(before[ws], ws) for ws in ("ws-a", "ws-b"))
+    assert (a["hits"], a["misses"], a["hit_rate"]) == (2, 0, 1.0)
+    assert (b["hits"], b["misses"], b["hit_rate"]) == (0, 1, 0.0)
+
+
+def test_workspace_bypass_only_affects_that_workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    llm_cache.put("HF", "m", 0.2, "prompt", "diff")
+    llm_cache.set_bypass(True, workspace="forced")
+    try:
+        with rate_limiter.workspace("forced"):
+            assert llm_cache.get("HF", "m", 0.2, "prompt") is None
+            assert llm_cache.get("HF", "m", 0.2, "prompt", bypass=False) == "diff"
+        with rate_limiter.workspace("other"):
+            assert llm_cache.get("HF", "m", 0.2, "prompt") == "diff"
+    finally:
+        llm_cache.set_bypass(False, workspace="forced")
+    with rate_limiter.workspace("forced"):
+        assert llm_cache.get("HF", "m", 0.2, "prompt") == "diff"
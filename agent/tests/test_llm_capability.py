@@ -0,0 +1,39 @@
+import json
+
+import llm_capability as cap
+
+
+def test_precheck_skipped_once_model_is_learned(tmp_path, monkeypatch):
+    monkeypatch.setattr(cap, "STATS_PATH", tmp_path / "caps.json")
+    monkeypatch.setattr(cap, "_registry", None)
+    monkeypatch.setattr(cap, "MIN_OBSERVATIONS", 3)
+    monkeypatch.setattr(cap, "RECHECK_EVERY", 2)
+    monkeypatch.setattr(cap, "FLUSH_SECONDS", 3600)
+    monkeypatch.setattr(cap, "_last_flush", cap.time.time())
+
+    assert cap.needs_precheck("HF", "m")
+    cap.record_precheck("HF", "m", True)
+    for _ in range(3):
+        cap.record_outcome("HF", "m", "valid_diff")
+    assert not cap.needs_precheck("HF", "m")
+
+    # skipped calls count towards the periodic re-check
+    cap.record_outcome("HF", "m", "no_patch", prechecked=False)
+    cap.record_outcome("HF", "m", "valid_diff", prechecked=False)
+    assert cap.needs_precheck("HF", "m")
+
+    # outcomes are batched: nothing is written until the flush interval passes or flush()
+    assert not (tmp_path / "caps.json").exists()
+    cap.flush()
+    assert [p.name for p in tmp_path.iterdir()] == ["caps.json"]
+    stats = json.loads((tmp_path / "caps.json").read_text(encoding="utf-8"))["HF|m"]
+    assert stats["requests"] == 5 and stats["valid_diff_rate"] == 0.8 and stats["no_patch_rate"] == 0.2
+
+
+def test_poor_models_keep_precheck(tmp_path, monkeypatch):
+    monkeypatch.setattr(cap, "STATS_PATH", tmp_path / "caps.json")
+    monkeypatch.setattr(cap, "_registry", None)
+    cap.record_precheck("HF", "bad", True)
+    for _ in range(cap.MIN_OBSERVATIONS):
+        cap.record_outcome("HF", "bad", "invalid")
+    assert cap.needs_precheck("HF", "bad")
@@ -0,0 +1,54 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+import llm_dispatch
+
+
+def test_session_exit_detaches_hung_request():
+    pool = llm_dispatch.LLMDispatchPool(max_workers=2)
+    release = threading.Event()
+    closed = []
+    try:
+        started = time.time()
+        with llm_dispatch._DispatchSession(pool) as ex:
+            fut = ex.submit(release.wait, 5, on_abandon=lambda: closed.append(True))
+            with pytest.raises(concurrent.futures.TimeoutError):
+                fut.result(timeout=0.05)
+        assert time.time() - started < 1  # exit did not join the hung call
+        stats = pool.stats()
+        assert stats["in_flight"] == 1 and stats["detached_in_flight"] == 1
+        assert closed == [True]
+
+        release.set()
+        fut.exception(timeout=2)
+        time.sleep(0.05)
+        stats = pool.stats()
+        assert stats["in_flight"] == 0 and stats["detached_in_flight"] == 0
+        assert stats["abandoned"] == 1 and stats["queue_depth"] == 0
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_cancel_token_wakes_waiter_and_abandons_request():
+    pool = llm_dispatch.LLMDispatchPool(max_workers=2)
+    release = threading.Event()
+    closed = []
+    token = llm_dispatch.CancelToken()
+    try:
+        threading.Timer(0.1, token.cancel).start()
+        started = time.time()
+        with llm_dispatch._DispatchSession(pool, token) as ex:
+            fut = ex.submit(release.wait, 5, on_abandon=lambda: closed.append(True))
+            with pytest.raises(llm_dispatch.Cancelled):
+                ex.result(fut, 5)
+            with pytest.raises(llm_dispatch.Cancelled):
+                ex.submit(release.wait, 5)  # nothing new starts once cancelled
+        assert time.time() - started < 1
+        assert closed == [True] and pool.stats()["abandoned"] == 1
+    finally:
+        release.set()
+        pool.shutdown()
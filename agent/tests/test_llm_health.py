@@ -0,0 +1,45 @@
+import llm_health
+
+
+def _fresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_health, "HISTORY_PATH", tmp_path / "lat.json")
+    monkeypatch.setattr(llm_health, "_history", None)
+    monkeypatch.setattr(llm_health, "_trials", {})
+    monkeypatch.setattr(llm_health, "_last_flush", llm_health.time.time())
+
+
+def test_adaptive_timeout_follows_p99(tmp_path, monkeypatch):
+    _fresh(tmp_path, monkeypatch)
+    assert llm_health.adaptive_timeout("R", 45) == 45  # no history yet
+    for s in (1.0, 1.2, 1.5, 2.0, 4.0):
+        llm_health.record("R", s)
+    assert llm_health.adaptive_timeout("R", 45) == 8.0  # p99 4.0 x factor 2
+    assert llm_health.adaptive_timeout("R", 6) == 6  # never above the static value
+    # a timeout at the learned 8s is a censored sample: the next timeout widens
+    llm_health.record("R", 8.0, ok=False, timed_out=True)
+    assert llm_health.adaptive_timeout("R", 45) == 16.0
+    # a stream cut short by the diff monitor says nothing about latency
+    llm_health.record("R", 0.1, sample=False)
+    assert llm_health.percentile("R", 0) == 1.0
+    # samples are batched until the flush interval passes or flush()
+    assert not (tmp_path / "lat.json").exists()
+    llm_health.flush()
+    assert [p.name for p in tmp_path.iterdir()] == ["lat.json"]
+
+
+def test_breaker_opens_then_half_opens(tmp_path, monkeypatch):
+    _fresh(tmp_path, monkeypatch)
+    clock = [1000.0]
+    monkeypatch.setattr(llm_health.time, "time", lambda: clock[0])
+    for _ in range(llm_health.BREAKER_THRESHOLD):
+        assert llm_health.allow("R")
+        llm_health.record("R", 45, ok=False)
+    assert llm_health.state("R") == "open" and not llm_health.allow("R")
+
+    clock[0] += llm_health.BREAKER_COOLDOWN + 1
+    assert llm_health.allow("R")        # single trial request
+    assert not llm_health.allow("R")    # others wait for its outcome
+    llm_health.record("R", 2.0, ok=True)
+    assert llm_health.state("R") == "closed" and llm_health.allow("R")
+    snap = llm_health.snapshot({"R": 45})["R"]
+    assert snap["breaker"] == "closed" and snap["failed"] == 3 and "timeout_s" in snap
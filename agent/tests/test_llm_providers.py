@@ -0,0 +1,14 @@
+import lc_pipeline as lp
+import llm_providers
+
+
+def test_clients_are_built_on_first_use_only(monkeypatch):
+    built = []
+    monkeypatch.setitem(llm_providers._factories, "HuggingFace_Router", lambda: built.append(1) or "router")
+    monkeypatch.setattr(llm_providers, "_clients", {})
+
+    assert built == []
+    assert lp.hf_router_llm == "router"  # legacy module attribute resolves lazily
+    assert llm_providers.get_llm("HuggingFace_Router") == "router"
+    assert built == [1]
+    assert llm_providers.loaded() == ["HuggingFace_Router"]
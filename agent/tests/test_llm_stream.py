@@ -0,0 +1,48 @@
+import threading
+
+import llm_stream
+
+
+class _FakeStreamingLLM:
+    def __init__(self, text, chunk=7):
+        self.text, self.chunk, self.sent = text, chunk, 0
+
+    def stream(self, messages):
+        for i in range(0, len(self.text), self.chunk):
+            self.sent = i + self.chunk
+            yield type("C", (), {"content": self.text[i:i + self.chunk]})()
+
+
+DIFF = ("```diff\ndiff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n"
+        "@@ -1,2 +1,2 @@\n import os\n-x = 1\n+x = 2\n```\n")
+
+
+def test_stops_after_complete_diff():
+    llm = _FakeStreamingLLM(DIFF + "\nExplanation: " + "blah " * 500)
+    resp = llm_stream.stream_invoke(llm, [])
+    assert resp.stream_status == "complete"
+    assert resp.content.rstrip().endswith("+x = 2")
+    assert llm.sent < len(DIFF) + 20
+
+
+def test_aborts_on_prose_and_no_patch():
+    llm = _FakeStreamingLLM("I'm sorry, but as an AI model I cannot " * 50)
+    resp = llm_stream.stream_invoke(llm, [], probe_chars=100)
+    assert resp.stream_status == "abort" and resp.stream_reason == "no_diff_in_probe"
+    assert llm.sent <= 110
+
+    resp = llm_stream.stream_invoke(_FakeStreamingLLM("NO_PATCH because the code is fine " * 20), [])
+    assert resp.stream_status == "abort" and resp.stream_reason == "no_patch"
+
+
+def test_wrong_hunk_counts_do_not_cut_the_diff():
+    # the header claims 2 old / 2 new lines; the body has 3 / 3
+    body = "@@ -1,2 +1,2 @@\n a\n-b\n-c\n+B\n+C\n d\n"
+    llm = _FakeStreamingLLM("diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n" + body + "```\nThe fix renames " * 40)
+    resp = llm_stream.stream_invoke(llm, [])
+    assert resp.stream_status == "complete" and not resp.partial
+    assert resp.content.endswith(body)
+
+    cancel = threading.Event()
+    cancel.set()
+    assert llm_stream.stream_invoke(_FakeStreamingLLM(body), [], cancel=cancel).partial
@@ -0,0 +1,40 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_providers
+from local_model_worker import LocalModelWorker, WorkerClient, make_server
+
+
+class _EchoBackend:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, prompts, max_new_tokens):
+        self.calls.append(len(prompts))
+        time.sleep(0.05)
+        return [(p + " -> ok", 3) for p in prompts]
+
+
+def test_concurrent_requests_share_one_generate_call(monkeypatch):
+    backend = _EchoBackend()
+    worker = LocalModelWorker(backend, batch_max=8, window_s=0.2)
+    server = make_server(worker, "127.0.0.1:0")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    addr = "127.0.0.1:%d" % server.server_address[1]
+    try:
+        monkeypatch.setenv("TRANSFORMERS_WORKER_ADDR", addr)
+        llm_providers.reset()
+        client = llm_providers.get_llm("Transformers")
+        assert isinstance(client, WorkerClient)
+        msgs = [[llm_providers.human_message(f"p{i}")] for i in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            texts = [r.content for r in ex.map(client.invoke, msgs)]
+        assert texts == [f"p{i} -> ok" for i in range(4)]
+        assert backend.calls == [4]
+        stats = client.stats()
+        assert stats["batches"] == 1 and stats["new_tokens"] == 12 and stats["tokens_per_s"] > 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        llm_providers.reset()
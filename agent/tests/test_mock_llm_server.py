@@ -0,0 +1,51 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import llm_providers
+import llm_stream
+from mock_llm_server import MockLLMServer, load_corpus, parse_latency
+
+DIFF = "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1,1 +1,1 @@\n-old\n+new\n"
+
+
+def _post(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.read().decode()
+
+
+def test_router_client_invoke_and_stream_against_mock():
+    with MockLLMServer(corpus=[DIFF + "Explanation follows.\n"], seed=0) as srv:
+        client = llm_providers._RouterClient("t", srv.url + "/v1", "m", timeout=5)
+        msg = [llm_providers.human_message("fix it")]
+        assert client.invoke(msg).content.startswith("diff --git")
+        streamed = llm_stream.stream_invoke(client, msg)
+        assert streamed.stream_status == "complete" and streamed.content == DIFF
+        yes = client.invoke([llm_providers.human_message("Can you? Reply YES or NO.")])
+        assert yes.content == "YES"
+        assert srv.stats["streams"] == 1 and srv.stats["prechecks"] == 1
+
+
+def test_ollama_generate_streams_ndjson_and_errors():
+    with MockLLMServer(corpus=["NO_PATCH"], seed=0) as srv:
+        lines = [json.loads(ln) for ln in _post(srv.url + "/api/generate", {"prompt": "x"}).splitlines()]
+        assert "".join(ln["response"] for ln in lines) == "NO_PATCH" and lines[-1]["done"]
+        assert json.loads(_post(srv.url + "/api/generate", {"prompt": "x", "stream": False}))["response"] == "NO_PATCH"
+    with MockLLMServer(corpus=["x"], error_rate=1.0) as srv:
+        with pytest.raises(urllib.error.HTTPError) as err:
+            _post(srv.url + "/v1/chat/completions", {"messages": []})
+        assert err.value.code == 503
+
+
+def test_corpus_and_latency_specs(tmp_path):
+    (tmp_path / "raw_resp_1.txt").write_text("", encoding="utf-8")
+    (tmp_path / "raw_resp_2.txt").write_text(DIFF, encoding="utf-8")
+    (tmp_path / "raw_gemini_pipeline_1.json").write_text(json.dumps({"content": "NO_PATCH"}), encoding="utf-8")
+    assert load_corpus([tmp_path]) == ["", DIFF, "NO_PATCH"]
+    assert load_corpus([tmp_path], skip_empty=True) == [DIFF, "NO_PATCH"]
+    assert parse_latency("fixed:0.25")(None) == 0.25
+    import random
+    assert 0.1 <= parse_latency("uniform:0.1,0.2")(random.Random(1)) <= 0.2
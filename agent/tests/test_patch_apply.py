@@ -0,0 +1,47 @@
+import dynamic_tester
+import patch_apply
+
+SOURCE = "".join(f"line {n}\n" for n in range(1, 61))
+CONTEXT = "".join(f" line {n}\n" for n in range(10, 13))
+TAIL = "".join(f" line {n}\n" for n in range(14, 17))
+
+
+def _patch(start, body=CONTEXT + "-line 13\n+LINE 13\n" + TAIL, path="src/a.py"):
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -{start},7 +{start},7 @@\n" + body
+
+
+def _hunks(report):
+    return [(h["status"], h["offset"], h["fuzz"]) for f in report["files"] for h in f["hunks"]]
+
+
+def test_hunks_apply_with_offset_fuzz_or_conflict(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text(SOURCE, encoding="utf-8")
+    snapshot = patch_apply.Snapshot(tmp_path)
+
+    exact = patch_apply.apply_patch(snapshot, _patch(10))
+    assert exact["status"] == "applied" and "LINE 13\nline 14\n" in exact["contents"]["src/a.py"]
+    assert _hunks(patch_apply.apply_patch(snapshot, _patch(20))) == [("offset", -10, 0)]
+    renamed = CONTEXT.replace(" line 10\n", " line ten\n")
+    fuzzed = patch_apply.apply_patch(snapshot, _patch(10, renamed + "-line 13\n+LINE 13\n" + TAIL))
+    assert _hunks(fuzzed) == [("fuzz", 0, 1)] and fuzzed["contents"]["src/a.py"].count("\n") == 60
+    assert patch_apply.apply_patch(snapshot, _patch(10, CONTEXT + "-line 99\n+x\n" + TAIL))["status"] == "conflict"
+    # LLM paths without the workspace prefix resolve by basename
+    assert patch_apply.apply_patch(snapshot, _patch(10, path="a.py"))["files"][0]["path"] == "src/a.py"
+    assert snapshot.reads == 1
+
+
+def test_patch_dir_is_dry_run_by_default(tmp_path):
+    repo, patches = tmp_path / "repo", tmp_path / "patches"
+    (repo / "src").mkdir(parents=True)
+    patches.mkdir()
+    (repo / "src" / "a.py").write_text(SOURCE, encoding="utf-8")
+    (patches / "patch_1.diff").write_text(_patch(10), encoding="utf-8")
+    (patches / "patch_2.diff").write_text(_patch(10, CONTEXT + "-line 99\n+x\n" + TAIL), encoding="utf-8")
+
+    results = dynamic_tester.apply_patches_from_dir(repo, patches)
+    assert [(r["patch"], r["status"]) for r in results] == [("patch_1.diff", "applied"), ("patch_2.diff", "conflict")]
+    assert (repo / "src" / "a.py").read_text(encoding="utf-8") == SOURCE
+
+    dynamic_tester.apply_patches_from_dir(repo, patches, dry_run=False)
+    assert "LINE 13\n" in (repo / "src" / "a.py").read_text(encoding="utf-8")
@@ -0,0 +1,54 @@
+import json
+
+import patch_apply
+import patch_compose
+
+SOURCE = "".join(f"line {n}\n" for n in range(1, 61))
+
+
+def _patch(line, new, path="src/a.py", stated=None):
+    """Replace `line N` by `new` lines, with 3 lines of context; stated moves the @@ header."""
+    ctx_before = "".join(f" line {n}\n" for n in range(line - 3, line))
+    ctx_after = "".join(f" line {n}\n" for n in range(line + 1, line + 4))
+    body = ctx_before + f"-line {line}\n" + "".join(f"+{l}\n" for l in new) + ctx_after
+    start = (stated or line) - 3
+    return f"--- a/{path}\n+++ b/{path}\n@@ -{start},7 +{start},{6 + len(new)} @@\n" + body
+
+
+def test_non_overlapping_patches_merge_and_conflicts_are_decided(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text(SOURCE, encoding="utf-8")
+    candidates = [
+        ("patch_1_0.diff", _patch(10, ["LINE 10", "extra"])),   # grows the file
+        ("patch_1_1.diff", _patch(40, ["LINE 40"], stated=45)),  # stale line numbers: rebased
+        ("patch_1_2.diff", _patch(11, ["other 11"])),           # overlaps patch_1_0
+        ("patch_1_3.diff", _patch(10, ["LINE 10", "extra"])),   # same change as patch_1_0
+        ("patch_1_4.diff", _patch(99, ["x"])),                  # nothing to match
+    ]
+    result = patch_compose.compose(patch_apply.Snapshot(tmp_path), candidates)
+    assert [d["decision"] for d in result["decisions"]] == ["merged", "merged", "conflict", "duplicate", "stale"]
+    assert result["decisions"][1]["rebased"] and result["decisions"][2]["with"] == "patch_1_0.diff"
+
+    applied = patch_apply.apply_patch(patch_apply.Snapshot(tmp_path), result["patch"])
+    assert applied["status"] == "applied"
+    text = applied["contents"]["src/a.py"]
+    assert "LINE 10\nextra\nline 11\n" in text and "line 39\nLINE 40\nline 41\n" in text
+
+
+def test_conflicts_are_queued_then_dropped(tmp_path, monkeypatch):
+    repo, patches = tmp_path / "repo", tmp_path / "patches"
+    repo.mkdir()
+    patches.mkdir()
+    (repo / "a.py").write_text(SOURCE, encoding="utf-8")
+    (patches / "patch_1_1_0.diff").write_text(_patch(20, ["first"], path="a.py"), encoding="utf-8")
+    (patches / "patch_1_1_1.diff").write_text(_patch(20, ["second"], path="a.py"), encoding="utf-8")
+    monkeypatch.setattr(patch_compose, "QUEUE_ROUNDS", 1)
+
+    summary = patch_compose.compose_iteration(repo, patches, ["patch_1_1_1.diff", "patch_1_1_0.diff"], iteration=1)
+    assert summary["counts"] == {"merged": 1, "queued": 1}
+    assert "+first" in (patches / summary["combined"]).read_text(encoding="utf-8")
+    assert json.loads((patches / "combined" / "queue.json").read_text(encoding="utf-8")) == {"patch_1_1_1.diff": 1}
+
+    # next iteration: nothing new, the queued patch is retried alone and now merges
+    again = patch_compose.compose_iteration(repo, patches, [], iteration=2)
+    assert again["from_queue"] == 1 and again["counts"] == {"merged": 1}
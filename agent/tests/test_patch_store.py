@@ -0,0 +1,62 @@
+import sys
+
+import patch_apply
+import patch_compose
+import patch_store
+import patch_verify
+
+SOURCE = "def value():\n    return 1\n"
+PATCH = "--- a/calc.py\n+++ b/calc.py\n@@ -1,2 +1,2 @@\n def value():\n-    return 1\n+    return 42\n"
+
+
+def test_fingerprint_ignores_noise_but_not_content():
+    noisy = ("```diff\ndiff --git a/calc.py b/calc.py\nindex 83db48f..bf269f4 100644\n"
+             "--- a/calc.py\t2025-11-03 10:00:00\n+++ b/calc.py\t2025-11-03 10:05:00\n"
+             "@@ -1,9 +1,9 @@\n def value():  \n-    return 1\n+    return 42   \n```\n")
+    assert patch_store.fingerprint(noisy) == patch_store.fingerprint(PATCH)
+    assert patch_store.fingerprint(PATCH.replace("42", "43")) != patch_store.fingerprint(PATCH)
+    assert patch_store.fingerprint("NO_PATCH") is None
+
+
+def test_outcomes_are_reused_while_touched_files_are_unchanged(tmp_path, monkeypatch):
+    repo, patches = tmp_path / "repo", tmp_path / "patches"
+    repo.mkdir()
+    patches.mkdir()
+    (repo / "calc.py").write_text(SOURCE, encoding="utf-8")
+    (patches / "patch_1_0.diff").write_text(PATCH, encoding="utf-8")
+    cmds = {"build": "", "test": f'"{sys.executable}" -c "import sys, calc; sys.exit(calc.value() != 42)"'}
+
+    first = patch_compose.compose_iteration(repo, patches, ["patch_1_0.diff"], 1, verify_cmds=cmds)
+    assert first["verification"]["reused"] == 0 and first["decisions"][0]["verdict"] == "pass"
+
+    # a rerun with the same patch under another name: the verdict comes from the store
+    (patches / "patch_2_0.diff").write_text("```diff\n" + PATCH + "```\n", encoding="utf-8")
+    monkeypatch.setattr(patch_verify, "verify", lambda *a, **k: (_ for _ in ()).throw(AssertionError("re-verified")))
+    again = patch_compose.compose_iteration(repo, patches, ["patch_2_0.diff"], 2, verify_cmds=cmds)
+    assert again["verification"]["reused"] == 1 and again["counts"] == {"merged": 1}
+
+    fp, ctx = patch_store.key(patch_apply.Snapshot(repo), PATCH)
+    patch_store.record(fp, ctx, "apply", "conflict")
+    assert patch_store.rejected(fp, ctx) == "apply: conflict"
+    # once calc.py changes, nothing stored for the old content applies
+    (repo / "calc.py").write_text(SOURCE + "\n\nX = 1\n", encoding="utf-8")
+    assert patch_store.key(patch_apply.Snapshot(repo), PATCH)[1] != ctx
+
+    patch_store.flush()
+    patch_store.reset()
+    assert patch_store.rejected(fp, ctx) == "apply: conflict"  # persisted
+
+
+def test_verify_rejections_need_a_regression_and_the_same_commands(tmp_path):
+    (tmp_path / "calc.py").write_text(SOURCE, encoding="utf-8")
+    fp, ctx = patch_store.key(patch_apply.Snapshot(tmp_path), PATCH)
+    cmds_a, cmds_b = patch_store.commands_hash("build a", ""), patch_store.commands_hash("build b", "")
+
+    # a build failure the unpatched baseline shares is not kept at all
+    assert not patch_store.persist_verdict({"verdict": "build_failed", "vs_baseline": "same"})
+    assert patch_store.persist_verdict({"verdict": "build_failed", "vs_baseline": "regressed"})
+
+    patch_store.record(fp, ctx, "verify", "build_failed", vs_baseline="regressed", cmds=cmds_a)
+    assert patch_store.rejected(fp, ctx, cmds_a) == "verify: regressed"
+    assert patch_store.rejected(fp, ctx, cmds_b) is None  # other commands: verify again
+    assert patch_store.rejected(fp, ctx) is None  # verification off: only apply outcomes count
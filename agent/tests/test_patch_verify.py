@@ -0,0 +1,112 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+import patch_compose
+import patch_verify
+
+SOURCE = "def value():\n    return 1\n\n\ndef other():\n    return 2\n"
+TEST = "from calc import value\n\n\ndef test_value():\n    assert value() == 42\n"
+
+
+def _patch(new):
+    return ("--- a/calc.py\n+++ b/calc.py\n@@ -1,2 +1,2 @@\n def value():\n"
+            f"-    return 1\n+{new}\n")
+
+
+def test_candidates_are_verified_in_overlays_and_ranked(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "calc.py").write_text(SOURCE, encoding="utf-8")
+    (repo / "test_calc.py").write_text(TEST, encoding="utf-8")
+    inode = os.stat(repo / "calc.py").st_ino
+    # {tests} narrows the run to test_calc.py, the test named after the changed file
+    test_cmd = f'"{sys.executable}" -c "import sys, calc; sys.exit(calc.value() != 42)" {{tests}}'
+    candidates = [("fixes.diff", _patch("    return 42")), ("breaks.diff", _patch("    return (")),
+                  ("same.diff", _patch("    return 2")), ("stale.diff", _patch("    return 3").replace("return 1", "return 9"))]
+
+    report = patch_verify.verify(repo, candidates, build_cmd=patch_verify.DEFAULT_COMMANDS["py"]["build"],
+                                 test_cmd=test_cmd, workers=2)
+    assert report["baseline"]["verdict"] == "fail"
+    verdicts = {v["patch"]: (v["verdict"], v["vs_baseline"]) for v in report["verdicts"]}
+    assert verdicts == {"fixes.diff": ("pass", "fixed"), "breaks.diff": ("build_failed", "regressed"),
+                        "same.diff": ("fail", "same"), "stale.diff": ("not_applied", None)}
+    # copy-on-write: the workspace file is untouched and still the same inode
+    assert (repo / "calc.py").read_text(encoding="utf-8") == SOURCE and os.stat(repo / "calc.py").st_ino == inode
+
+    # build steps that rewrite non-source files in place (qmake/cmake regenerating a Makefile) stay in the overlay
+    (repo / "Makefile").write_text("all:\n", encoding="utf-8")
+    regen = f'"{sys.executable}" -c "open(\'Makefile\', \'w\').write(\'regenerated\')"'
+    patch_verify.verify(repo, candidates[:1], build_cmd=regen, workers=1)
+    assert (repo / "Makefile").read_text(encoding="utf-8") == "all:\n"
+
+    ranking = patch_verify.rank(report["verdicts"])
+    assert ranking["order"] == ["fixes.diff", "same.diff"]
+    assert ranking["rejected"] == {"breaks.diff": "regressed", "stale.diff": "not_applied"}
+
+
+def test_verdicts_decide_which_overlapping_patch_is_composed(tmp_path):
+    repo, patches = tmp_path / "repo", tmp_path / "patches"
+    repo.mkdir()
+    patches.mkdir()
+    (repo / "calc.py").write_text(SOURCE, encoding="utf-8")
+    (patches / "patch_1_0.diff").write_text(_patch("    return 7"), encoding="utf-8")
+    (patches / "patch_1_1.diff").write_text(_patch("    return 42"), encoding="utf-8")
+    cmds = {"build": "", "test": f'"{sys.executable}" -c "import sys, calc; sys.exit(calc.value() != 42)"'}
+
+    summary = patch_compose.compose_iteration(repo, patches, ["patch_1_0.diff", "patch_1_1.diff"], 1, verify_cmds=cmds)
+    decisions = {d["patch"]: d["decision"] for d in summary["decisions"]}
+    # without verification the lower snippet index would win the overlap
+    assert decisions == {"patch_1_1.diff": "merged", "patch_1_0.diff": "queued"}
+    assert summary["verification"]["baseline"] == "fail"
+
+
+def test_build_failure_shared_with_the_baseline_is_not_a_rejection(tmp_path):
+    repo, patches = tmp_path / "repo", tmp_path / "patches"
+    repo.mkdir()
+    patches.mkdir()
+    (repo / "calc.py").write_text(SOURCE, encoding="utf-8")
+    (repo / "broken.py").write_text("def broken(:\n", encoding="utf-8")  # unrelated syntax error
+    (patches / "patch_1_0.diff").write_text(_patch("    return 42"), encoding="utf-8")
+    test_cmd = f'"{sys.executable}" -c "import sys, calc; sys.exit(calc.value() != 42)"'
+    candidates = [("patch_1_0.diff", _patch("    return 42"))]
+
+    # the default build only compiles the files the candidates touch
+    report = patch_verify.verify(repo, candidates, patch_verify.DEFAULT_COMMANDS["py"]["build"], test_cmd, workers=1)
+    assert report["baseline"]["verdict"] == "fail"
+    assert [(v["verdict"], v["vs_baseline"]) for v in report["verdicts"]] == [("pass", "fixed")]
+
+    # a whole-tree build fails with and without the patch: ranked as "same", not rejected
+    whole_tree = f'"{sys.executable}" -m compileall -q .'
+    report = patch_verify.verify(repo, candidates, whole_tree, test_cmd, workers=1)
+    assert report["baseline"]["verdict"] == "build_failed"
+    assert [(v["verdict"], v["vs_baseline"]) for v in report["verdicts"]] == [("build_failed", "same")]
+    assert patch_verify.rank(report["verdicts"]) == {"order": ["patch_1_0.diff"], "rejected": {}}
+    summary = patch_compose.compose_iteration(repo, patches, ["patch_1_0.diff"], 1,
+                                              verify_cmds={"build": whole_tree, "test": test_cmd})
+    assert summary["counts"] == {"merged": 1}
+
+
+@pytest.mark.skipif(not (shutil.which("g++") or shutil.which("clang++")), reason="no C++ compiler")
+def test_cpp_default_build_checks_the_touched_files(tmp_path):
+    (tmp_path / "calc.cpp").write_text("int value() {\n    return 1;\n}\n", encoding="utf-8")
+    patch = "--- a/calc.cpp\n+++ b/calc.cpp\n@@ -1,2 +1,2 @@\n int value() {\n-    return 1;\n+    return {new};\n"
+    cmds = patch_verify.commands("cpp")
+    assert "-fsyntax-only" in cmds["build"]
+    report = patch_verify.verify(tmp_path, [("ok.diff", patch.replace("{new}", "42")),
+                                            ("broken.diff", patch.replace("{new}", "42 +"))],
+                                 cmds["build"], cmds["test"], workers=1)
+    assert [(v["verdict"], v["vs_baseline"]) for v in report["verdicts"]] == [("pass", "same"),
+                                                                               ("build_failed", "regressed")]
+
+
+def test_verification_without_commands_is_reported_as_skipped(tmp_path):
+    repo, patches = tmp_path / "repo", tmp_path / "patches"
+    repo.mkdir()
+    patches.mkdir()
+    (repo / "calc.py").write_text(SOURCE, encoding="utf-8")
+    (patches / "patch_1_0.diff").write_text(_patch("    return 42"), encoding="utf-8")
+    summary = patch_compose.compose_iteration(repo, patches, ["patch_1_0.diff"], 1, verify_cmds={"build": "", "test": ""})
+    assert summary["verification"] == {"skipped": "no build or test command"} and summary["counts"] == {"merged": 1}
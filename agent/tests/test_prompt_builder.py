@@ -0,0 +1,24 @@
+import prompt_builder as pb
+
+
+def test_fit_prompt_trims_low_priority_sections_first():
+    template = "Report:\n{analysis}\nCode:\n{code_snippet}\nRules."
+    analysis = "\n".join(f"a.cpp:{i}: warning: finding {i}" for i in range(400))
+    snippet = "int main() {\n  return 0;\n}"
+    prompt, info = pb.fit_prompt(template, {"analysis": analysis, "code_snippet": snippet},
+                                 provider="HuggingFace_Router", budget=300,
+                                 shrink_order=["analysis", "code_snippet"])
+    assert info["trimmed"] == ["analysis"]
+    assert info["tokens"] <= 300
+    assert snippet in prompt and "finding 0" in prompt and "finding 399" not in prompt
+
+
+def test_truncate_keeps_tail_and_budget_env_override(monkeypatch):
+    log = "\n".join(f"line {i}" for i in range(1000))
+    cut = pb.truncate_to_tokens(log, 50, keep="tail")
+    assert cut.endswith("line 999") and "line 0\n" not in cut
+    assert pb.count_tokens(cut) <= 50
+
+    monkeypatch.setenv("PROMPT_BUDGET_OLLAMA", "1234")
+    assert pb.budget_for("Ollama") == 1234
+    assert pb.budget_for_any(["Ollama", "Transformers"]) == pb.budget_for("Transformers")
@@ -0,0 +1,33 @@
+import threading
+
+import rate_limiter
+
+
+def test_buckets_cap_rpm_and_serve_workspaces_round_robin(monkeypatch):
+    lim = rate_limiter.ProviderLimiter("R", rpm=600, tpm=0)  # 10 requests/s, burst of 600
+    lim.buckets[0][1].level = 0  # start empty: every grant has to wait for a refill
+    order = []
+
+    def worker(ws, n):
+        for _ in range(n):
+            lim.acquire(1, ws)
+            order.append(ws)
+
+    threads = [threading.Thread(target=worker, args=(ws, 4)) for ws in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(order) == ["a"] * 4 + ["b"] * 4
+    # while both workspaces are waiting neither gets served twice in a row more than once
+    assert "aaa" not in "".join(order) and "bbb" not in "".join(order)
+    assert lim.stats["granted"] == 8 and lim.stats["max_wait_s"] > 0
+
+
+def test_tpm_shared_through_sqlite(tmp_path):
+    db = str(tmp_path / "rl.sqlite3")
+    first = rate_limiter.SQLiteTokenBucket(db, "R:tpm", 1000)
+    second = rate_limiter.SQLiteTokenBucket(db, "R:tpm", 1000)  # e.g. another process
+    assert first.try_take(800) == 0
+    assert second.peek(800) > 0 and second.try_take(800) > 0
@@ -0,0 +1,73 @@
+import json
+import re
+import threading
+
+import llm_cache
+import reasoning_module as rm
+
+REPORT = """== TEST EXECUTION ==
+[+] test_ok ... PASS
+[-] test_a ... FAIL
+ Traceback (most recent call last):
+ ZeroDivisionError: division by zero at 0x7f00aa
+[-] test_b ... FAIL
+ Traceback (most recent call last):
+ ZeroDivisionError: division by zero at 0x7f00bb
+[-] test_c ... FAIL
+ KeyError: 'name'
+== SUMMARY ==
+"""
+
+
+class _FakeClient:
+    model_name = "fake"
+    temperature = 0.2
+
+    def __init__(self):
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def invoke(self, messages):
+        prompt = messages[0].content
+        with self.lock:
+            self.prompts.append(prompt)
+        n = len(re.findall(r"^### Failure \d+", prompt, flags=re.MULTILINE))
+        if n:
+            text = "\n".join(f"### Failure {k}\nfix {k}" for k in range(1, n + 1))
+        else:
+            text = "fix single"
+        return type("R", (), {"content": text})()
+
+
+def _run(tmp_path, monkeypatch, batch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    client = _FakeClient()
+    monkeypatch.setattr(rm, "llm_client", client)
+    report = tmp_path / "dynamic_analysis_report.txt"
+    report.write_text(REPORT, encoding="utf-8")
+    result = rm.run_reasoning_on_report(report, concurrency=3, batch=batch)
+    return client, result, json.loads((tmp_path / "reasoning_suggestions.json").read_text(encoding="utf-8"))
+
+
+def test_identical_failures_are_analysed_once(tmp_path, monkeypatch):
+    client, result, saved = _run(tmp_path, monkeypatch, batch=False)
+    assert result["failures"] == 3 and result["unique_failures"] == 2
+    assert len(client.prompts) == 2
+    assert saved["suggestions"][0]["tests"] == ["test_a", "test_b"] and saved["suggestions"][0]["fan_in"] == 2
+    assert all(s["suggestion"] == "fix single" for s in saved["suggestions"])
+
+
+def test_short_failures_share_one_batched_request(tmp_path, monkeypatch):
+    client, result, saved = _run(tmp_path, monkeypatch, batch=True)
+    assert len(client.prompts) == 1 and result["requests"] == 1
+    assert [s["suggestion"] for s in saved["suggestions"]] == ["fix 1", "fix 2"]
+    assert all(s["batched"] for s in saved["suggestions"])
+
+
+def test_use_cache_false_regenerates_suggestions(tmp_path, monkeypatch):
+    client, _, _ = _run(tmp_path, monkeypatch, batch=False)
+    report = tmp_path / "dynamic_analysis_report.txt"
+    rm.run_reasoning_on_report(report, concurrency=3, batch=False)
+    assert len(client.prompts) == 2
+    rm.run_reasoning_on_report(report, concurrency=3, batch=False, use_cache=False)
+    assert len(client.prompts) == 4
@@ -0,0 +1,22 @@
+from report_index import IssueIndex
+
+REPORT = """Checking proj\\a.cpp ...
+proj\\a.cpp:3: style: unusedVariable: Unused variable: x
+proj\\a.cpp:12: error: nullPointer: Null pointer dereference: p
+proj\\a.cpp:90: warning: uninitvar: Uninitialized variable: y
+proj\\b.cpp:7: performance: passedByValue: Function parameter 's' should be passed by const reference.
+"""
+
+
+def test_context_only_carries_nearby_findings():
+    index = IssueIndex(REPORT)
+    assert index.total == 4
+    ctx = index.context_for_snippet("proj\\a.cpp:10 ---\n    *p = 1;\n")
+    assert "nullPointer" in ctx
+    assert "unusedVariable" not in ctx and "uninitvar" not in ctx and "passedByValue" not in ctx
+    assert "Global summary: 4 findings" in ctx
+
+
+def test_falls_back_to_nearest_findings_in_same_file():
+    ctx = IssueIndex(REPORT).context_for_snippet("C:\\src\\proj\\b.cpp:40 ---\ncode\n")
+    assert "passedByValue" in ctx
@@ -0,0 +1,28 @@
+import threading
+
+import response_journal
+
+
+def test_entries_are_indexed_by_workspace_and_snippet(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_journal, "ROTATE_BYTES", 200)  # force rotations
+    import rate_limiter
+    with rate_limiter.workspace("ws1"), response_journal.context(snippet=3):
+        for n in range(20):
+            response_journal.record("response", f"diff --git a/x b/x {n}" * 10, provider="HuggingFace_Router")
+            response_journal.flush()
+
+    def other():
+        with rate_limiter.workspace("ws2"):
+            response_journal.bind(response_journal.record)("raw_resp", "NO_PATCH")
+
+    with response_journal.context(snippet=7):
+        t = threading.Thread(target=response_journal.bind(other))
+        t.start()
+        t.join()
+
+    ws1 = response_journal.find(workspace="ws1", snippet=3)
+    assert len(ws1) == 20 and ws1[0]["provider"] == "HuggingFace_Router"
+    assert sorted(e["content"].split()[-1] for e in ws1) == sorted(str(n) for n in range(20))
+    assert [e["content"] for e in response_journal.find(workspace="ws2", snippet=7)] == ["NO_PATCH"]
+    segments = list((tmp_path / "journal").glob("responses-*.jsonl.gz"))
+    assert len(segments) > 1 and response_journal.stats()["rotations"] >= 1
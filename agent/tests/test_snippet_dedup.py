@@ -0,0 +1,46 @@
+import snippet_dedup
+
+SOURCE = [f"line {n}" for n in range(1, 61)]
+
+
+def _snippet(path, line):
+    start, end = snippet_dedup.window(line)
+    body = "\n".join(SOURCE[start - 1:end])
+    return f"{path}:{line} ---\n{body}\n\n\n"
+
+
+def test_overlapping_windows_merge_and_duplicates_fold():
+    jobs = [
+        (1, _snippet("src\\a.cpp", 10)),
+        (2, _snippet("src/a.cpp", 14)),   # overlaps 1 (same file, other separator)
+        (3, _snippet("src/a.cpp", 14)),   # exact duplicate of 2
+        (4, _snippet("src/a.cpp", 50)),   # far away: own region
+        (5, _snippet("src/b.cpp", 10)),   # same text, other file: not merged
+    ]
+    out, fan_in = snippet_dedup.dedupe(jobs)
+    assert [i for i, _ in out] == [1, 4, 5]
+    assert fan_in[1] == {"members": [1, 2, 3], "lines": [10, 14], "duplicates": [3]}
+    merged = out[0][1]
+    assert merged.splitlines()[0] == "src\\a.cpp:10 (lines 6-19; findings at 10, 14) ---"
+    assert merged.splitlines()[1:] == SOURCE[5:19]
+    assert snippet_dedup.reported_lines(merged) == [10, 14]
+    assert snippet_dedup.span(merged) == (6, 19)
+    assert out[1][1] == jobs[3][1] and snippet_dedup.span(out[1][1]) == (46, 55)
+
+
+def test_conflicting_overlap_and_size_cap_keep_regions_apart(monkeypatch):
+    changed = _snippet("a.cpp", 14).replace("line 12", "line twelve")
+    out, _ = snippet_dedup.dedupe([(1, _snippet("a.cpp", 10)), (2, changed)])
+    assert len(out) == 2
+    monkeypatch.setattr(snippet_dedup, "MERGE_MAX_LINES", 12)
+    out, _ = snippet_dedup.dedupe([(1, _snippet("a.cpp", 10)), (2, _snippet("a.cpp", 14))])
+    assert len(out) == 2
+
+
+def test_same_text_at_another_line_keeps_its_finding():
+    body = "\n".join(SOURCE[:10])
+    jobs = [(1, f"a.cpp:10 ---\n{body}\n"), (2, f"a.cpp:40 ---\n{body}\n"), (3, f"a.cpp:10 ---\n{body}\n")]
+    out, fan_in = snippet_dedup.dedupe(jobs)
+    assert [i for i, _ in out] == [1, 2]
+    assert fan_in[1]["duplicates"] == [3]
+    assert fan_in[2] == {"members": [2], "lines": [40], "duplicates": []}